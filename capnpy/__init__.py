@@ -2,6 +2,11 @@ import sys
 from capnpy.compiler.compiler import DynamicCompiler
 from capnpy.compiler.distutils import capnpify
 from capnpy.message import load, loads, load_all, dumps, dump
+from capnpy.message import dumps_into, dump_all, MessageWriter
+from capnpy.message import (load_packed, loads_packed, load_all_packed,
+                            dumps_packed, dump_packed)
+from capnpy.message import load_mmap, iter_mmap
+from capnpy.message import validate
 
 _compiler = DynamicCompiler(sys.path)
 load_schema = _compiler.load_schema
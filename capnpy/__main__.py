@@ -1,6 +1,7 @@
 """
 Usage: capnpy compile FILE [options]
        capnpy decode FILE SCHEMA CLASS [options]
+       capnpy index FILE
 
 Options:
   --no-convert-case    Don't convert camelCase to camel_case
@@ -13,6 +14,7 @@ import time
 import docopt
 from capnpy import load_schema
 from capnpy.message import load
+from capnpy.index import build_index, sidecar_path
 from capnpy.compiler.compiler import StandaloneCompiler
 
 
@@ -40,6 +42,15 @@ def decode(args):
     c = time.time()
     print >> sys.stderr, 'stream decoded in %.2f secs' % (c-b)
 
+def index(args):
+    a = time.time()
+    idx = build_index(args['FILE'])
+    idxpath = sidecar_path(args['FILE'])
+    idx.write(idxpath)
+    b = time.time()
+    print >> sys.stderr, '%d messages indexed in %.2f secs, index written to %s' % (
+        len(idx), b-a, idxpath)
+
 def compile(args):
     srcfile = args['FILE']
     comp = StandaloneCompiler(sys.path)
@@ -57,6 +68,8 @@ def main(argv=None):
         compile(args)
     elif args['decode']:
         decode(args)
+    elif args['index']:
+        index(args)
 
 if __name__ == '__main__':
     main()
@@ -1,4 +1,6 @@
 cpdef long inthash(long v)
 cpdef long longhash(unsigned long v)
+cpdef long floathash(double v)
 cdef long tuplehash(long hashes[], long len)
-cpdef long strhash(bytes a, long start, long size)
+cpdef long strhash(object a, long start, long size)
+cpdef long primitivelisthash(object buf, long start, long count, char ifmt) except? -1
@@ -1,10 +1,17 @@
+import struct
+from capnpy.unpack import unpack_bytes
+
 inthash = hash
 longhash = hash
+floathash = hash
 __tuplehash_for_tests = hash
 
 def strhash(s, start, size):
-    return hash(s[start:start+size])
-
-
-
+    return hash(unpack_bytes(s, start, start+size))
 
+def primitivelisthash(buf, start, count, ifmt):
+    fmt = '<%d%s' % (max(count, 0), chr(ifmt))
+    end = start + struct.calcsize(fmt)
+    if start < 0 or count < 0 or end > len(buf):
+        raise IndexError('Offset out of bounds: %d' % end)
+    return hash(struct.unpack_from(fmt, buf, start))
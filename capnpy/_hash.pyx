@@ -9,6 +9,11 @@ cdef extern from "Python.h":
         long prefix
         long suffix
     _Py_HashSecret_t _Py_HashSecret
+    long _Py_HashDouble(double v)
+
+from libc.stdint cimport (int8_t, uint8_t, int16_t, uint16_t,
+                          uint32_t, int32_t, int64_t, uint64_t)
+from capnpy.unpack cimport as_cbuf
 
 
 cpdef long inthash(long v):
@@ -19,18 +24,21 @@ cpdef long inthash(long v):
 cpdef long longhash(unsigned long v):
     return inthash(<long>v)
 
+cpdef long floathash(double v):
+    return _Py_HashDouble(v)
+
 
 # string hashing algorithm. Copied from CPython's 2.7 stringobject.c. Note
 # that in Python 3 the hash function is different.
 # The invariant is: strhash(s, i, n) == hash(s[i:i+n]) (assuming size>=0)
-cpdef long strhash(bytes a, long start, long size):
-    cdef long maxlen = len(a)
+cpdef long strhash(object a, long start, long size):
+    cdef Py_ssize_t maxlen = 0
+    cdef const unsigned char* p = <const unsigned char*>as_cbuf(a, &maxlen)
     if start > maxlen or size == 0:
         return 0
-    if size > maxlen:
+    if start+size > maxlen:
         size = maxlen-start
     #
-    cdef const unsigned char* p = a
     cdef long n = size
     cdef long x
     #
@@ -74,6 +82,69 @@ cdef long tuplehash(long hashes[], long len):
     return x
 
 
+# hash of a list of primitives, as if it were a tuple: the invariant is
+# primitivelisthash(buf, start, count, ifmt) == hash(tuple(items)), where
+# items are the count primitives of type ifmt stored at buf[start:]
+cdef inline long itemsize(char ifmt) except -1:
+    if ifmt == 'b' or ifmt == 'B':
+        return 1
+    elif ifmt == 'h' or ifmt == 'H':
+        return 2
+    elif ifmt == 'i' or ifmt == 'I' or ifmt == 'f':
+        return 4
+    elif ifmt == 'q' or ifmt == 'Q' or ifmt == 'd':
+        return 8
+    raise ValueError('Unknown fmt: %s' % chr(ifmt))
+
+cdef inline long itemhash(char ifmt, const char* p):
+    if ifmt == 'b':
+        return inthash((<int8_t*>p)[0])
+    elif ifmt == 'B':
+        return inthash((<uint8_t*>p)[0])
+    elif ifmt == 'h':
+        return inthash((<int16_t*>p)[0])
+    elif ifmt == 'H':
+        return inthash((<uint16_t*>p)[0])
+    elif ifmt == 'i':
+        return inthash((<int32_t*>p)[0])
+    elif ifmt == 'I':
+        return inthash((<uint32_t*>p)[0])
+    elif ifmt == 'q':
+        return inthash((<int64_t*>p)[0])
+    elif ifmt == 'Q':
+        return longhash((<uint64_t*>p)[0])
+    elif ifmt == 'f':
+        return floathash((<float*>p)[0])
+    else: # 'd'
+        return floathash((<double*>p)[0])
+
+cpdef long primitivelisthash(object buf, long start, long count, char ifmt) except? -1:
+    cdef Py_ssize_t length = 0
+    cdef const char* p = as_cbuf(buf, &length)
+    cdef long size = itemsize(ifmt)
+    if start < 0 or count < 0 or start + size*count > length:
+        raise IndexError('Offset out of bounds: %d' % (start + size*count))
+    p += start
+    # same algorithm as tuplehash below
+    cdef long mult = 1000003
+    cdef long x = 0x345678
+    cdef long y
+    while True:
+        count -= 1
+        if count < 0:
+            break
+        y = itemhash(ifmt, p)
+        p += size
+        #
+        x = (x ^ y) * mult
+        mult += <long>(82520 + count + count)
+    #
+    x += 97531
+    if x == -1:
+        x = -2
+    return x
+
+
 # Python interface, used by tests
 from cpython cimport array
 import array
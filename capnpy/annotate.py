@@ -1,6 +1,6 @@
 # THIS FILE HAS BEEN GENERATED AUTOMATICALLY BY capnpy
 # do not edit by hand
-# generated on 2017-01-02 16:43
+# generated on 2026-10-18 06:55
 
 from capnpy.ptr import E_IS_FAR_POINTER as _E_IS_FAR_POINTER
 from capnpy.struct_ import Struct as _Struct
@@ -10,7 +10,13 @@ from capnpy.enum import enum as _enum
 from capnpy.blob import Types as _Types
 from capnpy.builder import Builder as _Builder
 from capnpy.list import List as _List
+from capnpy.list import PrimitiveItemType as _PrimitiveItemType
+from capnpy.list import BoolItemType as _BoolItemType
+from capnpy.list import TextItemType as _TextItemType
 from capnpy.list import StructItemType as _StructItemType
+from capnpy.list import EnumItemType as _EnumItemType
+from capnpy.list import VoidItemType as _VoidItemType
+from capnpy.list import ListItemType as _ListItemType
 from capnpy.util import text_repr as _text_repr
 from capnpy.util import float32_repr as _float32_repr
 from capnpy.util import float64_repr as _float64_repr
@@ -18,13 +24,13 @@ from capnpy.util import extend_module_maybe as _extend_module_maybe
 
 #### FORWARD DECLARATIONS ####
 
-class nullable(object):
-    __id__ = 11296117080722892765
+class key(object):
+    __id__ = 14658097673689429382
     targets_file = False
     targets_const = False
     targets_enum = False
     targets_enumerant = False
-    targets_struct = False
+    targets_struct = True
     targets_field = False
     targets_union = False
     targets_group = True
@@ -32,13 +38,27 @@ class nullable(object):
     targets_method = False
     targets_param = False
     targets_annotation = False
-class key(object):
-    __id__ = 14658097673689429382
+class cached(object):
+    __id__ = 9569406907557542466
     targets_file = False
     targets_const = False
     targets_enum = False
     targets_enumerant = False
     targets_struct = True
+    targets_field = True
+    targets_union = False
+    targets_group = False
+    targets_interface = False
+    targets_method = False
+    targets_param = False
+    targets_annotation = False
+class nullable(object):
+    __id__ = 11296117080722892765
+    targets_file = False
+    targets_const = False
+    targets_enum = False
+    targets_enumerant = False
+    targets_struct = False
     targets_field = False
     targets_union = False
     targets_group = True
@@ -0,0 +1,157 @@
+"""
+Bulk access to the items of lists, as numpy arrays.
+
+numpy is an optional dependency: if it is not installed, the functions
+return an array.array instead. numpy arrays are views on the underlying
+buffer, without any copy: they are writable if the buffer is writable, e.g.
+a bytearray. array.array always contains a copy of the items.
+"""
+
+import sys
+import array
+import struct
+
+def get_numpy():
+    """
+    Return the numpy module, or None if it is not installed. numpy is
+    imported lazily, so that the users who do not need it don't pay the
+    import time.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+# the typecodes of array.array which correspond to the struct formats, for
+# the cases in which they differ
+_ARRAY_TYPECODES = {'q': 'l', 'Q': 'L', '?': 'B'}
+
+# the unsigned formats of each size, used to XOR the default values
+_INT_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+def _new_array(fmt, items=()):
+    typecode = _ARRAY_TYPECODES.get(fmt, fmt)
+    result = array.array(typecode, items)
+    if result.itemsize != struct.calcsize(fmt):
+        raise TypeError("array.array does not support the format '%s' on "
+                        "this platform: please install numpy" % fmt)
+    return result
+
+def primitive_array(buf, offset, count, fmt):
+    """
+    Return an array containing the ``count`` little-endian primitive values
+    of format ``fmt`` (as in the struct module) which are at ``offset`` in
+    ``buf``.
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        return numpy.frombuffer(buf, numpy.dtype('<' + fmt), count, offset)
+    result = _new_array(fmt)
+    end = offset + count*result.itemsize
+    result.fromstring(str(buf[offset:end]))
+    if sys.byteorder == 'big':
+        result.byteswap()
+    return result
+
+def bool_array(buf, offset, count):
+    """
+    Return an array containing the ``count`` bools which are packed as bits
+    at ``offset`` in ``buf``. This is always a copy: with numpy, it is an
+    array of dtype bool, else an array.array of 0s and 1s.
+    """
+    nbytes = (count + 7) // 8
+    numpy = get_numpy()
+    if numpy is not None:
+        data = numpy.frombuffer(buf, numpy.uint8, nbytes, offset)
+        # unpackbits returns the most significant bit first, but capnproto
+        # stores the first item in the least significant one
+        bits = numpy.unpackbits(data).reshape(-1, 8)[:, ::-1]
+        return bits.ravel()[:count].astype(bool)
+    data = bytearray(buf[offset:offset+nbytes])
+    return array.array('B', [(data[i >> 3] >> (i & 7)) & 1
+                             for i in xrange(count)])
+
+def strided_array(buf, offset, count, stride, fmt, default=0):
+    """
+    Like primitive_array, but the values are ``stride`` bytes apart, e.g. a
+    field of each item of a list of structs. If default is not 0, the values
+    are XORed with it, as capnproto does for fields with explicit defaults:
+    in this case, the result is a copy.
+    """
+    numpy = get_numpy()
+    if default:
+        # XOR the bits of the values with the bits of the default
+        intfmt = _INT_FORMATS[struct.calcsize(fmt)]
+        bits = struct.unpack('<' + intfmt, struct.pack('<' + fmt, default))[0]
+        raw = strided_array(buf, offset, count, stride, intfmt)
+        if numpy is not None:
+            raw = raw ^ raw.dtype.type(bits)
+            return raw.view(numpy.dtype('<' + fmt))
+        raw = _new_array(intfmt, [x ^ bits for x in raw])
+        result = _new_array(fmt)
+        result.fromstring(raw.tostring())
+        return result
+    if numpy is not None:
+        return numpy.ndarray((count,), numpy.dtype('<' + fmt), buf, offset,
+                             (stride,))
+    fmt = '<' + fmt
+    return _new_array(fmt[1:], [struct.unpack_from(fmt, buf, offset+i*stride)[0]
+                                for i in xrange(count)])
+
+def strided_bool_array(buf, offset, count, stride, bitoffset, default=False):
+    """
+    Like strided_array, for the bools stored in the bit ``bitoffset`` of the
+    byte at ``offset``. The result is always a copy.
+    """
+    numpy = get_numpy()
+    data = strided_array(buf, offset, count, stride, 'B')
+    default = int(bool(default))
+    if numpy is not None:
+        return ((data >> bitoffset) & 1 ^ default).astype(bool)
+    return array.array('B', [(x >> bitoffset) & 1 ^ default for x in data])
+
+def filled_array(count, fmt, value):
+    """
+    Return an array of ``count`` items, all equal to value
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        return numpy.full(count, value, numpy.dtype('<' + fmt))
+    return _new_array(fmt, [value] * count)
+
+_dtypes = {} # cache for struct_dtype
+
+def struct_dtype(structcls):
+    """
+    Return the numpy structured dtype which describes the data section of
+    structcls: it contains all the primitive and enum fields, at the same
+    offsets. Bools are not included, because numpy cannot represent single
+    bits: use List.column() to read them.
+    """
+    try:
+        return _dtypes[structcls]
+    except KeyError:
+        pass
+    numpy = get_numpy()
+    if numpy is None:
+        raise ValueError("numpy is not available: please install it")
+    layout = getattr(structcls, '__data_layout__', None)
+    if layout is None:
+        raise TypeError("%s does not have a data layout" % structcls.__name__)
+    items = sorted(layout.items(), key=lambda item: item[1][1])
+    names = []
+    formats = []
+    offsets = []
+    for name, (fmt, offset, default) in items:
+        if fmt == '?':
+            continue
+        names.append(name)
+        formats.append('<' + fmt)
+        offsets.append(offset)
+    dtype = numpy.dtype({'names': names,
+                         'formats': formats,
+                         'offsets': offsets,
+                         'itemsize': structcls.__static_data_size__ * 8})
+    _dtypes[structcls] = dtype
+    return dtype
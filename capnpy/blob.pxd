@@ -1,6 +1,9 @@
 import cython
 from capnpy.type cimport BuiltinType
-from capnpy.unpack cimport unpack_primitive, unpack_int64, unpack_int16
+from capnpy.unpack cimport (unpack_primitive, unpack_int64, unpack_int16,
+                            unpack_bytes, unpack_primitive_unchecked,
+                            pack_primitive,
+                            unpack_int64_unchecked, unpack_int16_unchecked)
 from capnpy cimport ptr
 from capnpy cimport _hash
 
@@ -8,8 +11,12 @@ cdef enum:
     E_IS_FAR_POINTER = -1
 
 cdef class CapnpBuffer:
-    cdef readonly bytes s
+    cdef readonly object s
+    cdef public bint trusted
+    cpdef bytes read_slice(self, long start, long end)
+    cpdef object read_view(self, long start, long end)
     cpdef read_primitive(self, long offset, char ifmt)
+    cpdef write_primitive(self, long offset, char ifmt, object value)
     cpdef long read_int16(self, long offset)
     cpdef long read_raw_ptr(self, long offset)
     cpdef long read_ptr(self, long offset)
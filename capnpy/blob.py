@@ -11,7 +11,10 @@ from capnpy.util import extend
 from capnpy import ptr
 from capnpy.type import Types
 from capnpy.printer import BufferPrinter, print_buffer
-from capnpy.unpack import unpack_primitive, unpack_int64, unpack_int16
+from capnpy.unpack import (unpack_primitive, unpack_int64, unpack_int16,
+                           unpack_bytes, unpack_primitive_unchecked,
+                           pack_primitive,
+                           unpack_int64_unchecked, unpack_int16_unchecked)
 from capnpy import _hash
 
 try:
@@ -27,24 +30,68 @@ if not IS_PYPY and not PYX:
 class CapnpBuffer(object):
     """
     Represent a capnproto buffer for a single-segment message. Far pointers are
-    not allowed here
+    not allowed here.
+
+    ``s`` can be any object which supports the buffer protocol: in particular,
+    it can be a mmap or a memoryview, so that the message is read directly
+    from there without copying it.
+
+    If ``trusted`` is True, the reads do not check that the offsets are
+    inside the buffer: this is safe only if all the pointers of the message
+    have been validated, see capnpy.message.validate().
     """
 
     def __init__(self, s):
         assert s is not None
         self.s = s
+        self.trusted = False
 
     def __reduce__(self):
         # pickle support
-        return CapnpBuffer, (self.s,)
+        return CapnpBuffer, (self._reduce_s(),)
+
+    def _reduce_s(self):
+        # mmap and memoryview cannot be pickled: convert them to strings
+        if isinstance(self.s, str):
+            return self.s
+        return self.read_slice(0, len(self.s))
+
+    def read_slice(self, start, end):
+        """
+        Return the bytes between start and end as a string, independently of
+        the type of the underlying buffer
+        """
+        return unpack_bytes(self.s, start, end)
+
+    def read_view(self, start, end):
+        """
+        Return a read-only view of the bytes between start and end, without
+        copying them
+        """
+        if isinstance(self.s, memoryview):
+            return self.s[start:end]
+        return buffer(self.s, start, end-start)
 
     def read_primitive(self, offset, ifmt):
+        if self.trusted:
+            return unpack_primitive_unchecked(ifmt, self.s, offset)
         return unpack_primitive(ifmt, self.s, offset)
 
+    def write_primitive(self, offset, ifmt, value):
+        """
+        Write the value in place: this works only if the underlying buffer is
+        writable, e.g. a bytearray or a writable mmap
+        """
+        pack_primitive(ifmt, self.s, offset, value)
+
     def read_int16(self, offset):
+        if self.trusted:
+            return unpack_int16_unchecked(self.s, offset)
         return unpack_int16(self.s, offset)
 
     def read_raw_ptr(self, offset):
+        if self.trusted:
+            return unpack_int64_unchecked(self.s, offset)
         return unpack_int64(self.s, offset)
 
     def read_ptr(self, offset):
@@ -82,7 +129,7 @@ class CapnpBuffer(object):
         assert ptr.list_size_tag(p) == ptr.LIST_SIZE_8
         start = ptr.deref(p, offset)
         end = start + ptr.list_item_count(p) + additional_size
-        return self.s[start:end]
+        return self.read_slice(start, end)
 
     def hash_str(self, p, offset, default_, additional_size):
         if p == 0:
@@ -109,22 +156,38 @@ class CapnpBufferWithSegments(CapnpBuffer):
     def __init__(self, s, segment_offsets):
         assert segment_offsets is not None
         self.s = s
+        self.trusted = False
         self.segment_offsets = segment_offsets
 
     def __reduce__(self):
         # pickle support
-        return CapnpBufferWithSegments, (self.s, self.segment_offsets)
+        return CapnpBufferWithSegments, (self._reduce_s(), self.segment_offsets)
 
     def read_far_ptr(self, offset):
         """
-        Read and return the ptr referenced by this far pointer
+        Read the far pointer at the given offset, and return a tuple (offset2,
+        p2) such that ptr.deref(p2, offset2) is the start of the object it
+        refers to.
         """
         p = self.read_raw_ptr(offset)
-        assert ptr.far_landing_pad(p) == 0
         segment_start = self.segment_offsets[ptr.far_target(p)] # in bytes
         offset  = segment_start + ptr.far_offset(p)*8
-        p = self.read_raw_ptr(offset)
-        return offset, p
+        if ptr.far_landing_pad(p) == 0:
+            # the landing pad is a normal pointer to the object
+            p = self.read_raw_ptr(offset)
+            return offset, p
+        #
+        # double-far pointer: the landing pad is made of two words. The first
+        # is a far pointer to the start of the object, the second is a tag
+        # which describes the object, and whose offset is 0. We return a
+        # "virtual" offset which makes the tag to point to the object.
+        far = self.read_raw_ptr(offset)
+        tag = self.read_raw_ptr(offset+8)
+        assert ptr.kind(far) == ptr.FAR and ptr.far_landing_pad(far) == 0
+        segment_start = self.segment_offsets[ptr.far_target(far)]
+        offset = segment_start + ptr.far_offset(far)*8
+        tag = ptr.new_generic(ptr.kind(tag), 0, ptr.extra(tag))
+        return offset-8, tag
 
 
 class Blob(object):
@@ -144,7 +207,7 @@ class Blob(object):
 
     def _init_blob(self, buf):
         assert buf is not None
-        if isinstance(buf, str):
+        if not isinstance(buf, CapnpBuffer):
             buf = CapnpBuffer(buf)
         self._buf = buf
 
@@ -112,6 +112,7 @@ class Builder(AbstractBuilder):
     def setbool(self, byteoffset, bitoffset, value):
         ifmt = Types.uint8.ifmt
         current = unpack_primitive(ifmt, self._buf, byteoffset)
+        current &= ~(1 << bitoffset)
         current |= (value << bitoffset)
         self.set(ifmt, byteoffset, current)
 
@@ -119,6 +120,91 @@ class Builder(AbstractBuilder):
         return str(self._buf) + ''.join(self._extra)
 
 
+class ReplaceBuilder(Builder):
+    """
+    Builder used by the generated replace(): it starts from buf, the compact
+    buffer of a struct of the given sizes. The data section is patched in
+    place by set() and setbool(). The pointers which are allocated again
+    replace the old objects, the others are copied as they are. Like in any
+    compact struct, the objects are laid out in the order of the pointers.
+    """
+
+    def __init__(self, buf, data_size, ptrs_size):
+        AbstractBuilder.__init__(self, (data_size + ptrs_size) * 8)
+        self._buf = bytearray(buf)
+        self._ptrs_offset = data_size * 8
+        self._ptrs_size = ptrs_size
+        self._new_ptrs = {} # offset --> [p, chunks]
+
+    def _begin_ptr(self, offset):
+        # the new object is allocated into its own list of chunks, which
+        # build() moves to its final position. We pretend that it is
+        # immediately after the ptr, so that the ptr offset is 0
+        self._extra = []
+        self._total_length = offset + 8
+        self._new_ptrs[offset] = [0, self._extra]
+
+    def _record_allocation(self, offset, p):
+        self._new_ptrs[offset][0] = p
+
+    def alloc_struct(self, offset, struct_type, value):
+        self._begin_ptr(offset)
+        return Builder.alloc_struct(self, offset, struct_type, value)
+
+    def alloc_data(self, offset, value, suffix=None):
+        self._begin_ptr(offset)
+        return Builder.alloc_data(self, offset, value, suffix)
+
+    def alloc_list(self, offset, item_type, lst):
+        self._begin_ptr(offset)
+        return Builder.alloc_list(self, offset, item_type, lst)
+
+    def build(self):
+        src = str(self._buf)
+        if not self._new_ptrs:
+            # only the data section changed
+            return src
+        #
+        # find the old objects: each one ends where the next one starts
+        objs = []
+        starts = []
+        for i in range(self._ptrs_size):
+            offset = self._ptrs_offset + i*8
+            p = unpack_primitive(Types.int64.ifmt, src, offset)
+            start = None
+            if p != 0:
+                assert ptr.kind(p) != ptr.FAR
+                start = ptr.deref(p, offset)
+                starts.append(start)
+            if offset in self._new_ptrs:
+                p, chunks = self._new_ptrs[offset]
+                objs.append((offset, p, ''.join(chunks), None))
+            elif p == 0:
+                objs.append((offset, 0, '', None))
+            else:
+                p = ptr.new_generic(ptr.kind(p), 0, ptr.extra(p))
+                objs.append((offset, p, None, start))
+        ends = dict(zip(starts, starts[1:] + [len(src)]))
+        #
+        # lay out the objects one after the other, after the body
+        body = bytearray(src[:self._length])
+        parts = [body]
+        pos = self._length
+        for offset, p, s, start in objs:
+            if p == 0:
+                struct.pack_into('<q', body, offset, 0)
+                continue
+            if s is None:
+                s = src[start:ends[start]]
+            p = ptr.new_generic(ptr.kind(p), ptr.offset(p) + (pos-offset-8)/8,
+                                ptr.extra(p))
+            struct.pack_into('<q', body, offset, p)
+            padding = (8 - len(s) % 8) % 8
+            parts.append(s + '\x00'*padding)
+            pos += len(s) + padding
+        return ''.join(map(str, parts))
+
+
 class ListBuilder(AbstractBuilder):
 
     def __init__(self, item_type, item_count):
@@ -0,0 +1,30 @@
+import cython
+from capnpy.blob cimport CapnpBuffer
+from capnpy.struct_ cimport Struct
+from capnpy cimport ptr
+from capnpy.unpack cimport unpack_uint32
+
+@cython.locals(n=long, p=long, start=long, data_offset=long, data_size=long,
+               ptrs_size=long, obj=Struct, column=Column)
+cpdef _read_message(list columns, CapnpBuffer capnp_buf, long offset, long i)
+
+@cython.locals(column=Column)
+cpdef dict _get_batch(list columns, long n)
+
+cdef class Column:
+    cdef readonly object name
+    cdef readonly object values
+    cdef readonly object fmt
+    cdef readonly object default_
+    cdef readonly int kind
+    cdef readonly long offset
+    cdef readonly long bitmask
+    cdef readonly char ifmt
+    cdef readonly object bits
+    cdef readonly int additional_size
+
+    cpdef new_batch(self, long batch_size)
+
+    @cython.locals(offset=long, p=long)
+    cpdef read(self, CapnpBuffer buf, long data_offset, long data_size,
+               long ptrs_size, long i)
@@ -0,0 +1,180 @@
+"""
+Decode a stream of messages directly into columns, without creating a struct
+for each message.
+
+The values of the requested fields are read directly from the buffers of the
+messages, and stored into preallocated columns: numpy arrays if numpy is
+installed, else array.array. Text and Data fields are stored into plain
+lists.
+"""
+
+import struct
+from capnpy import ptr
+from capnpy import arrays
+from capnpy.struct_ import Struct
+from capnpy.unpack import unpack_uint32
+from capnpy.message import (_iter_frames, _load_message_from_buffer,
+                            DEFAULT_CHUNK_SIZE)
+from capnpy.compression import DecompressedStream
+
+# the kinds of columns
+PRIMITIVE = 0
+FLOAT_DEFAULT = 1 # a float with an explicit default, which needs a XOR
+BOOL = 2
+TEXT = 3
+
+
+def to_columns(f, cls, fields, batch_size=64*1024,
+               chunk_size=DEFAULT_CHUNK_SIZE, compression=None):
+    """
+    Read all the messages of type ``cls`` from f, which can be a file-like
+    object or a path, and yield them in batches of ``batch_size`` messages.
+
+    Each batch is a dict which maps each name in ``fields`` to the column of
+    its values. Only primitive, enum, Text and Data fields which are not
+    part of an union are supported. Unlike load_all, f is always read in
+    chunks of ``chunk_size`` bytes, even if it is a pipe or a socket. See
+    load_all for ``compression``.
+    """
+    if isinstance(f, basestring):
+        with open(f, 'rb') as f2:
+            for batch in to_columns(f2, cls, fields, batch_size, chunk_size,
+                                    compression):
+                yield batch
+        return
+    if compression is not None:
+        f = DecompressedStream(f, compression, chunk_size)
+    columns = [Column(cls, name) for name in fields]
+    for column in columns:
+        column.new_batch(batch_size)
+    i = 0
+    for capnp_buf, offset in _iter_frames(f, chunk_size):
+        _read_message(columns, capnp_buf, offset, i)
+        i += 1
+        if i == batch_size:
+            yield _get_batch(columns, i)
+            for column in columns:
+                column.new_batch(batch_size)
+            i = 0
+    if i:
+        yield _get_batch(columns, i)
+
+def _read_message(columns, capnp_buf, offset, i):
+    n = unpack_uint32(capnp_buf.s, offset) + 1
+    p = ptr.E_IS_FAR_POINTER
+    start = offset + 8
+    if n == 1:
+        p = capnp_buf.read_ptr(start)
+    if p != ptr.E_IS_FAR_POINTER:
+        # fast path: single segment and near root pointer, we read the
+        # fields directly from capnp_buf
+        if p != 0:
+            assert ptr.kind(p) == ptr.STRUCT
+        data_offset = ptr.deref(p, start)
+        data_size = ptr.struct_data_size(p)
+        ptrs_size = ptr.struct_ptrs_size(p)
+    else:
+        # slow path, multiple segments: load the message to resolve the far
+        # pointers
+        msg, end = _load_message_from_buffer(capnp_buf, offset)
+        obj = msg._read_struct(0, Struct)
+        if obj is None:
+            data_offset = data_size = ptrs_size = 0
+        else:
+            capnp_buf = obj._buf
+            data_offset = obj._data_offset
+            data_size = obj._data_size
+            ptrs_size = obj._ptrs_size
+    for column in columns:
+        column.read(capnp_buf, data_offset, data_size, ptrs_size, i)
+
+def _get_batch(columns, n):
+    batch = {}
+    for column in columns:
+        values = column.values
+        if n < len(values):
+            values = values[:n]
+        batch[column.name] = values
+    return batch
+
+
+class Column(object):
+    """
+    The values of the field ``name`` of many structs of type ``structcls``
+    """
+
+    def __init__(self, structcls, name):
+        self.name = name
+        self.values = None
+        data_layout = getattr(structcls, '__data_layout__', {})
+        text_layout = getattr(structcls, '__text_layout__', {})
+        if name in data_layout:
+            fmt, offset, default = data_layout[name]
+            self.fmt = fmt
+            self.default_ = default
+            if fmt == '?':
+                self.kind = BOOL
+                self.offset = offset // 8
+                self.bitmask = 1 << (offset % 8)
+            elif fmt in ('f', 'd') and default:
+                self.kind = FLOAT_DEFAULT
+                self.offset = offset
+                intfmt = arrays._INT_FORMATS[struct.calcsize(fmt)]
+                self.ifmt = ord(intfmt)
+                self.bits = struct.unpack('<' + intfmt,
+                                          struct.pack('<' + fmt, default))[0]
+            else:
+                self.kind = PRIMITIVE
+                self.offset = offset
+                self.ifmt = ord(fmt)
+        elif name in text_layout:
+            self.kind = TEXT
+            self.fmt = None
+            self.default_ = None
+            self.offset, self.additional_size = text_layout[name]
+        else:
+            raise ValueError("Cannot read %s.%s as a column: only primitive, "
+                             "enum, Text and Data fields which are not part "
+                             "of an union are supported"
+                             % (structcls.__name__, name))
+
+    def new_batch(self, batch_size):
+        if self.kind == TEXT:
+            self.values = [None] * batch_size
+            return
+        numpy = arrays.get_numpy()
+        if numpy is not None:
+            self.values = numpy.zeros(batch_size, numpy.dtype('<' + self.fmt))
+        else:
+            self.values = arrays._new_array(self.fmt, [0]) * batch_size
+
+    def read(self, buf, data_offset, data_size, ptrs_size, i):
+        """
+        Read the value from the struct at ``data_offset`` in buf, and store it
+        at index i
+        """
+        if self.kind == TEXT:
+            if self.offset >= ptrs_size*8:
+                value = None
+            else:
+                offset = data_offset + data_size*8 + self.offset
+                p = buf.read_ptr(offset)
+                if p == ptr.E_IS_FAR_POINTER:
+                    offset, p = buf.read_far_ptr(offset)
+                value = buf.read_str(p, offset, None, self.additional_size)
+        elif self.offset >= data_size*8:
+            # reading bytes beyond data_size is equivalent to read 0
+            value = self.default_
+        elif self.kind == PRIMITIVE:
+            value = buf.read_primitive(data_offset+self.offset, self.ifmt)
+            if self.default_:
+                value = value ^ self.default_
+        elif self.kind == BOOL:
+            value = buf.read_primitive(data_offset+self.offset, ord('B'))
+            value = bool(value & self.bitmask) != bool(self.default_)
+        else:
+            bits = buf.read_primitive(data_offset+self.offset, self.ifmt)
+            bits = bits ^ self.bits
+            value = struct.unpack('<' + self.fmt,
+                                  struct.pack('<' + chr(self.ifmt), bits))[0]
+        self.values[i] = value
@@ -10,8 +10,13 @@ class Field:
         ns = m.code.new_scope()
         if self.is_part_of_union():
             ns.ensure_union = 'self._ensure_union(%s)' % self.discriminantValue
+            # setting a member of the union makes it the active one
+            ns.set_union = 'self._write_data(%d, ord("H"), %d)' % (
+                node.struct.discriminantOffset*2, self.discriminantValue)
         else:
             ns.ensure_union = '# no union check'
+            ns.set_union = '# no union tag'
+        ns.cached = self.is_cached(m, node)
         self._emit(m, ns, name)
 
 
@@ -49,6 +54,35 @@ class Field__Slot:
             raise NotImplementedError('Unknown type: %s' %
                                       self.slot.type.runtime_name(m))
 
+    def _def_property(self, m, ns, name, src):
+        """
+        Like m.def_property, but if the field is $Py.cached, the result is
+        computed by _uncached_{name} only at the first access, and stored in
+        a per-instance attribute. None means "not computed yet": null
+        pointers are cheap to read anyway.
+
+        For union members, the tag is checked at every access, not only at
+        the first one: a setter might have activated another member since.
+        """
+        if not ns.cached:
+            m.def_property(ns, name, src)
+            return
+        ns.name = name
+        ns.cachename = '_cached_' + name
+        if m.pyx:
+            ns.w('cdef object {cachename}')
+        else:
+            ns.w('{cachename} = None')
+        with ns.block('{cpdef} _uncached_{name}(self):'):
+            ns.ww(src)
+        ns.w()
+        m.def_property(ns, name, """
+            {ensure_union}
+            if self.{cachename} is None:
+                self.{cachename} = self._uncached_{name}()
+            return self.{cachename}
+        """)
+
     def _emit_void(self, m, ns, name):
         m.def_property(ns, name, """
             {ensure_union}
@@ -65,6 +99,11 @@ class Field__Slot:
             if {default_} != 0:
                 value = value ^ {default_}
             return value
+        """, setter="""
+            if {default_} != 0:
+                value = value ^ {default_}
+            self._write_data({offset}, {ifmt}, value)
+            {set_union}
         """)
 
     def _emit_bool(self, m, ns, name):
@@ -78,6 +117,11 @@ class Field__Slot:
             if {default_} != 0:
                 value = value ^ {default_}
             return value
+        """, setter="""
+            if {default_} != 0:
+                value = value ^ {default_}
+            self._write_bit({offset}, {bitmask}, value)
+            {set_union}
         """)
 
     def _emit_enum(self, m, ns, name):
@@ -89,11 +133,16 @@ class Field__Slot:
             if {default_} != 0:
                 value = {enumcls}(value ^ {default_})
             return value
+        """, setter="""
+            if {default_} != 0:
+                value = value ^ {default_}
+            self._write_data({offset}, ord('h'), value)
+            {set_union}
         """)
 
     def _emit_text(self, m, ns, name):
         ns.name = name
-        m.def_property(ns, name, """
+        self._def_property(m, ns, name, """
             {ensure_union}
             return self._read_str_text({offset})
         """)
@@ -106,7 +155,7 @@ class Field__Slot:
 
     def _emit_data(self, m, ns, name):
         ns.name = name
-        m.def_property(ns, name, """
+        self._def_property(m, ns, name, """
             {ensure_union}
             return self._read_str_data({offset})
         """)
@@ -131,7 +180,7 @@ class Field__Slot:
             ns.cdef_offset = 'offset'
             ns.cdef_p = 'p'
             ns.cdef_obj = 'obj'
-        m.def_property(ns, name, """
+        self._def_property(m, ns, name, """
             {ensure_union}
             {cdef_offset} = {offset}
             {cdef_p} = self._read_fast_ptr(offset)
@@ -159,7 +208,7 @@ class Field__Slot:
         ns.name = name
         t = self.slot.type.list.elementType
         ns.list_item_type = t.list_item_type(m)
-        m.def_property(ns, name, """
+        self._def_property(m, ns, name, """
             {ensure_union}
             return self._read_list({offset}, {list_item_type})
         """)
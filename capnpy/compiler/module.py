@@ -92,13 +92,20 @@ class ModuleGenerator(object):
         decl = "%s = _enum(%r, [%s])" % (var_name, enum_name, ', '.join(items))
         self.w(decl)
 
-    def def_property(self, ns, name, src):
+    def def_property(self, ns, name, src, setter=None):
         if self.pyx:
             with ns.block('property {name}:', name=name):
                 with ns.block('def __get__(self):'):
                     ns.ww(src)
+                if setter:
+                    with ns.block('def __set__(self, value):'):
+                        ns.ww(setter)
         else:
             ns.w('@property')
             with ns.block('def {name}(self):', name=name):
                 ns.ww(src)
+            if setter:
+                ns.w('@{name}.setter', name=name)
+                with ns.block('def {name}(self, value):', name=name):
+                    ns.ww(setter)
         ns.w()
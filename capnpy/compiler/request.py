@@ -50,6 +50,7 @@ class RequestedFile:
         m.w("from capnpy.enum import enum as _enum")
         m.w("from capnpy.blob import Types as _Types")
         m.w("from capnpy.builder import Builder as _Builder")
+        m.w("from capnpy.builder import ReplaceBuilder as _ReplaceBuilder")
         m.w("from capnpy.list {cimport} List as _List")
         m.w("from capnpy.list {cimport} PrimitiveItemType as _PrimitiveItemType")
         m.w("from capnpy.list {cimport} BoolItemType as _BoolItemType")
@@ -62,6 +63,7 @@ class RequestedFile:
         m.w("from capnpy.util import float32_repr as _float32_repr")
         m.w("from capnpy.util import float64_repr as _float64_repr")
         m.w("from capnpy.util import extend_module_maybe as _extend_module_maybe")
+        m.w("from collections import namedtuple as _namedtuple")
         #
         if m.pyx:
             m.w("from capnpy cimport _hash")
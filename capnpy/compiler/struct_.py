@@ -69,8 +69,12 @@ class Node__Struct:
             if self.struct.fields is not None:
                 for field in self.struct.fields:
                     field.emit(m, self)
+                self._emit_reset_cache_maybe(m)
                 self._emit_ctors(m)
             self._emit_repr(m)
+            self._emit_to_tuple(m)
+            self._emit_data_layout(m)
+            self._emit_text_layout(m)
             self._emit_key_maybe(m)
         ns.w()
         ns.w()
@@ -117,6 +121,17 @@ class Node__Struct:
             """)
         ns.w()
 
+    def _emit_reset_cache_maybe(self, m):
+        # clear the attributes of the $Py.cached fields: this is needed by
+        # List.cursor(), which re-points the same object to another item
+        fields = [f for f in self.struct.fields if f.is_cached(m, self)]
+        if not fields:
+            return
+        with m.block('{cpdef} _reset_cache(self):') as ns:
+            for f in fields:
+                ns.w('self._cached_{name} = None', name=m._field_name(f))
+        m.w()
+
     def _emit_ctors(self, m):
         if self.struct.isGroup:
             return
@@ -135,6 +150,8 @@ class Node__Struct:
             ns.w('_buf = {call}', call=call)
             ns.w('_Struct.__init__(self, _buf, 0, {data_size}, {ptrs_size})')
         ns.w()
+        ctor.emit_replace()
+        ns.w()
 
     def _emit_ctors_union(self, m, ns):
         for f in self.struct.fields:
@@ -216,6 +233,119 @@ class Node__Struct:
         else:
             return '"???"'
 
+    def _emit_to_tuple(self, m):
+        # emit to_tuple(), to_dict() and as_namedtuple(). Whenever possible,
+        # the fields are read by calling directly the _read_* methods: in pyx
+        # mode, this avoids the overhead of going through the properties
+        fields = self.struct.fields or []
+        names = [m._field_name(f) for f in fields]
+        exprs = [self._fastread_for_field(m, f) for f in fields]
+        ns = m.code.new_scope()
+        ns.name = self.compile_name(m)
+        ns.fieldnames = ', '.join([repr(name) for name in names])
+        ns.w('__namedtuple__ = _namedtuple({name!r}, [{fieldnames}])')
+        ns.w()
+        with ns.block('{cpdef} to_tuple(self):'):
+            if not fields:
+                ns.w('return ()')
+            else:
+                ns.w('return (')
+                for expr in exprs:
+                    ns.w('    %s,' % expr)
+                ns.w(')')
+        ns.w()
+        with ns.block('{cpdef} to_dict(self):'):
+            ns.w('return {{')
+            for name, expr in zip(names, exprs):
+                ns.w('    %r: %s,' % (name, expr))
+            ns.w('}}')
+        ns.w()
+        ns.ww("""
+            def as_namedtuple(self):
+                return self.__namedtuple__(*self.to_tuple())
+        """)
+        ns.w()
+
+    def _emit_data_layout(self, m):
+        # __data_layout__ describes where the primitive, bool and enum fields
+        # are in the data section: it is used by List.column(). It maps each
+        # field name to (fmt, offset, default); the offset is in bytes,
+        # except for bools, whose fmt is '?' and the offset is in bits.
+        # Union members are not included, as their value is meaningful only
+        # for some of the items
+        ns = m.code.new_scope()
+        ns.w('__data_layout__ = {{')
+        for f in self.struct.fields or []:
+            if not f.is_slot() or f.is_part_of_union():
+                continue
+            t = f.slot.type
+            if t.is_bool():
+                fmt = '?'
+                offset = f.slot.offset
+            elif t.is_primitive() or t.is_enum():
+                fmt = f.slot.get_fmt()
+                offset = f.slot.offset * f.slot.get_size()
+            else:
+                continue
+            default = f.slot.defaultValue.as_pyobj()
+            ns.w('    {name!r}: ({fmt!r}, {offset}, {default!r}),',
+                 name=m._field_name(f), fmt=fmt, offset=offset,
+                 default=default)
+        ns.w('}}')
+        ns.w()
+
+    def _emit_text_layout(self, m):
+        # __text_layout__ describes where the Text and Data fields are: it is
+        # used by capnpy.columnar. It maps each field name to (offset,
+        # additional_size), where offset is the offset of the pointer inside
+        # the pointers section, and additional_size is the same as for
+        # _read_str_data
+        ns = m.code.new_scope()
+        ns.w('__text_layout__ = {{')
+        for f in self.struct.fields or []:
+            if not f.is_slot() or f.is_part_of_union():
+                continue
+            t = f.slot.type
+            if t.is_text():
+                additional_size = -1
+            elif t.is_data():
+                additional_size = 0
+            else:
+                continue
+            ns.w('    {name!r}: ({offset}, {additional_size}),',
+                 name=m._field_name(f), offset=f.slot.offset*8,
+                 additional_size=additional_size)
+        ns.w('}}')
+        ns.w()
+
+    def _fastread_for_field(self, m, f):
+        fname = m._field_name(f)
+        if f.is_part_of_union():
+            return ('(self.%s if self.__which__() == %d else None)' %
+                    (fname, f.discriminantValue))
+        if not f.is_slot() or f.is_cached(m, self):
+            return 'self.%s' % fname
+        t = f.slot.type
+        offset = f.slot.offset * f.slot.get_size()
+        if t.is_void():
+            return 'None'
+        elif t.is_text():
+            return 'self._read_str_text(%d)' % offset
+        elif t.is_data():
+            return 'self._read_str_data(%d)' % offset
+        elif not (t.is_primitive() or t.is_bool() or t.is_enum()):
+            return 'self.%s' % fname
+        elif f.slot.defaultValue.as_pyobj() != 0:
+            # let the property to handle the default value
+            return 'self.%s' % fname
+        elif t.is_primitive():
+            return 'self._read_data(%d, ord(%r))' % (offset, f.slot.get_fmt())
+        elif t.is_bool():
+            byteoffset, bitoffset = divmod(f.slot.offset, 8)
+            return 'self._read_bit(%d, %d)' % (byteoffset, 1 << bitoffset)
+        else:
+            return 'self._read_enum(%d, %s)' % (offset, t.runtime_name(m))
+
     def _emit_key_maybe(self, m):
         ann = m.has_annotation(self, annotate.key)
         if ann is None:
@@ -254,14 +384,8 @@ class Node__Struct:
             ns.w('cdef long h[{n}]')
             # compute the hash of each field
             for ns.i, fname in enumerate(fieldnames):
-                f = fields[fname]
-                ns.fname = m._convert_name(fname)
-                if f.is_text():
-                    ns.offset = f.slot.offset * f.slot.get_size()
-                    ns.w('h[{i}] = self._hash_str_text({offset})')
-                else:
-                    ns.hash = self._fasthash_for_field(f)
-                    ns.w('h[{i}] = {hash}(self.{fname})')
+                ns.hash = self._fasthash_for_field(m, fields[fname])
+                ns.w('h[{i}] = {hash}')
             #
             # compute the hash of the whole tuple
             ns.w('return _hash.tuplehash(h, {n})')
@@ -277,18 +401,51 @@ class Node__Struct:
                 return (<_Struct>self)._richcmp(other, op)
         """)
 
-    def _fasthash_for_field(self, f):
+    def _fasthash_for_field(self, m, f):
+        # return an expression which computes the hash of the field, without
+        # allocating any python object whenever possible
+        fname = m._convert_name(f.name)
         if not f.is_slot():
-            return 'hash'
+            return 'hash(self.%s)' % fname
         t = f.slot.type
         w = t.which()
-        if schema.Type.__tag__.int8 <= w <= schema.Type.__tag__.uint32:
-            # this can be assimilated to a Python <int>
-            return '_hash.inthash'
+        if f.is_text():
+            return 'self._hash_str_text(%d)' % (f.slot.offset * f.slot.get_size())
+        elif f.is_data():
+            return 'self._hash_str_data(%d)' % (f.slot.offset * f.slot.get_size())
+        elif f.is_part_of_union():
+            # go through the property, which checks the union tag
+            return 'hash(self.%s)' % fname
+        elif schema.Type.__tag__.int8 <= w <= schema.Type.__tag__.uint32:
+            # this can be assimilated to a Python <int>: read the raw value
+            # instead of going through the property
+            offset = f.slot.offset * f.slot.get_size()
+            value = 'self._read_data(%d, ord(%r))' % (offset, f.slot.get_fmt())
+            default_ = f.slot.defaultValue.as_pyobj()
+            if default_:
+                value = '(%s ^ %d)' % (value, default_)
+            return '_hash.inthash(%s)' % value
+        elif t.is_bool():
+            # hash(True) == 1 and hash(False) == 0: read the bit, without
+            # creating the bool
+            byteoffset, bitoffset = divmod(f.slot.offset, 8)
+            op = '==' if f.slot.defaultValue.as_pyobj() else '!='
+            return "_hash.inthash((self._read_data(%d, ord('B')) & %d) %s 0)" % (
+                byteoffset, 1 << bitoffset, op)
+        elif t.is_enum():
+            # the hash of an enum is the hash of its value: read it without
+            # creating the enum object
+            offset = f.slot.offset * f.slot.get_size()
+            value = 'self._read_data_int16(%d)' % offset
+            default_ = f.slot.defaultValue.as_pyobj()
+            if default_:
+                value = '(%s ^ %d)' % (value, default_)
+            return '_hash.inthash(%s)' % value
         elif t.is_uint64():
             # this can be assimilated to a Python <long>
-            return '_hash.longhash'
+            return '_hash.longhash(self.%s)' % fname
+        elif t.is_float32() or t.is_float64():
+            return '_hash.floathash(self.%s)' % fname
         else:
-            # no fast hash, use the "slow" one
-            return 'hash'
-
+            # structs and lists define their own fast __hash__
+            return 'hash(self.%s)' % fname
@@ -57,6 +57,40 @@ class Structor(object):
                 self.handle_node(node)
             ns.w('return builder.build()')
 
+    def emit_replace(self):
+        ## generate a method which looks like this
+        ## def replace(self, x=_undefined, y=_undefined, z=_undefined):
+        ##     buf = self._compact_with_layout(3, 0)
+        ##     builder = _ReplaceBuilder(buf, 3, 0)
+        ##     if x is not _undefined:
+        ##         builder.set(ord('q'), 0, x)
+        ##     if y is not _undefined:
+        ##         builder.set(ord('q'), 8, y)
+        ##     if z is not _undefined:
+        ##         builder.alloc_text(16, z)
+        ##     return self.__class__.from_buffer(builder.build(), 0, 3, 0)
+        #
+        # the compact buffer is copied as is and only the given fields are
+        # patched: see ReplaceBuilder
+        code = self.m.code
+        params = [(argname, '_undefined') for argname in self.argnames]
+        with code.def_('replace', ['self'] + params) as ns:
+            ns.data_size = self.data_size
+            ns.ptrs_size = self.ptrs_size
+            ns.w('buf = self._compact_with_layout({data_size}, {ptrs_size})')
+            ns.w('builder = _ReplaceBuilder(buf, {data_size}, {ptrs_size})')
+            for union in self.fieldtree.all_unions():
+                ns.w('{union}__curtag = None', union=union.varname)
+            for node in self.fieldtree.children:
+                if node.f.is_part_of_union():
+                    # handle_node already checks for _undefined
+                    self.handle_node(node)
+                else:
+                    with ns.block('if {arg} is not _undefined:', arg=node.varname):
+                        self.handle_node(node)
+            ns.w('buf = builder.build()')
+            ns.w('return self.__class__.from_buffer(buf, 0, {data_size}, {ptrs_size})')
+
     def handle_node(self, node):
         if node.f.is_part_of_union():
             ns = self.m.code.new_scope()
@@ -0,0 +1,120 @@
+"""
+Compression of whole streams of messages, using the codecs of the stdlib.
+
+A compressed stream is simply the stream of messages (as written by dump()
+and dump_all()) compressed with zlib, bz2 or lzma. The messages are not
+compressed one by one: the compressor sees many messages at once, which
+gives much better ratios for streams of small messages. The result is a
+standard zlib/bz2/xz file. Several compressed streams can be concatenated,
+e.g. by appending to an existing file.
+"""
+
+import zlib
+import bz2
+from capnpy.filelike import FileLike
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+COMPRESSIONS = ('zlib', 'bz2', 'lzma')
+
+def _check(compression):
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression: %r. Supported compressions are: %s"
+                         % (compression, ', '.join(COMPRESSIONS)))
+    if compression == 'lzma' and lzma is None:
+        raise ValueError("lzma compression is not available: "
+                         "please install backports.lzma")
+
+def new_compressor(compression):
+    _check(compression)
+    if compression == 'zlib':
+        return zlib.compressobj()
+    elif compression == 'bz2':
+        return bz2.BZ2Compressor()
+    else:
+        return lzma.LZMACompressor()
+
+def new_decompressor(compression):
+    _check(compression)
+    if compression == 'zlib':
+        return zlib.decompressobj()
+    elif compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    else:
+        return lzma.LZMADecompressor()
+
+
+class DecompressedStream(FileLike):
+    """
+    file-like interface which decompresses on the fly the data read from the
+    underlying file-like object f, in chunks of ``chunk_size`` bytes.
+    """
+
+    def __init__(self, f, compression, chunk_size=64*1024):
+        self.f = f
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.decompressor = new_decompressor(compression)
+        # the decompressed data which has not been returned yet is
+        # self.buf[self.pos:]: we don't slice self.buf after each read(),
+        # because it would copy the whole remainder every time
+        self.buf = ''
+        self.pos = 0
+
+    def read(self, size=-1):
+        available = len(self.buf) - self.pos
+        if 0 <= size <= available:
+            # fast path, no need to decompress
+            data = self.buf[self.pos:self.pos+size]
+            self.pos += size
+            return data
+        parts = [self.buf[self.pos:]]
+        while size < 0 or available < size:
+            n = self._decompress_more(parts)
+            if n < 0:
+                break # EOF
+            available += n
+        data = ''.join(parts)
+        if 0 <= size < len(data):
+            self.buf = data
+            self.pos = size
+            return data[:size]
+        self.buf = ''
+        self.pos = 0
+        return data
+
+    def _decompress_more(self, parts):
+        """
+        Read and decompress a chunk of data, and append it to parts. Return
+        the number of decompressed bytes, or -1 in case of EOF
+        """
+        raw = self.f.read(self.chunk_size)
+        if not raw:
+            return -1
+        n = 0
+        while raw:
+            try:
+                data = self.decompressor.decompress(raw)
+            except EOFError:
+                # bz2 raises EOFError if the previous stream ended exactly at
+                # the end of the previous chunk: raw is a new stream
+                self.decompressor = new_decompressor(self.compression)
+                continue
+            if data:
+                parts.append(data)
+                n += len(data)
+            # if the stream is over, unused_data contains the beginning of
+            # the next one, if any
+            raw = self.decompressor.unused_data
+            if raw:
+                self.decompressor = new_decompressor(self.compression)
+        return n
+
+    def readline(self):
+        raise NotImplementedError
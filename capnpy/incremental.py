@@ -0,0 +1,121 @@
+"""
+Incremental (push-based) loading and dumping of messages, for event loops.
+
+load() and load_all() pull the data from a file-like object, so they block
+until the whole message has arrived. Event loops (e.g. Twisted or tornado)
+instead push the data to the application as soon as it arrives: the classes
+in this module do not perform any I/O. You feed them the received bytes and
+they give back complete messages, or you give them messages and they give
+back the bytes to send.
+"""
+
+from capnpy.blob import CapnpBuffer
+from capnpy.message import dumps, _message_length, _load_message_from_buffer
+
+
+class MessageDecoder(object):
+    """
+    Decode the messages of type ``payload_type`` from a stream whose data is
+    passed piece by piece to feed().
+
+    All the messages which are complete in the data passed to a single
+    feed() are loaded in place and share the same buffer. Data is copied
+    only to join the pieces of a message which arrived in different calls.
+    """
+
+    def __init__(self, payload_type):
+        self.payload_type = payload_type
+        self.parts = []  # incomplete message received so far
+        self.size = 0    # total length of parts
+        self.needed = 0  # don't try to decode until we have that many bytes
+
+    def feed(self, data):
+        """
+        Add data to the stream, and return the list of messages which are now
+        complete
+        """
+        if self.parts:
+            self.parts.append(data)
+            self.size += len(data)
+            if self.size < self.needed:
+                return [] # fast path: the message is still incomplete
+            data = ''.join(self.parts)
+            self.parts = []
+            self.size = 0
+        #
+        capnp_buf = CapnpBuffer(data)
+        result = []
+        offset = 0
+        end = len(data)
+        while offset < end:
+            length = _message_length(data, offset)
+            if length == -1 or offset + length > end:
+                break
+            msg, offset = _load_message_from_buffer(capnp_buf, offset)
+            result.append(msg._read_struct(0, self.payload_type))
+        #
+        if offset < end:
+            tail = data[offset:]
+            self.parts = [tail]
+            self.size = len(tail)
+            if length == -1:
+                # the header is incomplete: try again as soon as something
+                # arrives
+                self.needed = len(tail) + 1
+            else:
+                self.needed = length
+        return result
+
+    def pending(self):
+        """
+        Return the number of bytes received which are not part of a complete
+        message yet
+        """
+        return self.size
+
+    def close(self):
+        """
+        Signal that the stream is over, and check that it did not end in the
+        middle of a message
+        """
+        if self.size:
+            raise ValueError("Unexpected EOF: got %d bytes of an incomplete "
+                             "message" % self.size)
+
+
+class MessageEncoder(object):
+    """
+    Coalesce many messages into a single string of bytes, to be sent with a
+    single write.
+
+    write() returns True when at least ``high_water`` bytes are buffered: it
+    is the signal for the caller to flush() and send the data, and possibly
+    to wait until the transport has sent it.
+    """
+
+    def __init__(self, high_water=64*1024):
+        self.high_water = high_water
+        self.parts = []
+        self.size = 0
+
+    def write(self, obj):
+        s = dumps(obj)
+        self.parts.append(s)
+        self.size += len(s)
+        return self.size >= self.high_water
+
+    def pending(self):
+        """
+        Return the number of bytes buffered and not yet flushed
+        """
+        return self.size
+
+    def flush(self):
+        """
+        Return all the buffered messages as a single string, and clear the
+        buffer
+        """
+        data = ''.join(self.parts)
+        self.parts = []
+        self.size = 0
+        return data
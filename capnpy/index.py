@@ -0,0 +1,239 @@
+"""
+Offset index for streams of messages, such as the ones written by dump().
+
+A stream of messages can only be read sequentially, because the length of a
+message is known only after reading its header. A MessageIndex stores the
+offset of each message, so that it is possible to load the N-th message
+without decoding all the previous ones.
+
+The index can be saved to a sidecar file, by default ``FILE.idx``: this is
+what ``capnpy index FILE`` does. The sidecar file contains a magic string,
+followed by the offsets encoded as little-endian uint64.
+"""
+
+import os
+import sys
+import array
+from capnpy.blob import CapnpBuffer
+from capnpy.message import (loads, _message_length, _mmap_file,
+                            _load_message_from_buffer)
+
+MAGIC = 'capnpidx'
+
+# we need 64 bit offsets: 'L' is 64 bit on all the 64 bit platforms apart
+# from Windows
+OFFSET_TYPECODE = 'L'
+
+
+def sidecar_path(path):
+    return path + '.idx'
+
+
+class MessageIndex(object):
+    """
+    The offsets of the messages inside a stream. ``offsets`` is an array of
+    len(self)+1 items: the i-th message starts at offsets[i] and ends at
+    offsets[i+1].
+    """
+
+    def __init__(self, offsets=None):
+        if offsets is None:
+            offsets = array.array(OFFSET_TYPECODE, [0])
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __repr__(self):
+        return '<MessageIndex: %d messages>' % len(self)
+
+    def get_range(self, i):
+        """
+        Return a tuple (start, end) with the offsets of the i-th message
+        """
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('message index out of range')
+        return self.offsets[i], self.offsets[i+1]
+
+    def scan(self, buf):
+        """
+        Add to the index all the complete messages contained in buf, starting
+        from the end of the last indexed message. Only the headers are read.
+        """
+        offsets = self.offsets
+        offset = offsets[-1]
+        end = len(buf)
+        while offset < end:
+            length = _message_length(buf, offset)
+            if length == -1 or offset + length > end:
+                break # incomplete message, e.g. because it is being written
+            offset += length
+            offsets.append(offset)
+
+    def write(self, path):
+        """
+        Save the index to the given file
+        """
+        offsets = self.offsets
+        if sys.byteorder != 'little':
+            offsets = array.array(OFFSET_TYPECODE, offsets)
+            offsets.byteswap()
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            offsets.tofile(f)
+
+    @classmethod
+    def read(cls, path):
+        """
+        Load an index previously saved by write()
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('%s is not a capnpy index file' % path)
+            data = f.read()
+        offsets = array.array(OFFSET_TYPECODE)
+        offsets.fromstring(data)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        if not offsets:
+            raise ValueError('%s is not a capnpy index file' % path)
+        return cls(offsets)
+
+
+def build_index(path):
+    """
+    Scan the stream of messages at ``path`` and return its MessageIndex
+    """
+    index = MessageIndex()
+    _scan_file(index, path)
+    return index
+
+def _scan_file(index, path):
+    buf = _mmap_file(path)
+    if buf is None:
+        return # empty file
+    try:
+        index.scan(buf)
+    finally:
+        buf.close()
+
+def get_index(path):
+    """
+    Return the MessageIndex for the stream at ``path``, reading it from the
+    sidecar file if it exists. If the stream has grown since the sidecar was
+    written, the new messages are indexed as well.
+
+    The sidecar is considered stale, and the index is rebuilt from scratch,
+    if the stream is shorter than the indexed messages, or if it has been
+    modified after the sidecar without growing, i.e. it has been rewritten.
+    """
+    idxpath = sidecar_path(path)
+    if not os.path.exists(idxpath):
+        return build_index(path)
+    index = MessageIndex.read(idxpath)
+    st = os.stat(path)
+    indexed_size = index.offsets[-1]
+    if (indexed_size > st.st_size or
+        (indexed_size == st.st_size and
+         st.st_mtime > os.path.getmtime(idxpath))):
+        # the stream has been truncated or rewritten, the index is invalid
+        return build_index(path)
+    if indexed_size < st.st_size:
+        _scan_file(index, path)
+    return index
+
+
+def load_nth(f, i, payload_type, index=None):
+    """
+    Load the i-th message of type ``payload_type`` from the file f. If
+    ``index`` is not given, it is computed by get_index(f.name).
+    """
+    if index is None:
+        index = get_index(f.name)
+    start, end = index.get_range(i)
+    f.seek(start)
+    return loads(f.read(end-start), payload_type)
+
+
+class IndexedStream(object):
+    """
+    Random access to the messages of type ``payload_type`` stored in f. It
+    supports len(), indexing and slicing with step 1; all the messages of a
+    slice are read at once, and share the same buffer.
+
+    If payload_type has a $Py.key and the messages are sorted by key, you can
+    use bisect_left() and bisect_right() to find them.
+    """
+
+    def __init__(self, f, payload_type, index=None):
+        if index is None:
+            index = get_index(f.name)
+        self.f = f
+        self.payload_type = payload_type
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                raise ValueError('IndexedStream does not support slices with step')
+            return self._load_range(start, stop)
+        return load_nth(self.f, i, self.payload_type, self.index)
+
+    def _load_range(self, start, stop):
+        if start >= stop:
+            return []
+        offsets = self.index.offsets
+        self.f.seek(offsets[start])
+        buf = self.f.read(offsets[stop] - offsets[start])
+        capnp_buf = CapnpBuffer(buf)
+        result = []
+        offset = 0
+        for i in range(start, stop):
+            msg, offset = _load_message_from_buffer(capnp_buf, offset)
+            result.append(msg._read_struct(0, self.payload_type))
+        return result
+
+    def bisect_left(self, key, lo=0, hi=None):
+        """
+        Return the position of the first message whose key is >= ``key``, as
+        bisect.bisect_left does.
+        """
+        key = _as_key(key)
+        if hi is None:
+            hi = len(self)
+        while lo < hi:
+            mid = (lo+hi) // 2
+            if self[mid]._key() < key:
+                lo = mid+1
+            else:
+                hi = mid
+        return lo
+
+    def bisect_right(self, key, lo=0, hi=None):
+        """
+        Return the position after the last message whose key is <= ``key``,
+        as bisect.bisect_right does.
+        """
+        key = _as_key(key)
+        if hi is None:
+            hi = len(self)
+        while lo < hi:
+            mid = (lo+hi) // 2
+            if key < self[mid]._key():
+                hi = mid
+            else:
+                lo = mid+1
+        return lo
+
+def _as_key(key):
+    # _key() always returns a tuple, even if there is a single field
+    if not isinstance(key, tuple):
+        key = (key,)
+    return key
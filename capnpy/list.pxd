@@ -1,10 +1,12 @@
 import cython
-from capnpy.blob cimport Blob
+from capnpy.blob cimport Blob, CapnpBuffer
 from capnpy.type cimport BuiltinType
 from capnpy cimport ptr
 from capnpy.visit cimport end_of
+from capnpy cimport _hash
 
 cdef class ItemType(object)
+cdef class PrimitiveItemType(ItemType)
 
 cdef class List(Blob):
     cdef readonly long _offset
@@ -15,15 +17,39 @@ cdef class List(Blob):
     cdef readonly long _item_count
     cdef readonly long _item_length
     cdef readonly long _item_offset
+    cdef readonly long _start
+    cdef readonly long _step
+    cdef readonly bint _is_view
 
     cpdef _init_from_buffer(self, object buf, long offset, long size_tag,
                             long item_count, ItemType item_type)
     cpdef _set_list_tag(self, long size_tag, long item_count)
     cpdef _getitem_fast(self, long i)
 
+    @cython.locals(obj=List)
+    cpdef List _slice(self, long start, long step, long count)
+    cpdef long _get_start(self)
+    cpdef long _get_stride(self)
+    cpdef list to_pylist(self)
+
+    @cython.locals(item_type=PrimitiveItemType)
+    cpdef long _hash(self) except? -1
+
+cdef class ListIterator(object):
+    cdef readonly List lst
+    cdef readonly ItemType item_type
+    cdef long i
+
 cdef class ItemType(object):
     cpdef get_type(self)
     cpdef read_item(self, List lst, long offset)
+
+    @cython.locals(i=long)
+    cpdef list to_pylist(self, List lst)
+    cpdef write_item(self, List lst, long i, object value)
+    cpdef as_array(self, List lst)
+    cpdef column(self, List lst, object name)
+    cpdef as_records(self, List lst)
     cpdef long offset_for_item(self, List lst, long i)
     cpdef bint can_compare(self)
 
@@ -31,21 +57,35 @@ cdef class VoidItemType(ItemType):
     pass
 
 cdef class BoolItemType(ItemType):
-    pass
+
+    @cython.locals(count=long, i=long, data=bytearray, first=long, last=long,
+                   lo=long, hi=long, bit=long)
+    cpdef list to_pylist(self, List lst)
 
 cdef class PrimitiveItemType(ItemType):
     cdef readonly BuiltinType t
     cdef readonly char ifmt
 
+    @cython.locals(count=long, start=long, end=long)
+    cpdef list to_pylist(self, List lst)
+
 cdef class EnumItemType(PrimitiveItemType):
     cdef readonly object enumcls
 
 cdef class StructItemType(ItemType):
     cdef readonly object structcls
 
+    @cython.locals(data_size=long, ptrs_size=long, offset=long, stride=long,
+                   i=long)
+    cpdef list to_pylist(self, List lst)
+
 cdef class TextItemType(ItemType):
+    cdef readonly BuiltinType t
     cdef readonly int additional_size
 
+    @cython.locals(buf=CapnpBuffer, i=long, offset=long, p=long)
+    cpdef list to_pylist(self, List lst)
+
 cdef class ListItemType(ItemType):
     cdef readonly ItemType inner_item_type
 
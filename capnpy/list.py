@@ -1,9 +1,11 @@
 import struct
 import capnpy
-from capnpy.blob import Blob, Types, PYX
+from capnpy.blob import Blob, Types, PYX, CapnpBufferWithSegments
 from capnpy import ptr
 from capnpy.util import text_repr, float32_repr, float64_repr
 from capnpy.visit import end_of
+from capnpy import _hash
+from capnpy import arrays
 
 class List(Blob):
 
@@ -26,6 +28,9 @@ class List(Blob):
         self._offset = offset
         self._item_type = item_type
         self._set_list_tag(size_tag, item_count)
+        self._start = 0
+        self._step = 1
+        self._is_view = False
 
     def __reduce__(self):
         raise TypeError("Cannot pickle capnpy List directly. Either pickle "
@@ -58,20 +63,126 @@ class List(Blob):
 
     def __getitem__(self, i):
         if isinstance(i, slice):
-            idx = xrange(*i.indices(len(self)))
-            return [self._getitem_fast(j) for j in idx]
+            start, stop, step = i.indices(self._item_count)
+            return self._slice(start, step, len(xrange(start, stop, step)))
         if i < 0:
             i += self._item_count
         if 0 <= i < self._item_count:
             return self._getitem_fast(i)
         raise IndexError
 
+    def _slice(self, start, step, count):
+        """
+        Return a view on ``count`` items of self, starting from ``start``
+        with the given ``step``. The view shares the buffer of self: the
+        items are read only when accessed.
+
+        Each item i of a list is at index _start + i*_step of the underlying
+        list body: for normal lists, _start==0 and _step==1.
+        """
+        obj = List.__new__(List)
+        obj._init_blob(self._buf)
+        obj._offset = self._offset
+        obj._item_type = self._item_type
+        obj._size_tag = self._size_tag
+        obj._tag = self._tag
+        obj._item_count = count
+        obj._item_length = self._item_length
+        obj._item_offset = self._item_offset
+        obj._start = self._start + start*self._step
+        obj._step = self._step * step
+        obj._is_view = True
+        return obj
+
+    def __iter__(self):
+        return ListIterator(self)
+
+    def to_pylist(self):
+        """
+        Return all the items as a Python list. This is much faster than
+        list(lst), because the items are read in a single loop which is
+        specialized for the type of the items.
+        """
+        return self._item_type.to_pylist(self)
+
+    def __setitem__(self, i, value):
+        """
+        Modify the item in place: this works only for lists of primitives,
+        enums and bools, and only if the underlying buffer is writable.
+        """
+        if isinstance(i, slice):
+            raise TypeError("capnpy lists do not support slice assignment")
+        if i < 0:
+            i += self._item_count
+        if not 0 <= i < self._item_count:
+            raise IndexError
+        self._item_type.write_item(self, i, value)
+
+    def cursor(self):
+        """
+        Iterate over a list of structs without allocating a new object for
+        each item: the iterator yields always the very same object, which
+        is re-pointed to the next item at each step.
+
+        WARNING: the yielded object is valid only until the next step. Do
+        not keep references to it, e.g. by putting it into a container: use
+        the normal iteration (or compact()) for that.
+
+        For lists of other types, this is the same as iter(lst).
+        """
+        if isinstance(self._item_type, StructItemType):
+            return capnpy.struct_.ListCursor(self)
+        return iter(self)
+
+    def as_array(self):
+        """
+        Return the items of a list of primitives, enums or bools as a numpy
+        array, or as an array.array if numpy is not installed. For
+        primitives and enums, the numpy array is a view on the buffer,
+        without any copy. Enums are returned as their int16 values.
+        """
+        return self._item_type.as_array(self)
+
+    def column(self, name):
+        """
+        Return the values of the field ``name`` of all the items of a list of
+        structs, as an array: see as_array(). The field must be a primitive,
+        an enum or a bool, and not part of an union. Primitives and enums
+        are returned as a strided view on the buffer, without any copy,
+        unless the field has an explicit default value.
+        """
+        return self._item_type.column(self, name)
+
+    def as_records(self):
+        """
+        Return the items of a list of structs as a numpy record array, whose
+        dtype is StructClass.numpy_dtype(). Normally, the array is a view on
+        the buffer, without any copy. The items are copied if some fields
+        have an explicit default value, or if the items were written with
+        an older schema, with a smaller data section.
+        """
+        return self._item_type.as_records(self)
+
     def _getitem_fast(self, i):
         """
         WARNING: no bound checks!
         """
         return self._item_type.read_item(self, i)
 
+    def _get_start(self):
+        """
+        Return the offset of the first item, or of the place where it would
+        be if the list is empty
+        """
+        return self._offset + self._item_offset + self._start*self._item_length
+
+    def _get_stride(self):
+        """
+        Return the distance in bytes between two consecutive items, which
+        is negative for views with a negative step
+        """
+        return self._item_length * self._step
+
     def _get_end(self):
         p = ptr.new_list(0, self._size_tag, self._item_count)
         return end_of(self._buf, p, self._offset-8)
@@ -81,7 +192,7 @@ class List(Blob):
         # comparing the memory without doing a full copy
         start = self._offset
         end = self._get_end()
-        return self._buf.s[start:end]
+        return self._buf.read_slice(start, end)
 
     def _equals(self, other):
         if not self._item_type.can_compare():
@@ -90,22 +201,81 @@ class List(Blob):
             return list(self) == other
         if self.__class__ is not other.__class__:
             return False
+        if (isinstance(self._buf, CapnpBufferWithSegments) or
+            isinstance(other._buf, CapnpBufferWithSegments) or
+            self._is_view or other._is_view):
+            # the items might be reachable only through far pointers, or
+            # they are not the whole list body, so we cannot compare the raw
+            # memory
+            return (self._item_type.get_type() == other._item_type.get_type() and
+                    list(self) == list(other))
         return (self._item_count == other._item_count and
                 self._item_type.get_type() == other._item_type.get_type() and
                 self._get_slice() == other._get_slice())
 
+    def _hash(self):
+        # consistent with _equals: equal lists have the same hash, which is
+        # also the hash of the corresponding tuple
+        if not self._item_type.can_compare():
+            raise TypeError("Cannot hash lists of structs.")
+        if isinstance(self._item_type, PrimitiveItemType) and self._step == 1:
+            # fast path: hash the items directly from the buffer
+            item_type = self._item_type
+            return _hash.primitivelisthash(self._buf.s, self._get_start(),
+                                           self._item_count, item_type.ifmt)
+        return hash(tuple(self))
+
+    def __hash__(self):
+        return self._hash()
+
+    # like in struct_.py, we need to redeclare __richcmp__ together with
+    # __hash__, else Cython won't use it
+    def __richcmp__(self, other, op):
+        return self._richcmp(other, op)
+
     def shortrepr(self):
         parts = [self._item_type.item_repr(item) for item in self]
         return '[%s]' % (', '.join(parts))
 
 
+class ListIterator(object):
+    """
+    Iterator returned by List.__iter__(): it reads the items directly from
+    the item type, without the bound checks and the dispatch of __getitem__.
+    """
+
+    def __init__(self, lst):
+        self.lst = lst
+        self.item_type = lst._item_type
+        self.i = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.i >= self.lst._item_count:
+            raise StopIteration
+        item = self.item_type.read_item(self.lst, self.i)
+        self.i += 1
+        return item
+
+    def __length_hint__(self):
+        return self.lst._item_count - self.i
+
+# see the comment about ListCursor.next in struct_.py
+try:
+    ListIterator.next = ListIterator.__dict__['__next__']
+except TypeError:
+    pass
+
+
 class ItemType(object):
 
     def get_type(self):
         raise NotImplementedError
 
     def offset_for_item(self, lst, i):
-        return lst._item_offset + (i * lst._item_length)
+        return lst._item_offset + (lst._start + i*lst._step) * lst._item_length
 
     def read_item(self, lst, i):
         raise NotImplementedError
@@ -113,6 +283,28 @@ class ItemType(object):
     def item_repr(self, item):
         raise NotImplementedError
 
+    def to_pylist(self, lst):
+        result = []
+        for i in range(lst._item_count):
+            result.append(self.read_item(lst, i))
+        return result
+
+    def write_item(self, lst, i, value):
+        raise TypeError("Cannot modify the items of a list of %s in place"
+                        % self.get_type())
+
+    def as_array(self, lst):
+        raise TypeError("Cannot convert a list of %s to an array"
+                        % self.get_type())
+
+    def column(self, lst, name):
+        raise TypeError("Cannot extract a column from a list of %s"
+                        % self.get_type())
+
+    def as_records(self, lst):
+        raise TypeError("Cannot convert a list of %s to records"
+                        % self.get_type())
+
     def can_compare(self):
         return True
 
@@ -134,6 +326,9 @@ class VoidItemType(ItemType):
     def read_item(self, lst, i):
         return None
 
+    def to_pylist(self, lst):
+        return [None] * lst._item_count
+
     def item_repr(self, item):
         return 'void'
 
@@ -153,11 +348,54 @@ class BoolItemType(ItemType):
         raise NotImplementedError
 
     def read_item(self, lst, i):
-        byteoffset, bitoffset = divmod(i, 8)
+        byteoffset, bitoffset = divmod(lst._start + i*lst._step, 8)
         bitmask = 1 << bitoffset
         value = lst._buf.read_primitive(lst._offset+byteoffset, ord('b'))
         return bool(value & bitmask)
 
+    def to_pylist(self, lst):
+        count = lst._item_count
+        if count == 0:
+            return []
+        # read all the bytes which contain the bits of the items at once
+        first = lst._start
+        last = first + (count-1)*lst._step
+        lo = min(first, last) >> 3
+        hi = (max(first, last) >> 3) + 1
+        data = bytearray(lst._buf.read_slice(lst._offset + lo,
+                                             lst._offset + hi))
+        if len(data) < hi - lo:
+            raise IndexError('Offset out of bounds: %d' % (lst._offset + hi))
+        result = []
+        bit = first - lo*8
+        for i in range(count):
+            result.append((data[bit >> 3] >> (bit & 7)) & 1 == 1)
+            bit += lst._step
+        return result
+
+    def write_item(self, lst, i, value):
+        byteoffset, bitoffset = divmod(lst._start + i*lst._step, 8)
+        bitmask = 1 << bitoffset
+        byte = lst._buf.read_primitive(lst._offset+byteoffset, ord('B'))
+        if value:
+            byte |= bitmask
+        else:
+            byte &= ~bitmask
+        lst._buf.write_primitive(lst._offset+byteoffset, ord('B'), byte)
+
+    def as_array(self, lst):
+        count = lst._item_count
+        if lst._step == 1 and lst._start % 8 == 0:
+            return arrays.bool_array(lst._buf.s, lst._offset + lst._start//8,
+                                     count)
+        # unpack all the bytes which contain the items, then pick them
+        first = lst._start
+        last = first + max(count-1, 0)*lst._step
+        lo = min(first, last) // 8
+        nbits = max(first, last) - lo*8 + 1
+        bits = arrays.bool_array(lst._buf.s, lst._offset + lo, nbits)
+        return bits[first-lo*8::lst._step][:count]
+
     def item_repr(self, item):
         return ('false', 'true')[item]
 
@@ -178,9 +416,33 @@ class PrimitiveItemType(ItemType):
         return self.t
 
     def read_item(self, lst, i):
-        offset = lst._offset + (i * lst._item_length)
+        offset = lst._offset + (lst._start + i*lst._step) * lst._item_length
         return lst._buf.read_primitive(offset, self.ifmt)
 
+    def to_pylist(self, lst):
+        if lst._step != 1 or lst._item_length != self.t.calcsize():
+            return ItemType.to_pylist(self, lst)
+        # unpack all the items with a single call
+        count = lst._item_count
+        start = lst._get_start()
+        end = start + count*lst._item_length
+        if start < 0 or end > len(lst._buf.s):
+            raise IndexError('Offset out of bounds: %d' % end)
+        fmt = '<%d%s' % (count, self.t.fmt)
+        return list(struct.unpack_from(fmt, lst._buf.s, start))
+
+    def write_item(self, lst, i, value):
+        offset = lst._offset + (lst._start + i*lst._step) * lst._item_length
+        lst._buf.write_primitive(offset, self.ifmt, value)
+
+    def as_array(self, lst):
+        if lst._step == 1:
+            return arrays.primitive_array(lst._buf.s, lst._get_start(),
+                                          lst._item_count, self.t.fmt)
+        return arrays.strided_array(lst._buf.s, lst._get_start(),
+                                    lst._item_count, lst._get_stride(),
+                                    self.t.fmt)
+
     def item_repr(self, item):
         if self.t is Types.float32:
             return float32_repr(item)
@@ -219,6 +481,11 @@ class EnumItemType(PrimitiveItemType):
         value = PrimitiveItemType.read_item(self, lst, i)
         return self.enumcls(value)
 
+    def to_pylist(self, lst):
+        enumcls = self.enumcls
+        return [enumcls(value)
+                for value in PrimitiveItemType.to_pylist(self, lst)]
+
 
 class StructItemType(ItemType):
 
@@ -238,6 +505,60 @@ class StructItemType(ItemType):
                                           ptr.struct_data_size(lst._tag),
                                           ptr.struct_ptrs_size(lst._tag))
 
+    def to_pylist(self, lst):
+        structcls = self.structcls
+        data_size = ptr.struct_data_size(lst._tag)
+        ptrs_size = ptr.struct_ptrs_size(lst._tag)
+        offset = lst._get_start()
+        stride = lst._get_stride()
+        result = []
+        for i in range(lst._item_count):
+            result.append(structcls.from_buffer(lst._buf, offset,
+                                                data_size, ptrs_size))
+            offset += stride
+        return result
+
+    def column(self, lst, name):
+        layout = getattr(self.structcls, '__data_layout__', {})
+        try:
+            fmt, offset, default = layout[name]
+        except KeyError:
+            raise ValueError("%s has no primitive field named %r" %
+                             (self.structcls.__name__, name))
+        start = lst._get_start()
+        count = lst._item_count
+        stride = lst._get_stride()
+        if fmt == '?':
+            byteoffset, bitoffset = divmod(offset, 8)
+            if byteoffset >= ptr.struct_data_size(lst._tag)*8:
+                # the items come from an older schema without this field
+                return arrays.filled_array(count, fmt, default)
+            return arrays.strided_bool_array(lst._buf.s, start+byteoffset,
+                                             count, stride, bitoffset, default)
+        if offset >= ptr.struct_data_size(lst._tag)*8:
+            return arrays.filled_array(count, fmt, default)
+        return arrays.strided_array(lst._buf.s, start+offset, count, stride,
+                                    fmt, default)
+
+    def as_records(self, lst):
+        dtype = arrays.struct_dtype(self.structcls)
+        numpy = arrays.get_numpy()
+        layout = self.structcls.__data_layout__
+        count = lst._item_count
+        has_defaults = False
+        for name in dtype.names:
+            if layout[name][2]:
+                has_defaults = True
+        if (not has_defaults and
+            ptr.struct_data_size(lst._tag)*8 >= dtype.itemsize):
+            return numpy.ndarray((count,), dtype, lst._buf.s, lst._get_start(),
+                                 (lst._get_stride(),))
+        # slow path, fill the records one column at a time
+        records = numpy.zeros(count, dtype)
+        for name in dtype.names:
+            records[name] = self.column(lst, name)
+        return records
+
     def item_repr(self, item):
         return item.shortrepr()
 
@@ -287,6 +608,7 @@ class TextItemType(ItemType):
 
     def __init__(self, t):
         assert t in (Types.text, Types.data)
+        self.t = t
         self.additional_size = 0
         if t == Types.text:
             self.additional_size = -1
@@ -295,12 +617,23 @@ class TextItemType(ItemType):
         return self.t
 
     def read_item(self, lst, i):
-        offset = lst._offset + (i*8)
+        offset = lst._offset + (lst._start + i*lst._step) * 8
         p = lst._buf.read_ptr(offset)
         if p == ptr.E_IS_FAR_POINTER:
-            raise NotImplementedError('FAR pointers not supported here')
+            offset, p = lst._buf.read_far_ptr(offset)
         return lst._buf.read_str(p, offset, None, self.additional_size)
 
+    def to_pylist(self, lst):
+        buf = lst._buf
+        result = []
+        for i in range(lst._item_count):
+            offset = lst._offset + (lst._start + i*lst._step) * 8
+            p = buf.read_ptr(offset)
+            if p == ptr.E_IS_FAR_POINTER:
+                offset, p = buf.read_far_ptr(offset)
+            result.append(buf.read_str(p, offset, None, self.additional_size))
+        return result
+
     def item_repr(self, item):
         return text_repr(item)
 
@@ -326,10 +659,10 @@ class ListItemType(ItemType):
         return ('list', self.inner_item_type)
 
     def read_item(self, lst, i):
-        offset = lst._offset + (i*8)
+        offset = lst._offset + (lst._start + i*lst._step) * 8
         p = lst._buf.read_ptr(offset)
         if p == ptr.E_IS_FAR_POINTER:
-            raise NotImplementedError('FAR pointers not supported here')
+            offset, p = lst._buf.read_far_ptr(offset)
         obj = List.__new__(List)
         obj._init_from_buffer(lst._buf,
                               ptr.deref(p, offset),
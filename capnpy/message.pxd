@@ -1,6 +1,6 @@
 import cython
-from capnpy.unpack cimport unpack_uint32, pack_message_header
-from capnpy.blob cimport CapnpBuffer
+from capnpy.unpack cimport unpack_uint32, pack_message_header, pack_message
+from capnpy.blob cimport CapnpBuffer, CapnpBufferWithSegments
 from capnpy.struct_ cimport Struct, struct_from_buffer
 from capnpy cimport ptr
 from capnpy.filelike cimport FileLike, as_filelike
@@ -8,9 +8,16 @@ from capnpy.filelike cimport FileLike, as_filelike
 @cython.locals(msg=Struct, f2=FileLike)
 cpdef load(object f, object payload_type)
 
-cpdef loads(bytes buf, object payload_type)
+@cython.locals(msg=Struct, end=long)
+cpdef loads(object buf, object payload_type)
+cpdef load_packed(object f, object payload_type)
+cpdef loads_packed(bytes buf, object payload_type)
 #cpdef load_all(FileLike f, object payload_type)
 
+@cython.locals(length=long, n=long, header_length=long, message_length=long,
+               i=long)
+cpdef long _message_length(object buf, long offset) except -2
+
 
 @cython.locals(buf = bytes, n=int)
 cpdef Struct _load_message(FileLike f)
@@ -18,9 +25,20 @@ cpdef Struct _load_message(FileLike f)
 @cython.locals(buf=bytes, message_size=int, message_lenght=int)
 cpdef _load_buffer_single_segment(FileLike f)
 
-@cython.locals(fmt=bytes, size=int, buf=bytes, bytes_read=int,
-                padding=int, message_lenght=int, offset=int, size=int)
+@cython.locals(fmt=bytes, size=int, buf=bytes, padding=int,
+               message_lenght=int, offset=int)
 cpdef _load_buffer_multiple_segments(FileLike f, int n)
 
-@cython.locals(buf=bytes, padding=int, a=long, b=long)
+@cython.locals(segment_offsets=list)
+cpdef tuple _compute_segment_offsets(object segments, long offset)
+
+@cython.locals(buf=object, length=long, n=long, start=long, end=long,
+               header_length=long, msg=Struct)
+cpdef tuple _load_message_from_buffer(CapnpBuffer capnp_buf, long offset)
+
+@cython.locals(p=long)
 cpdef dumps(Struct obj)
+
+@cython.locals(p=long, padding=long, a=long, b=long, segment_size=long)
+cpdef long dumps_into(Struct obj, bytearray buf) except -1
+cpdef bytes dumps_packed(Struct obj)
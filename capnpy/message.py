@@ -1,10 +1,19 @@
+import os
+import io
+import stat
+import mmap
 import struct
-from capnpy.unpack import unpack_uint32, pack_message_header
+from StringIO import StringIO
+from cStringIO import InputType, OutputType
+from capnpy.unpack import unpack_uint32, pack_message_header, pack_message
 from capnpy.blob import CapnpBuffer, CapnpBufferWithSegments
 from capnpy.struct_ import Struct, struct_from_buffer
 from capnpy import ptr
+from capnpy import visit
 from capnpy.filelike import as_filelike
-from capnpy.buffered import StringBuffer
+from capnpy.buffered import BufferedStream, StringBuffer
+from capnpy.packing import pack, unpack, PackedStream
+from capnpy.compression import DecompressedStream, new_compressor
 
 def load(f, payload_type):
     """
@@ -28,8 +37,21 @@ def load(f, payload_type):
 
 def loads(buf, payload_type):
     """
-    Same as load(), but load from a string instead of a file
+    Same as load(), but load from a string instead of a file.
+
+    If buf is a bytearray, the message is loaded in place: the returned
+    object reads its fields directly from buf, and its primitive fields can
+    be modified. NOTE: the object aliases buf, it does not copy it: any
+    later change to buf is visible through the object, and the setters of
+    the object modify buf. Pass ``str(buf)`` to get an independent,
+    read-only copy instead.
     """
+    if isinstance(buf, bytearray):
+        msg, end = _load_message_from_buffer(CapnpBuffer(buf), 0)
+        if end != len(buf):
+            raise ValueError("Not all bytes were consumed: %d bytes left"
+                             % (len(buf)-end))
+        return msg._read_struct(0, payload_type)
     f = StringBuffer(buf)
     obj = load(f, payload_type)
     if f.tell() != len(buf):
@@ -37,16 +59,161 @@ def loads(buf, payload_type):
         raise ValueError("Not all bytes were consumed: %d bytes left" % remaining)
     return obj
 
-def load_all(f, payload_type):
+DEFAULT_CHUNK_SIZE = 64*1024
+
+def load_all(f, payload_type, chunk_size=None, compression=None):
     """
-    Load and yield all the messages in the given file-like object
+    Load and yield all the messages in the given file-like object.
+
+    If f is a regular file or an in-memory buffer, it is read in chunks of
+    ``chunk_size`` bytes (64 KB by default), and all the messages which are
+    contained in the same chunk share its buffer; this is much faster than
+    loading the messages one by one. Note that this means that the whole
+    chunk is kept alive as long as any of its messages is, and that f is
+    read past the last message yielded so far.
+
+    Other streams such as pipes, sockets and stdin are read one message at a
+    time, because reading a whole chunk would block until the chunk is full.
+    Pass an explicit ``chunk_size`` to read them in chunks anyway.
+
+    If ``compression`` is given, the stream is decompressed on the fly: see
+    capnpy.compression.
+    """
+    chunked = chunk_size is not None or _can_read_ahead(f)
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    if compression is not None:
+        f = DecompressedStream(f, compression, chunk_size)
+    if not chunked or isinstance(f, BufferedStream):
+        # BufferedStream.read() blocks until it gets all the requested bytes:
+        # we don't want to wait for a full chunk e.g. in case of sockets, so
+        # we load the messages one by one. Note that the stream is already
+        # buffered anyway
+        return _load_all_one_by_one(f, payload_type)
+    return _load_all_chunked(f, payload_type, chunk_size)
+
+def _can_read_ahead(f):
     """
+    Return True if f is a regular file or an in-memory buffer, i.e. if
+    reading a big chunk from it never waits for more data to arrive
+    """
+    try:
+        fd = f.fileno()
+    except (AttributeError, IOError, ValueError):
+        # io.UnsupportedOperation is a subclass of both IOError and
+        # ValueError
+        return isinstance(f, (StringIO, InputType, OutputType, io.BytesIO))
+    try:
+        return stat.S_ISREG(os.fstat(fd).st_mode)
+    except OSError:
+        return False
+
+def _load_all_one_by_one(f, payload_type):
     try:
         while True:
             yield load(f, payload_type)
     except EOFError:
         pass
 
+def _load_all_chunked(f, payload_type, chunk_size):
+    for capnp_buf, offset in _iter_frames(f, chunk_size):
+        msg, end = _load_message_from_buffer(capnp_buf, offset)
+        yield msg._read_struct(0, payload_type)
+
+def _iter_frames(f, chunk_size):
+    """
+    Read f in chunks of ``chunk_size`` bytes, and yield a tuple (capnp_buf,
+    offset) for each message, which starts at ``offset`` inside capnp_buf.
+    All the messages which are contained in the same chunk share the same
+    capnp_buf.
+    """
+    capnp_buf = CapnpBuffer('')
+    offset = 0
+    length = 0
+    while True:
+        if offset == length:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            capnp_buf = CapnpBuffer(chunk)
+            offset = 0
+            length = len(chunk)
+        #
+        message_length = _message_length(capnp_buf.s, offset)
+        if message_length == -1:
+            # the header straddles two chunks: read another chunk and try
+            # again
+            rest = capnp_buf.read_slice(offset, length)
+            chunk = f.read(chunk_size)
+            if not chunk:
+                if len(rest) < 4:
+                    return # same as load() raising EOFError
+                raise ValueError("Unexpected EOF when reading the header")
+            capnp_buf = CapnpBuffer(rest + chunk)
+            offset = 0
+            length = len(capnp_buf.s)
+        elif offset + message_length > length:
+            # the body straddles two chunks: read exactly the missing bytes,
+            # and load the message from its own buffer
+            rest = capnp_buf.read_slice(offset, length)
+            buf = rest + f.read(offset + message_length - length)
+            offset = length # force to read a new chunk
+            yield CapnpBuffer(buf), 0
+        else:
+            # fast path, the whole message is inside the chunk
+            yield capnp_buf, offset
+            offset += message_length
+
+def _message_length(buf, offset):
+    """
+    Return the total length of the message starting at the given offset,
+    including the header, or -1 if buf does not contain the whole header
+    """
+    length = len(buf)
+    if offset + 4 > length:
+        return -1
+    n = unpack_uint32(buf, offset) + 1
+    header_length = 4 + n*4
+    if header_length % 8 != 0:
+        header_length += 8 - (header_length % 8)
+    if offset + header_length > length:
+        return -1
+    message_length = header_length
+    for i in range(n):
+        message_length += unpack_uint32(buf, offset + 4 + i*4) * 8
+    return message_length
+
+def load_packed(f, payload_type):
+    """
+    Same as load(), but the message is expected to be encoded using the
+    standard capnp packing scheme.
+
+    If you want to load many messages from the same file, it is more
+    efficient to wrap it into a ``capnpy.packing.PackedStream`` only once and
+    to pass it to all the calls.
+    """
+    if not isinstance(f, PackedStream):
+        f = PackedStream(f)
+    msg = _load_message(f)
+    return msg._read_struct(0, payload_type)
+
+def loads_packed(buf, payload_type):
+    """
+    Same as load_packed(), but load from a string instead of a file
+    """
+    return loads(unpack(buf), payload_type)
+
+def load_all_packed(f, payload_type):
+    """
+    Load and yield all the packed messages in the given file-like object
+    """
+    f = PackedStream(f)
+    try:
+        while True:
+            yield load_packed(f, payload_type)
+    except EOFError:
+        pass
+
 def _load_message(f):
     # read the total number of segments
     buf = f.read(4)
@@ -89,37 +256,150 @@ def _load_buffer_single_segment(f):
 def _load_buffer_multiple_segments(f, n):
     # slow path for the multiple-segments case
     #
-    # 1. read the size of each segment
+    # 1. read the size of each segment, together with the padding which
+    # makes the message start at word boundary
     fmt = '<'+'I'*n
-    size = struct.calcsize(fmt)
-    buf = f.read(size)
+    size = n*4
+    padding = (8 - (4 + size) % 8) % 8 # 4 bytes for the n
+    buf = f.read(size + padding)
     if len(buf) < size:
         raise ValueError("Unexpected EOF when reading the header")
-    segments = struct.unpack(fmt, buf)
+    segments = struct.unpack_from(fmt, buf, 0)
     #
-    # 2. add enough padding so that the message starts at word boundary
-    bytes_read = 4 + n*4 # 4 bytes for the n, plus 4 bytes for each segment
-    if bytes_read % 8 != 0:
-        padding = 8-(bytes_read % 8)
-        f.read(padding)
-    #
-    # 3. read the body of the message
+    # 2. read the body of the message
     message_lenght = sum(segments)*8
     buf = f.read(message_lenght)
     if len(buf) < message_lenght:
         raise ValueError("Unexpected EOF: expected %d bytes, got only %s. "
                          "Segments size: %s" % (message_lenght, len(buf), segments))
     #
-    # 4. precompute the offset of each segment starting from the beginning of buf
+    # 3. precompute the offset of each segment starting from the beginning of buf
+    segment_offsets = _compute_segment_offsets(segments, 0)
+    #
+    # 4. we are finally done :)
+    return CapnpBufferWithSegments(buf, segment_offsets)
+
+def _compute_segment_offsets(segments, offset):
     segment_offsets = []
-    segment_offsets.append(0)
-    offset = 0
+    segment_offsets.append(offset)
     for size in segments[:-1]:
         offset += size*8
         segment_offsets.append(offset)
+    return tuple(segment_offsets)
+
+
+def load_mmap(path, payload_type, offset=0, writable=False):
+    """
+    Same as load(), but map the file at ``path`` into memory instead of
+    reading it, and load the message which starts at ``offset``. The message
+    is not copied: the returned struct reads its fields directly from the
+    mapped memory.
+
+    This is the best way to access few fields of a very large message: only
+    the pages which are actually touched are read from the disk. In case of
+    multi-segment messages, each far pointer is resolved directly inside the
+    mapped segment it points to.
+
+    If ``writable`` is True, the file is mapped in read-write mode, and the
+    changes to the primitive fields of the returned objects are written to
+    the file.
+    """
+    for obj in iter_mmap(path, payload_type, offset, writable):
+        return obj
+    raise EOFError("No message to load")
+
+def iter_mmap(path, payload_type, offset=0, writable=False):
+    """
+    Same as load_all(), but map the file at ``path`` into memory instead of
+    reading it, starting from ``offset``. The file is mapped only once, and
+    all the yielded structs share the same underlying buffer. See load_mmap
+    for ``writable``.
+    """
+    buf = _mmap_file(path, writable)
+    if buf is None:
+        return
+    capnp_buf = CapnpBuffer(buf)
+    end = len(buf)
+    while offset < end:
+        msg, offset = _load_message_from_buffer(capnp_buf, offset)
+        yield msg._read_struct(0, payload_type)
+
+def _mmap_file(path, writable=False):
+    if writable:
+        mode, access = 'r+b', mmap.ACCESS_WRITE
+    else:
+        mode, access = 'rb', mmap.ACCESS_READ
+    with open(path, mode) as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None # cannot mmap an empty file
+        return mmap.mmap(f.fileno(), 0, access=access)
+
+def _load_message_from_buffer(capnp_buf, offset):
+    """
+    Same as _load_message, but load the message in place from capnp_buf,
+    starting at the given offset: the returned message shares the very same
+    buffer. Return a tuple (msg, end), where end is the offset where the
+    message ends.
+    """
+    buf = capnp_buf.s
+    length = len(buf)
+    if offset + 8 > length:
+        raise ValueError("Unexpected EOF when reading the header")
+    n = unpack_uint32(buf, offset) + 1
+    if n == 1:
+        # fast path
+        segments = unpack_uint32(buf, offset+4)
+        start = offset + 8
+        end = start + segments*8
+    else:
+        header_length = 4 + n*4
+        if header_length % 8 != 0:
+            header_length += 8 - (header_length % 8)
+        if offset + header_length > length:
+            raise ValueError("Unexpected EOF when reading the header")
+        segments = struct.unpack_from('<'+'I'*n, buf, offset+4)
+        start = offset + header_length
+        end = start + sum(segments)*8
+        segment_offsets = _compute_segment_offsets(segments, start)
+        capnp_buf = CapnpBufferWithSegments(buf, segment_offsets)
     #
-    # 5. we are finally done :)
-    return CapnpBufferWithSegments(buf, tuple(segment_offsets))
+    if end > length:
+        raise ValueError("Unexpected EOF: expected %d bytes, got only %s. "
+                         "Segments size: %s" % (end-start, length-start, segments))
+    msg = struct_from_buffer(Struct, capnp_buf, start, data_size=0, ptrs_size=1)
+    return msg, end
+
+
+# the same defaults as the C++ implementation
+TRAVERSAL_LIMIT = 8*1024*1024 # in words, i.e. 64 MB
+NESTING_LIMIT = 64
+
+def validate(obj, traversal_limit=TRAVERSAL_LIMIT, nesting_limit=NESTING_LIMIT):
+    """
+    Check in a single pass that all the pointers reachable from ``obj`` are
+    valid and inside the buffer, raising ValueError otherwise.
+
+    Return an equivalent object which is marked as trusted: reading its
+    fields, and the fields of all the objects reachable from it, skips the
+    per-access bound checks. Other objects which share the same buffer
+    (e.g. the other messages returned by load_all) are not affected.
+
+    WARNING: the trusted object must be read with the same schema that was
+    used to write it. Validation checks the structure of the message, not
+    that e.g. a List(Int64) field really contains 64 bit integers.
+    """
+    buf = obj._buf
+    if buf.trusted:
+        return obj
+    p = ptr.new_struct(0, obj._data_size, obj._ptrs_size)
+    visit.validate(buf, p, obj._data_offset-8, traversal_limit, nesting_limit)
+    if isinstance(buf, CapnpBufferWithSegments):
+        buf = CapnpBufferWithSegments(buf.s, buf.segment_offsets)
+    else:
+        buf = CapnpBuffer(buf.s)
+    buf.trusted = True
+    return struct_from_buffer(obj.__class__, buf, obj._data_offset,
+                              obj._data_size, obj._ptrs_size)
 
 
 def dumps(obj):
@@ -129,20 +409,34 @@ def dumps(obj):
     The message is encoded using the recommended capnp format for serializing
     messages over a stream. It always uses a single segment.
     """
+    if not obj._is_compact():
+        obj = obj.compact()
+    p = ptr.new_struct(0, obj._data_size, obj._ptrs_size)
+    return pack_message(p, obj._buf.s, obj._get_body_start(), obj._get_end())
+
+def dumps_into(obj, buf):
+    """
+    Same as dumps(), but append the message to the bytearray buf instead of
+    returning a string. Return the length of the message.
+
+    If obj is compact (e.g., because it has been loaded from a message), its
+    body is copied directly from its buffer to buf, without creating any
+    intermediate string.
+    """
     if not obj._is_compact():
         obj = obj.compact()
     a = obj._get_body_start()
     b = obj._get_end()
-    buf = obj._buf.s[a:b]
     p = ptr.new_struct(0, obj._data_size, obj._ptrs_size)
-    #
-    segment_count = 1
-    if len(buf) % 8 != 0:
-        padding = 8 - (len(buf) % 8)
-        buf += '\x00' * padding
-    segment_size = len(buf)/8 + 1 # +1 is for the ptr
-    header = pack_message_header(segment_count, segment_size, p)
-    return header + buf
+    padding = (8 - (b-a) % 8) % 8
+    segment_size = (b-a+padding)/8 + 1 # +1 is for the ptr
+    buf += pack_message_header(1, segment_size, p)
+    buf += obj._buf.read_view(a, b)
+    if padding:
+        buf += ZERO_PADDING[:padding]
+    return 16 + b-a + padding
+
+ZERO_PADDING = '\x00' * 8
 
 def dump(obj, f):
     """
@@ -150,3 +444,129 @@ def dump(obj, f):
     string
     """
     f.write(dumps(obj))
+
+def dump_all(objs, f, flush_size=64*1024, compression=None):
+    """
+    Dump all the structs in objs to the specified file, writing them in
+    batches of about ``flush_size`` bytes. See MessageWriter.
+    """
+    with MessageWriter(f, flush_size, compression=compression) as writer:
+        for obj in objs:
+            writer.write(obj)
+
+
+class MessageWriter(object):
+    """
+    Write many messages to the file f, in batches.
+
+    The header, the body and the padding of each message are not
+    concatenated: they are collected in a list which is written by a single
+    f.writelines() as soon as it contains at least ``flush_size`` bytes or
+    ``flush_count`` messages. The bodies are views over the buffers of the
+    structs, so they are never copied, and the headers are packed into a
+    bytearray which is reused by all the batches: f must consume the data
+    before writelines() returns, as files and sockets do. Remember to call
+    flush() or close() at the end, or to use the writer as a context manager.
+
+    If ``compression`` is given, each batch is fed to a compressor before
+    being written, and the compressed stream is terminated by close(): see
+    capnpy.compression.
+    """
+
+    def __init__(self, f, flush_size=64*1024, flush_count=None,
+                 compression=None):
+        self.f = f
+        self.flush_size = flush_size
+        self.flush_count = flush_count
+        self.headers = bytearray(16*256)
+        self.parts = []
+        self.size = 0
+        self.count = 0
+        self.compressor = None
+        if compression is not None:
+            self.compressor = new_compressor(compression)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, evalue, tb):
+        self.close()
+
+    def write(self, obj):
+        if not obj._is_compact():
+            obj = obj.compact()
+        a = obj._get_body_start()
+        b = obj._get_end()
+        p = ptr.new_struct(0, obj._data_size, obj._ptrs_size)
+        padding = (8 - (b-a) % 8) % 8
+        segment_size = (b-a+padding)/8 + 1 # +1 is for the ptr
+        pos = self.count * 16
+        if pos == len(self.headers):
+            # the views of the previous headers see the resized bytearray,
+            # because buffer() does not keep a pointer to the old memory
+            self.headers.extend(self.headers)
+        _HEADER.pack_into(self.headers, pos, 0, segment_size, p)
+        body = obj._buf.read_view(a, b)
+        if isinstance(body, memoryview):
+            # on CPython 2, writelines() does not support memoryviews
+            body = body.tobytes()
+        self.parts.append(buffer(self.headers, pos, 16))
+        self.parts.append(body)
+        if padding:
+            self.parts.append(ZERO_PADDING[:padding])
+        self.size += 16 + b-a + padding
+        self.count += 1
+        if (self.size >= self.flush_size or
+            (self.flush_count is not None and self.count >= self.flush_count)):
+            self.flush()
+
+    def flush(self):
+        """
+        Write all the pending messages
+        """
+        if self.parts:
+            if self.compressor is None:
+                _writelines(self.f, self.parts)
+            else:
+                compress = self.compressor.compress
+                data = ''.join([compress(part) for part in self.parts])
+                if data:
+                    self.f.write(data)
+            self.parts = []
+            self.size = 0
+            self.count = 0
+
+    def close(self):
+        """
+        Write all the pending messages and terminate the compressed stream,
+        if needed. The file is NOT closed.
+        """
+        self.flush()
+        if self.compressor is not None:
+            self.f.write(self.compressor.flush())
+            self.compressor = None
+
+_HEADER = struct.Struct('<iiQ')
+
+def _writelines(f, parts):
+    if isinstance(f, OutputType):
+        # cStringIO.writelines() accepts only strings, but its write()
+        # accepts buffers too
+        for part in parts:
+            f.write(part)
+    else:
+        f.writelines(parts)
+
+def dumps_packed(obj):
+    """
+    Same as dumps(), but encode the message using the standard capnp packing
+    scheme
+    """
+    return pack(dumps(obj))
+
+def dump_packed(obj, f):
+    """
+    Same as dumps_packed, but write to the specified file instead of
+    returning a string
+    """
+    f.write(dumps_packed(obj))
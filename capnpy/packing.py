@@ -0,0 +1,183 @@
+# This is the pure python version. Note that it exists packing.pyx, which is
+# automatically used if you enable cython compilation. The two versions should
+# stay in-sync, as they are supposed to implement the same API. Make sure that
+# every feature you add is tested by test_packing.
+#
+# The packing scheme is described here:
+# https://capnproto.org/encoding.html#packing
+#
+# In short, each word is encoded as a tag byte followed by its non-zero
+# bytes; the i-th bit of the tag is set if the i-th byte of the word is
+# non-zero. Moreover:
+#
+#   - a tag 0x00 is followed by a byte N, which says that N additional
+#     zero-words follow
+#
+#   - a tag 0xff is followed by the 8 bytes of the word plus a byte N; then, N
+#     words follow which are copied verbatim
+
+from capnpy.filelike import FileLike
+
+ZERO_WORD = '\x00' * 8
+
+def pack(s):
+    """
+    Pack the given string, whose length must be a multiple of 8
+    """
+    n = len(s)
+    if n % 8 != 0:
+        raise ValueError("The length of the string to pack must be a multiple "
+                         "of 8, got %d" % n)
+    parts = []
+    i = 0
+    while i < n:
+        word = s[i:i+8]
+        i += 8
+        tag = 0
+        nonzero = []
+        for bit in range(8):
+            if word[bit] != '\x00':
+                tag |= 1 << bit
+                nonzero.append(word[bit])
+        parts.append(chr(tag))
+        parts.extend(nonzero)
+        if tag == 0x00:
+            # count the number of zero-words which follow
+            start = i
+            while i < n and i-start < 255*8 and s[i:i+8] == ZERO_WORD:
+                i += 8
+            parts.append(chr((i-start)/8))
+        elif tag == 0xff:
+            # count the number of words which follow and which have at most a
+            # single zero byte: these are copied verbatim, as it's not worth
+            # to pack them
+            start = i
+            while i < n and i-start < 255*8 and s[i:i+8].count('\x00') < 2:
+                i += 8
+            parts.append(chr((i-start)/8))
+            parts.append(s[start:i])
+    return ''.join(parts)
+
+def unpack(s):
+    """
+    Unpack the whole string s, which must contain a complete packed stream
+    """
+    parts = []
+    n = len(s)
+    i = 0
+    while i < n:
+        tag = ord(s[i])
+        i += 1
+        if tag == 0x00:
+            if i >= n:
+                raise ValueError("Truncated packed data")
+            count = ord(s[i])
+            i += 1
+            parts.append(ZERO_WORD * (count+1))
+        elif tag == 0xff:
+            if i+9 > n:
+                raise ValueError("Truncated packed data")
+            parts.append(s[i:i+8])
+            count = ord(s[i+8])
+            i += 9
+            if i + count*8 > n:
+                raise ValueError("Truncated packed data")
+            parts.append(s[i:i+count*8])
+            i += count*8
+        else:
+            for bit in range(8):
+                if tag & (1 << bit):
+                    if i >= n:
+                        raise ValueError("Truncated packed data")
+                    parts.append(s[i])
+                    i += 1
+                else:
+                    parts.append('\x00')
+    return ''.join(parts)
+
+
+class PackedStream(FileLike):
+    """
+    file-like interface which unpacks the data read from the underlying
+    file-like object f on the fly.
+
+    It reads exactly the bytes needed to satisfy each read() call, so it is
+    possible to create a new PackedStream to load each message from the same
+    file. However, if you want to load many messages it is more efficient to
+    create a PackedStream once and reuse it.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.pending = ''   # already unpacked, but not yet returned
+        self.zeros = 0      # number of zero-words to emit before the next tag
+        self.raw = 0        # number of raw words to copy before the next tag
+
+    def read(self, size=-1):
+        if size == -1:
+            parts = []
+            while True:
+                data = self.read(8192)
+                if not data:
+                    break
+                parts.append(data)
+            return ''.join(parts)
+        #
+        parts = [self.pending]
+        length = len(self.pending)
+        while length < size:
+            words = self._readwords(size-length)
+            if not words:
+                break # EOF
+            parts.append(words)
+            length += len(words)
+        data = ''.join(parts)
+        self.pending = data[size:]
+        return data[:size]
+
+    def _readwords(self, length):
+        """
+        Unpack some words, but not more than needed to have ``length`` bytes.
+        Return '' in case of EOF.
+        """
+        nwords = (length+7) / 8
+        if self.zeros:
+            nwords = min(nwords, self.zeros)
+            self.zeros -= nwords
+            return ZERO_WORD * nwords
+        if self.raw:
+            nwords = min(nwords, self.raw)
+            self.raw -= nwords
+            return self._readexactly(nwords*8)
+        #
+        tagbyte = self.f.read(1)
+        if not tagbyte:
+            return ''
+        tag = ord(tagbyte)
+        if tag == 0x00:
+            self.zeros = ord(self._readexactly(1))
+            return ZERO_WORD
+        elif tag == 0xff:
+            word = self._readexactly(8)
+            self.raw = ord(self._readexactly(1))
+            return word
+        #
+        nonzero = self._readexactly(bin(tag).count('1'))
+        parts = []
+        j = 0
+        for bit in range(8):
+            if tag & (1 << bit):
+                parts.append(nonzero[j])
+                j += 1
+            else:
+                parts.append('\x00')
+        return ''.join(parts)
+
+    def _readexactly(self, size):
+        data = self.f.read(size)
+        if len(data) < size:
+            raise ValueError("Unexpected EOF when unpacking data")
+        return data
+
+    def readline(self):
+        raise NotImplementedError
@@ -0,0 +1,248 @@
+# This is the cython version of packing.py: see there for a description of
+# the packing scheme. The two versions should stay in-sync.
+#
+# Contrarily to the pure python version, unpack() and PackedStream.read()
+# compute the final size in advance and write the unpacked words directly
+# into a single preallocated string.
+
+from libc.string cimport memcpy, memset
+from cpython.string cimport (PyString_GET_SIZE, PyString_AS_STRING,
+                             PyString_FromStringAndSize)
+from capnpy.filelike cimport FileLike, as_filelike
+
+cdef inline int popcount(unsigned char tag):
+    cdef int n = 0
+    while tag:
+        n += tag & 1
+        tag >>= 1
+    return n
+
+cdef inline int count_zero_bytes(const char* word):
+    cdef int i, n = 0
+    for i in range(8):
+        if word[i] == 0:
+            n += 1
+    return n
+
+cdef inline bint is_zero_word(const char* word):
+    return (<const unsigned long long*>word)[0] == 0
+
+cdef inline const char* expand_word(unsigned char tag, const char* src, char* dst):
+    # write the 8 bytes of the word described by tag into dst, reading the
+    # non-zero bytes from src; return the new position of src
+    cdef int bit
+    for bit in range(8):
+        if tag & (1 << bit):
+            dst[bit] = src[0]
+            src += 1
+        else:
+            dst[bit] = 0
+    return src
+
+
+cpdef bytes pack(bytes s):
+    cdef Py_ssize_t n = PyString_GET_SIZE(s)
+    if n % 8 != 0:
+        raise ValueError("The length of the string to pack must be a multiple "
+                         "of 8, got %d" % n)
+    cdef const char* src = PyString_AS_STRING(s)
+    cdef const char* end = src + n
+    cdef const char* start
+    # worst case: every word is encoded as tag + 8 bytes + count
+    cdef bytes out = PyString_FromStringAndSize(NULL, (n/8)*10)
+    cdef char* dst0 = PyString_AS_STRING(out)
+    cdef char* dst = dst0
+    cdef char* tagpos
+    cdef unsigned char tag
+    cdef int bit
+    cdef Py_ssize_t length
+    while src < end:
+        tag = 0
+        tagpos = dst
+        dst += 1
+        for bit in range(8):
+            if src[bit] != 0:
+                tag |= 1 << bit
+                dst[0] = src[bit]
+                dst += 1
+        tagpos[0] = <char>tag
+        src += 8
+        if tag == 0x00:
+            start = src
+            while src < end and src-start < 255*8 and is_zero_word(src):
+                src += 8
+            dst[0] = <char>((src-start)/8)
+            dst += 1
+        elif tag == 0xff:
+            start = src
+            while (src < end and src-start < 255*8 and
+                   count_zero_bytes(src) < 2):
+                src += 8
+            length = src-start
+            dst[0] = <char>(length/8)
+            dst += 1
+            memcpy(dst, start, length)
+            dst += length
+    return out[:dst-dst0]
+
+cdef Py_ssize_t unpacked_length(const char* src, Py_ssize_t n) except -1:
+    cdef const char* end = src + n
+    cdef unsigned char tag
+    cdef Py_ssize_t length = 0
+    cdef Py_ssize_t count
+    while src < end:
+        tag = <unsigned char>src[0]
+        src += 1
+        if tag == 0x00:
+            if src >= end:
+                raise ValueError("Truncated packed data")
+            count = <unsigned char>src[0]
+            src += 1
+            length += (count+1)*8
+        elif tag == 0xff:
+            if src+9 > end:
+                raise ValueError("Truncated packed data")
+            count = <unsigned char>src[8]
+            src += 9 + count*8
+            if src > end:
+                raise ValueError("Truncated packed data")
+            length += (count+1)*8
+        else:
+            src += popcount(tag)
+            if src > end:
+                raise ValueError("Truncated packed data")
+            length += 8
+    return length
+
+cpdef bytes unpack(bytes s):
+    cdef Py_ssize_t n = PyString_GET_SIZE(s)
+    cdef const char* src = PyString_AS_STRING(s)
+    cdef const char* end = src + n
+    cdef Py_ssize_t length = unpacked_length(src, n)
+    cdef bytes out = PyString_FromStringAndSize(NULL, length)
+    cdef char* dst = PyString_AS_STRING(out)
+    cdef unsigned char tag
+    cdef Py_ssize_t count
+    while src < end:
+        tag = <unsigned char>src[0]
+        src += 1
+        if tag == 0x00:
+            count = <unsigned char>src[0]
+            src += 1
+            memset(dst, 0, (count+1)*8)
+            dst += (count+1)*8
+        elif tag == 0xff:
+            count = <unsigned char>src[8]
+            memcpy(dst, src, 8)
+            memcpy(dst+8, src+9, count*8)
+            src += 9 + count*8
+            dst += (count+1)*8
+        else:
+            src = expand_word(tag, src, dst)
+            dst += 8
+    return out
+
+
+cdef class PackedStream(FileLike):
+    cdef readonly FileLike f
+    cdef char pending[8]          # already unpacked, but not yet returned
+    cdef readonly int pending_start
+    cdef readonly int pending_end
+    cdef readonly long zeros      # zero-words to emit before the next tag
+    cdef readonly long raw        # raw words to copy before the next tag
+
+    def __init__(self, f):
+        self.f = as_filelike(f)
+        self.pending_start = 0
+        self.pending_end = 0
+        self.zeros = 0
+        self.raw = 0
+
+    cpdef bytes read(self, int size=-1):
+        cdef list parts
+        cdef bytes data
+        if size == -1:
+            parts = []
+            while True:
+                data = self.read(8192)
+                if not data:
+                    break
+                parts.append(data)
+            return b''.join(parts)
+        #
+        cdef bytes out = PyString_FromStringAndSize(NULL, size)
+        cdef char* dst = PyString_AS_STRING(out)
+        cdef Py_ssize_t length = 0
+        cdef Py_ssize_t n
+        cdef char word[8]
+        #
+        # 1. consume the pending bytes, if any
+        n = min(self.pending_end - self.pending_start, size)
+        memcpy(dst, self.pending + self.pending_start, n)
+        self.pending_start += n
+        length += n
+        #
+        # 2. unpack the full words which fit into out
+        while size - length >= 8:
+            if self.zeros:
+                n = min(self.zeros, (size-length)/8)
+                memset(dst+length, 0, n*8)
+                self.zeros -= n
+                length += n*8
+            elif self.raw:
+                n = min(self.raw, (size-length)/8)
+                data = self._readexactly(n*8)
+                memcpy(dst+length, PyString_AS_STRING(data), n*8)
+                self.raw -= n
+                length += n*8
+            elif not self._readword(dst+length):
+                return out[:length] # EOF
+            else:
+                length += 8
+        #
+        # 3. unpack the last partial word, and keep the rest as pending
+        if length < size:
+            if self.zeros:
+                memset(word, 0, 8)
+                self.zeros -= 1
+            elif self.raw:
+                data = self._readexactly(8)
+                memcpy(word, PyString_AS_STRING(data), 8)
+                self.raw -= 1
+            elif not self._readword(word):
+                return out[:length] # EOF
+            n = size - length
+            memcpy(dst+length, word, n)
+            memcpy(self.pending, word, 8)
+            self.pending_start = n
+            self.pending_end = 8
+        return out
+
+    cdef bint _readword(self, char* dst) except -1:
+        # read a tag and the corresponding word, writing it into dst. Return
+        # False in case of EOF
+        cdef bytes data = self.f.read(1)
+        if PyString_GET_SIZE(data) == 0:
+            return False
+        cdef unsigned char tag = <unsigned char>PyString_AS_STRING(data)[0]
+        if tag == 0x00:
+            memset(dst, 0, 8)
+            data = self._readexactly(1)
+            self.zeros = <unsigned char>PyString_AS_STRING(data)[0]
+        elif tag == 0xff:
+            data = self._readexactly(9)
+            memcpy(dst, PyString_AS_STRING(data), 8)
+            self.raw = <unsigned char>PyString_AS_STRING(data)[8]
+        else:
+            data = self._readexactly(popcount(tag))
+            expand_word(tag, PyString_AS_STRING(data), dst)
+        return True
+
+    cdef bytes _readexactly(self, int size):
+        cdef bytes data = self.f.read(size)
+        if PyString_GET_SIZE(data) < size:
+            raise ValueError("Unexpected EOF when unpacking data")
+        return data
+
+    cpdef bytes readline(self):
+        raise NotImplementedError
@@ -0,0 +1,79 @@
+"""
+Decode a stream of messages in parallel, using multiple processes.
+
+The stream is split at message boundaries into ranges of roughly the same
+size, by reading only the message headers (see capnpy.index). Each worker
+receives only a byte range: it maps the file into memory and decodes the
+messages in its range, so that no struct is ever pickled.
+"""
+
+import bisect
+import multiprocessing
+from capnpy.blob import CapnpBuffer
+from capnpy.index import get_index
+from capnpy.message import _mmap_file, _load_message_from_buffer
+
+# each worker gets this number of ranges, to balance the load in case some
+# ranges are slower than others
+RANGES_PER_WORKER = 4
+
+
+def pmap(func, path, payload_type, workers=None, index=None):
+    """
+    Return the list of ``func(obj)`` for each message of type
+    ``payload_type`` stored in the file at ``path``, in order. The messages
+    are decoded by a pool of ``workers`` processes, by default one per CPU.
+
+    func and payload_type are sent to the workers, so they must be picklable:
+    e.g., func must be defined at module level. Similarly, the results of
+    func are sent back, so you should return plain Python objects instead of
+    capnpy structs.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if index is None:
+        index = get_index(path)
+    ranges = split_ranges(index.offsets, workers*RANGES_PER_WORKER)
+    tasks = [(func, path, payload_type, start, end) for start, end in ranges]
+    if workers == 1:
+        chunks = map(_process_range, tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            chunks = pool.map(_process_range, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    result = []
+    for chunk in chunks:
+        result.extend(chunk)
+    return result
+
+def split_ranges(offsets, n):
+    """
+    Split the messages whose offsets are given into at most n byte ranges
+    (start, end) of roughly the same size, without breaking any message.
+    """
+    first = offsets[0]
+    last = offsets[-1]
+    if first == last:
+        return []
+    boundaries = [first]
+    for k in range(1, n):
+        target = first + (last-first) * k // n
+        i = bisect.bisect_left(offsets, target)
+        if offsets[i] > boundaries[-1]:
+            boundaries.append(offsets[i])
+    if boundaries[-1] != last:
+        boundaries.append(last)
+    return zip(boundaries[:-1], boundaries[1:])
+
+def _process_range(task):
+    func, path, payload_type, start, end = task
+    capnp_buf = CapnpBuffer(_mmap_file(path))
+    result = []
+    offset = start
+    while offset < end:
+        msg, offset = _load_message_from_buffer(capnp_buf, offset)
+        result.append(func(msg._read_struct(0, payload_type)))
+    return result
@@ -109,6 +109,20 @@ class Field:
     def is_nullable(self, m):
         return m.has_annotation(self, annotate.nullable)
 
+    def is_cached(self, m, node):
+        """
+        Return True if the accessor of the field must cache its result, because
+        of a $Py.cached annotation on either the field or the struct
+        """
+        cachable = (self.is_text() or self.is_data() or
+                    self.is_struct() or self.is_list())
+        if m.has_annotation(self, annotate.cached):
+            if not cachable:
+                raise ValueError("Error in $Py.cached: the field '%s' is not "
+                                 "a struct, list, Text or Data" % self.name)
+            return True
+        return cachable and bool(m.has_annotation(node, annotate.cached))
+
     def is_part_of_union(self):
         return self.discriminantValue != Field.noDiscriminant
 
@@ -1,6 +1,7 @@
 import cython
 from capnpy.blob cimport Blob
 from capnpy.visit cimport end_of, is_compact
+from capnpy.unpack cimport pack_struct
 from capnpy cimport ptr
 from capnpy.list cimport List, ItemType
 
@@ -23,6 +24,10 @@ cdef class Struct(Blob):
     cpdef _init_from_pointer(self, object buf, long offset, long p)
     cpdef _read_data(self, long offset, char ifmt)
     cpdef long _read_data_int16(self, long offset)
+    cpdef _write_data(self, long offset, char ifmt, object value)
+
+    @cython.locals(val=long)
+    cpdef _write_bit(self, long offset, long bitmask, bint value)
     cpdef long _read_fast_ptr(self, long offset)
     cpdef long _read_raw_ptr(self, long offset)
     cpdef _read_far_ptr(self, long offset)
@@ -51,3 +56,12 @@ cdef class Struct(Blob):
     cpdef long _get_body_start(self)
     cpdef long _get_end(self)
     cpdef long _is_compact(self)
+    cpdef _reset_cache(self)
+
+
+cdef class ListCursor(object):
+    cdef readonly List lst
+    cdef readonly Struct obj
+    cdef long i
+    cdef long start
+    cdef long stride
@@ -1,9 +1,10 @@
-import struct
 import capnpy
 from capnpy import ptr
-from capnpy.blob import Blob, Types
-from capnpy.visit import end_of, is_compact
+from capnpy.blob import Blob, Types, CapnpBufferWithSegments
+from capnpy.visit import end_of, is_compact, copy_pointer
 from capnpy.list import List
+from capnpy.unpack import pack_struct
+from capnpy import arrays
 
 class Undefined(object):
     def __repr__(self):
@@ -50,8 +51,9 @@ class Struct(Blob):
         self._ptrs_offset = offset + data_size*8
         self._data_size = data_size
         self._ptrs_size = ptrs_size
-        assert self._data_offset + data_size*8 <= len(self._buf.s)
-        assert self._ptrs_offset + ptrs_size*8 <= len(self._buf.s)
+        if not self._buf.trusted:
+            assert self._data_offset + data_size*8 <= len(self._buf.s)
+            assert self._ptrs_offset + ptrs_size*8 <= len(self._buf.s)
 
     def _init_from_pointer(self, buf, offset, p):
         assert ptr.kind(p) == ptr.STRUCT
@@ -70,6 +72,14 @@ class Struct(Blob):
     def from_buffer(cls, buf, offset, data_size, ptrs_size):
         return struct_from_buffer(cls, buf, offset, data_size, ptrs_size)
 
+    @classmethod
+    def numpy_dtype(cls):
+        """
+        Return the numpy structured dtype which matches the layout of the
+        data section: see capnpy.arrays.struct_dtype
+        """
+        return arrays.struct_dtype(cls)
+
     @classmethod
     def load(cls, f):
         return capnpy.message.load(f, cls)
@@ -79,8 +89,21 @@ class Struct(Blob):
         return capnpy.message.loads(s, cls)
 
     @classmethod
-    def load_all(cls, f):
-        return capnpy.message.load_all(f, cls)
+    def load_all(cls, f, compression=None, chunk_size=None):
+        return capnpy.message.load_all(f, cls, chunk_size=chunk_size,
+                                       compression=compression)
+
+    @classmethod
+    def load_packed(cls, f):
+        return capnpy.message.load_packed(f, cls)
+
+    @classmethod
+    def loads_packed(cls, s):
+        return capnpy.message.loads_packed(s, cls)
+
+    @classmethod
+    def load_all_packed(cls, f):
+        return capnpy.message.load_all_packed(f, cls)
 
     def dumps(self):
         return capnpy.message.dumps(self)
@@ -88,6 +111,12 @@ class Struct(Blob):
     def dump(self, f):
         capnpy.message.dump(self, f)
 
+    def dumps_packed(self):
+        return capnpy.message.dumps_packed(self)
+
+    def dump_packed(self, f):
+        capnpy.message.dump_packed(self, f)
+
     def shortrepr(self):
         return '(no shortrepr)'
 
@@ -145,6 +174,21 @@ class Struct(Blob):
         val = self._read_data(offset, Types.int16.ifmt)
         return enumtype(val)
 
+    def _write_data(self, offset, ifmt, value):
+        if offset >= self._data_size*8:
+            # the object comes from an older schema, there is no room for
+            # the field
+            raise IndexError('Offset out of bounds: %d' % offset)
+        self._buf.write_primitive(self._data_offset+offset, ifmt, value)
+
+    def _write_bit(self, offset, bitmask, value):
+        val = self._read_data(offset, Types.uint8.ifmt)
+        if value:
+            val |= bitmask
+        else:
+            val &= ~bitmask
+        self._write_data(offset, Types.uint8.ifmt, val)
+
     def _read_struct(self, offset, structcls):
         """
         Read and dereference a struct pointer at the given offset.  It returns an
@@ -234,6 +278,9 @@ class Struct(Blob):
         return end_of(self._buf, p, self._data_offset-8)
 
     def _is_compact(self):
+        if isinstance(self._buf, CapnpBufferWithSegments):
+            # the object might contain far pointers, which are never compact
+            return False
         p = ptr.new_struct(0, self._data_size, self._ptrs_size)
         return is_compact(self._buf, p, self._data_offset-8)
 
@@ -243,11 +290,14 @@ class Struct(Blob):
         specified offset, in words. The ptrs in the body will be adjusted
         accordingly.
         """
+        if isinstance(self._buf, CapnpBufferWithSegments):
+            # the logic below does not handle far pointers
+            return self.compact()._split(extra_offset)
         body_start = self._get_body_start()
         body_end = self._get_body_end()
         if self._ptrs_size == 0:
             # easy case, just copy the body
-            return self._buf.s[body_start:body_end], ''
+            return self._buf.read_slice(body_start, body_end), ''
         #
         # hard case. The layout of self._buf is like this:
         # +----------+------+------+----------+-------------+
@@ -258,44 +308,18 @@ class Struct(Blob):
         #                        |                   |
         #                        +-------------------+
         #
-        # We recompute the pointers assumining len(garbage1) == extra_offset
-        #
-        # 1) the data section is copied verbatim
-        # 2) the offset of pointers in ptrs are adjusted
-        # 3) extra is copied verbatim
+        # We recompute the pointers assumining len(garbage1) == extra_offset:
+        # the data section and the ptrs are copied by pack_struct, which
+        # adjusts the offset of each ptr by additional_offset.
         #
+        # NOTE: ptr.offset is in words, extra_start and body_end in bytes
         extra_start = self._get_extra_start()
         extra_end = self._get_end()
-        #
-        # 1) data section
-        data_size = self._data_size
-        data_buf = self._buf.s[body_start:body_start+data_size*8]
-        #
-        # 2) ptrs section
-        #    for each ptr:
-        #        ptr.offset += (extra_offset - old_extra_offset)/8
-        #
-        # NOTE: ptr.offset is in words, extra_start and body_end in bytes
         old_extra_offset = (extra_start - body_end)/8
         additional_offset = extra_offset - old_extra_offset
-        #
-        # iterate over and fix the pointers
-        parts = [data_buf]
-        for j in range(self._ptrs_size):
-            # read pointer, update its offset, and pack it
-            p = self._read_raw_ptr(j*8)
-            if p != 0:
-                assert ptr.kind(p) != ptr.FAR
-                p = ptr.new_generic(ptr.kind(p),
-                                    ptr.offset(p)+additional_offset,
-                                    ptr.extra(p))
-            s = struct.pack('q', p)
-            parts.append(s)
-        #
-        body_buf = ''.join(parts)
-        # 3) extra part
-        extra_buf = self._buf.s[extra_start:extra_end]
-        #
+        body_buf = pack_struct(self._buf.s, body_start, self._data_size,
+                               self._ptrs_size, additional_offset, 0, 0)
+        extra_buf = self._buf.read_slice(extra_start, extra_end)
         return body_buf, extra_buf
 
     def compact(self):
@@ -303,10 +327,50 @@ class Struct(Blob):
         Return a compact version of the object, removing the garbage around the
         body and the extra parts.
         """
-        body, extra = self._split(0)
-        buf = body+extra
+        if isinstance(self._buf, CapnpBufferWithSegments):
+            # make a deep copy which follows the far pointers
+            out = bytearray()
+            p = ptr.new_struct(0, self._data_size, self._ptrs_size)
+            copy_pointer(self._buf, p, self._data_offset-8, out, -8)
+            return self.__class__.from_buffer(str(out), 0, self._data_size,
+                                              self._ptrs_size)
+        # body and extra are written into a single string, which is
+        # allocated only once: see _split for the layout
+        body_start = self._get_body_start()
+        body_end = self._get_body_end()
+        extra_start = self._get_extra_start()
+        extra_end = self._get_end()
+        buf = pack_struct(self._buf.s, body_start, self._data_size,
+                          self._ptrs_size, (body_end - extra_start)/8,
+                          extra_start, extra_end)
         return self.__class__.from_buffer(buf, 0, self._data_size, self._ptrs_size)
 
+    def _compact_with_layout(self, data_size, ptrs_size):
+        """
+        Return the compact buffer of the object, laid out as if it had the
+        given data_size and ptrs_size. The fields which do not fit are
+        dropped, the missing ones are zeroed. Used by the generated replace().
+        """
+        buf = self.compact()._buf.s
+        if self._data_size == data_size and self._ptrs_size == ptrs_size:
+            return buf
+        old_data_size = self._data_size * 8
+        new_data_size = data_size * 8
+        data = buf[:min(old_data_size, new_data_size)]
+        data += '\x00' * (new_data_size - len(data))
+        # the extra part does not move, but there is a different number of
+        # words between each pointer and the end of the body
+        n = min(self._ptrs_size, ptrs_size)
+        ptrs = pack_struct(buf, old_data_size, 0, n,
+                           ptrs_size - self._ptrs_size, 0, 0)
+        ptrs += '\x00' * ((ptrs_size - n) * 8)
+        extra = buf[(self._data_size + self._ptrs_size) * 8:]
+        return data + ptrs + extra
+
+    def _reset_cache(self):
+        # overridden by the generated classes which have $Py.cached fields
+        pass
+
 
     # ----------------------
     # hashing and equality
@@ -334,3 +398,48 @@ class Struct(Blob):
     # redeclare it here, Cython won't use it
     def __richcmp__(self, other, op):
         return self._richcmp(other, op)
+
+
+class ListCursor(object):
+    """
+    Iterator returned by List.cursor(): it yields always the same struct
+    object, which is re-pointed to the next item at each step.
+    """
+
+    def __init__(self, lst):
+        structcls = lst._item_type.structcls
+        self.lst = lst
+        self.i = 0
+        self.obj = structcls.__new__(structcls)
+        self.obj._init_blob(lst._buf)
+        self.obj._data_size = ptr.struct_data_size(lst._tag)
+        self.obj._ptrs_size = ptr.struct_ptrs_size(lst._tag)
+        self.start = lst._get_start()
+        self.stride = lst._get_stride()
+        if not lst._buf.trusted and lst._item_count > 0:
+            # check the bounds once for all the items, instead of once per
+            # item as Struct._init_from_buffer does
+            last = self.start + (lst._item_count-1) * self.stride
+            end = max(self.start, last) + lst._item_length
+            assert min(self.start, last) >= 0
+            assert end <= len(lst._buf.s)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.i >= self.lst._item_count:
+            raise StopIteration
+        self.obj._data_offset = self.start + self.i * self.stride
+        self.obj._ptrs_offset = self.obj._data_offset + self.obj._data_size*8
+        self.obj._reset_cache()
+        self.i += 1
+        return self.obj
+
+# Python 2 calls next(), while Cython maps __next__ to the C-level slot. As
+# for the comparison methods in blob.py, the assignment fails if ListCursor
+# has been compiled by Cython
+try:
+    ListCursor.next = ListCursor.__dict__['__next__']
+except TypeError:
+    pass
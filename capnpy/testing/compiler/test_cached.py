@@ -0,0 +1,131 @@
+import py
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestCached(CompilerTest):
+
+    def test_cached_fields(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            p @0 :Point $Py.cached;
+            items @1 :List(Int64) $Py.cached;
+            name @2 :Text $Py.cached;
+            data @3 :Data $Py.cached;
+            q @4 :Point;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(p=mod.Point(1, 2), items=[1, 2, 3], name='foo',
+                      data='bar', q=mod.Point(3, 4))
+        assert foo.p.x == 1
+        assert foo.p is foo.p
+        assert foo.get_p() is foo.p
+        assert foo.items == [1, 2, 3]
+        assert foo.items is foo.items
+        assert foo.name == 'foo'
+        assert foo.name is foo.name
+        assert foo.data == 'bar'
+        assert foo.data is foo.data
+        # q is not cached
+        assert foo.q.x == 3
+        assert foo.q is not foo.q
+        #
+        # the cache is per-instance
+        foo2 = mod.Foo.loads(foo.dumps())
+        assert foo2.p is not foo.p
+        assert foo2.p.x == 1
+
+    def test_null(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            p @0 :Point $Py.cached;
+            name @1 :Text $Py.cached;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(p=None, name=None)
+        assert foo.p is None
+        assert foo.p is None
+        assert foo.name is None
+        assert not foo.has_p()
+
+    def test_cached_struct(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo $Py.cached {
+            x @0 :Int64;
+            p @1 :Point;
+            name @2 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(x=42, p=mod.Point(1, 2), name='foo')
+        assert foo.x == 42
+        assert foo.p is foo.p
+        assert foo.name is foo.name
+        assert foo.shortrepr() == '(x = 42, p = (x = 1, y = 2), name = "foo")'
+
+    def test_union(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Foo {
+            union {
+                name @0 :Text $Py.cached;
+                id @1 :Int64;
+            }
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo.new_name('foo')
+        assert foo.name is foo.name
+        assert foo.name == 'foo'
+        foo = mod.Foo.new_id(42)
+        assert foo.is_id()
+        assert foo.id == 42
+
+    def test_not_a_pointer(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Foo {
+            x @0 :Int64 $Py.cached;
+        }
+        """
+        exc = py.test.raises(ValueError, "self.compile(schema)")
+        assert str(exc.value) == ("Error in $Py.cached: the field 'x' is not "
+                                  "a struct, list, Text or Data")
+
+    def test_cursor(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Person {
+            name @0 :Text $Py.cached;
+            age @1 :Int64;
+        }
+        struct Foo {
+            people @0 :List(Person);
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo([mod.Person('a', 1), mod.Person('b', 2),
+                       mod.Person('c', 3)])
+        names = [p.name for p in foo.people.cursor()]
+        assert names == ['a', 'b', 'c']
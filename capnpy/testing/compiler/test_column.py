@@ -0,0 +1,227 @@
+import py
+from capnpy import arrays
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestColumn(CompilerTest):
+
+    SCHEMA = """
+    @0xbf5147cbbecf40c1;
+    enum Color {
+        red @0;
+        green @1;
+    }
+    struct Point {
+        x @0 :Int64;
+        y @1 :Float32;
+        flag @2 :Bool;
+        color @3 :Color;
+        name @4 :Text;
+        z @5 :Int16 = 42;
+        other @6 :Bool = true;
+    }
+    struct Foo {
+        points @0 :List(Point);
+        items @1 :List(Int64);
+    }
+    """
+
+    def make_foo(self, mod):
+        points = [mod.Point(x=i, y=i*0.5, flag=(i % 2 == 0),
+                            color=mod.Color.green, name='p%d' % i,
+                            z=i, other=(i < 2))
+                  for i in range(4)]
+        return mod.Foo(points=points, items=[1, 2])
+
+    def test_column(self):
+        numpy = py.test.importorskip('numpy')
+        mod = self.compile(self.SCHEMA)
+        foo = self.make_foo(mod)
+        points = foo.points
+        x = points.column('x')
+        assert x.dtype == numpy.dtype('<i8')
+        assert list(x) == [0, 1, 2, 3]
+        # no copy: the array is a strided view on the buffer
+        assert x.base is not None
+        assert x.strides == (points._item_length,)
+        assert list(points.column('y')) == [0, 0.5, 1.0, 1.5]
+        assert list(points.column('flag')) == [True, False, True, False]
+        assert list(points.column('color')) == [1, 1, 1, 1]
+        # fields with explicit defaults
+        assert list(points.column('z')) == [0, 1, 2, 3]
+        assert list(points.column('other')) == [True, True, False, False]
+
+    def test_column_without_numpy(self, monkeypatch):
+        monkeypatch.setattr(arrays, 'get_numpy', lambda: None)
+        mod = self.compile(self.SCHEMA)
+        foo = self.make_foo(mod)
+        points = foo.points
+        assert list(points.column('x')) == [0, 1, 2, 3]
+        assert list(points.column('y')) == [0, 0.5, 1.0, 1.5]
+        assert list(points.column('flag')) == [1, 0, 1, 0]
+        assert list(points.column('z')) == [0, 1, 2, 3]
+        assert list(points.column('other')) == [1, 1, 0, 0]
+
+    def test_column_of_slice(self):
+        mod = self.compile(self.SCHEMA)
+        foo = self.make_foo(mod)
+        points = foo.points[::-2]
+        assert list(points.column('x')) == [3, 1]
+        assert list(points.column('y')) == [1.5, 0.5]
+        assert list(points.column('flag')) == [False, False]
+        assert list(points.column('z')) == [3, 1]
+        assert list(foo.points[1:3].column('other')) == [True, False]
+
+    def test_errors(self):
+        mod = self.compile(self.SCHEMA)
+        foo = self.make_foo(mod)
+        py.test.raises(ValueError, "foo.points.column('name')")
+        py.test.raises(ValueError, "foo.points.column('nonexistent')")
+        py.test.raises(TypeError, "foo.items.column('x')")
+
+    def test_older_schema(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Old {
+            x @0 :Int64;
+            a @1 :Int64;
+        }
+        struct New {
+            x @0 :Int64;
+            a @1 :Int64;
+            y @2 :Int64 = 42;
+            flag @3 :Bool = true;
+        }
+        struct OldFoo {
+            items @0 :List(Old);
+        }
+        struct NewFoo {
+            items @0 :List(New);
+        }
+        """
+        mod = self.compile(schema)
+        old = mod.OldFoo(items=[mod.Old(1, 0), mod.Old(2, 0)])
+        new = mod.NewFoo.loads(old.dumps())
+        assert list(new.items.column('x')) == [1, 2]
+        assert list(new.items.column('y')) == [42, 42]
+        assert list(new.items.column('flag')) == [True, True]
+
+    def test_union(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Shape {
+          area @0 :Int64;
+          union {
+            circle @1 :Int64;
+            square @2 :Int64;
+          }
+        }
+        """
+        mod = self.compile(schema)
+        assert mod.Shape.__data_layout__ == {'area': ('q', 0, 0)}
+
+
+class TestAsRecords(CompilerTest):
+
+    def test_dtype(self):
+        numpy = py.test.importorskip('numpy')
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Point {
+            x @0 :Int32;
+            flag @1 :Bool;
+            color @2 :Color;
+            y @3 :Float64;
+            name @4 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        dtype = mod.Point.numpy_dtype()
+        assert dtype.names == ('x', 'color', 'y')
+        assert dtype.fields['x'] == (numpy.dtype('<i4'), 0)
+        assert dtype.fields['color'] == (numpy.dtype('<i2'), 6)
+        assert dtype.fields['y'] == (numpy.dtype('<f8'), 8)
+        assert dtype.itemsize == 16
+        assert mod.Point.numpy_dtype() is dtype
+
+    def test_as_records(self):
+        py.test.importorskip('numpy')
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Float64;
+            name @2 :Text;
+        }
+        struct Foo {
+            points @0 :List(Point);
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo([mod.Point(1, 2.5, 'a'), mod.Point(3, 4.5, 'b')])
+        records = foo.points.as_records()
+        assert len(records) == 2
+        assert list(records['x']) == [1, 3]
+        assert list(records['y']) == [2.5, 4.5]
+        assert records[1]['x'] == 3
+        # no copy
+        assert records.strides == (foo.points._item_length,)
+        assert not records.flags.writeable
+        #
+        records = foo.points[::-1].as_records()
+        assert list(records['x']) == [3, 1]
+        assert records.strides == (-foo.points._item_length,)
+        #
+        foo = mod.Foo.loads(bytearray(foo.dumps()))
+        records = foo.points.as_records()
+        records['x'] += 10
+        assert [p.x for p in foo.points] == [11, 13]
+
+    def test_as_records_copy(self):
+        py.test.importorskip('numpy')
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Old {
+            x @0 :Int64;
+            a @1 :Int64;
+        }
+        struct New {
+            x @0 :Int64;
+            a @1 :Int64;
+            y @2 :Int64 = 42;
+        }
+        struct OldFoo {
+            items @0 :List(Old);
+        }
+        struct NewFoo {
+            items @0 :List(New);
+        }
+        """
+        mod = self.compile(schema)
+        new = mod.NewFoo([mod.New(1, 2, 3), mod.New(4, 5, 6)])
+        records = new.items.as_records()
+        assert list(records['y']) == [3, 6]
+        assert records.flags.owndata
+        #
+        old = mod.OldFoo(items=[mod.Old(1, 2), mod.Old(3, 4)])
+        new = mod.NewFoo.loads(old.dumps())
+        records = new.items.as_records()
+        assert list(records['x']) == [1, 3]
+        assert list(records['y']) == [42, 42]
+
+    def test_errors(self, monkeypatch):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            items @0 :List(Int64);
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo([1, 2])
+        py.test.raises(TypeError, "foo.items.as_records()")
+        monkeypatch.setattr(arrays, 'get_numpy', lambda: None)
+        monkeypatch.setattr(arrays, '_dtypes', {})
+        py.test.raises(ValueError, "mod.Foo.numpy_dtype()")
@@ -0,0 +1,151 @@
+import py
+from cStringIO import StringIO
+import capnpy
+from capnpy import arrays
+from capnpy.columnar import to_columns
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestToColumns(CompilerTest):
+
+    SCHEMA = """
+    @0xbf5147cbbecf40c1;
+    enum Color {
+        red @0;
+        green @1;
+    }
+    struct Point {
+        x @0 :Int64;
+        y @1 :Float64;
+        flag @2 :Bool;
+        color @3 :Color;
+        name @4 :Text;
+        data @5 :Data;
+        z @6 :Int16 = 42;
+        other @7 :Bool = true;
+        items @8 :List(Int64);
+    }
+    """
+
+    def write_points(self, mod, n):
+        points = []
+        for i in range(n):
+            p = mod.Point(x=i, y=i*0.5, flag=(i % 2 == 0),
+                          color=mod.Color.green, name='p%d' % i, data=None,
+                          z=i, other=(i < 2))
+            points.append(p)
+        f = StringIO()
+        capnpy.dump_all(points, f)
+        return f.getvalue()
+
+    def test_to_columns(self):
+        numpy = py.test.importorskip('numpy')
+        mod = self.compile(self.SCHEMA)
+        buf = self.write_points(mod, 5)
+        fields = ['x', 'y', 'flag', 'color', 'name', 'data', 'z', 'other']
+        batches = list(to_columns(StringIO(buf), mod.Point, fields,
+                                  batch_size=3))
+        assert len(batches) == 2
+        b1, b2 = batches
+        assert sorted(b1) == sorted(fields)
+        assert b1['x'].dtype == numpy.dtype('<i8')
+        assert list(b1['x']) == [0, 1, 2]
+        assert list(b2['x']) == [3, 4]
+        assert list(b1['y']) == [0, 0.5, 1.0]
+        assert list(b1['flag']) == [True, False, True]
+        assert list(b1['color']) == [1, 1, 1]
+        assert b1['name'] == ['p0', 'p1', 'p2']
+        assert b2['name'] == ['p3', 'p4']
+        assert b1['data'] == [None, None, None]
+        assert list(b1['z']) == [0, 1, 2]
+        assert list(b1['other']) == [True, True, False]
+        assert list(b2['other']) == [False, False]
+
+    def test_without_numpy(self, monkeypatch):
+        monkeypatch.setattr(arrays, 'get_numpy', lambda: None)
+        mod = self.compile(self.SCHEMA)
+        buf = self.write_points(mod, 3)
+        batch, = to_columns(StringIO(buf), mod.Point, ['x', 'y', 'flag', 'z'])
+        assert batch['x'].typecode == 'l'
+        assert list(batch['x']) == [0, 1, 2]
+        assert list(batch['y']) == [0, 0.5, 1.0]
+        assert list(batch['flag']) == [1, 0, 1]
+        assert list(batch['z']) == [0, 1, 2]
+
+    def test_path_and_compression(self, tmpdir):
+        mod = self.compile(self.SCHEMA)
+        points = [mod.Point(x=i, name='p%d' % i) for i in range(10)]
+        path = tmpdir.join('points.bin')
+        with path.open('wb') as f:
+            capnpy.dump_all(points, f, compression='zlib')
+        batches = list(to_columns(str(path), mod.Point, ['x', 'name'],
+                                  batch_size=4, chunk_size=16,
+                                  compression='zlib'))
+        assert [list(b['x']) for b in batches] == [[0, 1, 2, 3],
+                                                   [4, 5, 6, 7],
+                                                   [8, 9]]
+        assert batches[2]['name'] == ['p8', 'p9']
+
+    def test_chunk_boundaries(self):
+        mod = self.compile(self.SCHEMA)
+        buf = self.write_points(mod, 3)
+        for chunk_size in (1, 7, 16, 100):
+            batch, = to_columns(StringIO(buf), mod.Point, ['x', 'name'],
+                                chunk_size=chunk_size)
+            assert list(batch['x']) == [0, 1, 2]
+            assert batch['name'] == ['p0', 'p1', 'p2']
+
+    def test_older_schema(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Old {
+            x @0 :Int64;
+            w @1 :Float64;
+        }
+        struct New {
+            x @0 :Int64;
+            w @1 :Float64 = 1.5;
+            y @2 :Int64 = 42;
+            flag @3 :Bool = true;
+            name @4 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        f = StringIO()
+        capnpy.dump_all([mod.Old(x=1, w=0), mod.Old(x=2, w=1.5)], f)
+        batch, = to_columns(StringIO(f.getvalue()), mod.New,
+                            ['x', 'w', 'y', 'flag', 'name'])
+        assert list(batch['x']) == [1, 2]
+        # the values of w are XORed with the default
+        assert list(batch['w']) == [1.5, 0]
+        assert list(batch['y']) == [42, 42]
+        assert list(batch['flag']) == [True, True]
+        assert batch['name'] == [None, None]
+
+    def test_multiple_segments(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            name @1 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        two_segments = ('\x01\x00\x00\x00'                   # 2 segments
+                        '\x01\x00\x00\x00'                   # size 1 word
+                        '\x04\x00\x00\x00'                   # size 4 words
+                        '\x00\x00\x00\x00'                   # padding
+                        '\x02\x00\x00\x00\x01\x00\x00\x00'   # far ptr to segment 1
+                        '\x00\x00\x00\x00\x01\x00\x01\x00'   # landing pad: ptr to payload
+                        '\x03\x00\x00\x00\x00\x00\x00\x00'   # x == 3
+                        '\x01\x00\x00\x00\x22\x00\x00\x00'   # name: ptr to text
+                        'bar\x00\x00\x00\x00\x00')
+        buf = mod.Point(x=1, name='foo').dumps() + two_segments
+        batch, = to_columns(StringIO(buf), mod.Point, ['x', 'name'])
+        assert list(batch['x']) == [1, 3]
+        assert batch['name'] == ['foo', 'bar']
+
+    def test_errors(self):
+        mod = self.compile(self.SCHEMA)
+        buf = self.write_points(mod, 1)
+        py.test.raises(ValueError, "list(to_columns(StringIO(buf), mod.Point, ['items']))")
+        py.test.raises(ValueError, "list(to_columns(StringIO(buf), mod.Point, ['nonexistent']))")
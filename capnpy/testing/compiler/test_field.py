@@ -463,6 +463,9 @@ class TestList(CompilerTest):
         assert list(flag.stripes) == [0, 1, 2, 3]
         colors = [str(x) for x in flag.stripes]
         assert colors == ['red', 'green', 'blue', 'yellow']
+        stripes = flag.stripes.to_pylist()
+        assert stripes == [0, 1, 2, 3]
+        assert [str(x) for x in stripes] == colors
 
     def test_list_of_bool(self):
         schema = """
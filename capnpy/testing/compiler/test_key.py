@@ -84,6 +84,84 @@ class TestKey(CompilerTest):
         assert hash(p1) == hash(p2) == hash((1, 2, "p1"))
 
 
+    def test_key_all_types(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Point $Py.key("*") {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo $Py.key("*") {
+            f32 @0 :Float32;
+            f64 @1 :Float64;
+            flag @2 :Bool;
+            color @3 :Color;
+            data @4 :Data;
+            p @5 :Point;
+            items @6 :List(Int32);
+            names @7 :List(Text);
+        }
+        """
+        mod = self.compile(schema)
+        foo1 = mod.Foo(f32=0.5, f64=1.5, flag=True, color=mod.Color.green,
+                       data='abc', p=mod.Point(1, 2), items=[1, 2, 3],
+                       names=['a', 'b'])
+        foo2 = mod.Foo.loads(foo1.dumps())
+        assert foo1 == foo2
+        assert hash(foo1) == hash(foo2)
+        assert hash(foo1) == hash((0.5, 1.5, True, 1, 'abc', (1, 2),
+                                   (1, 2, 3), ('a', 'b')))
+        foo3 = mod.Foo(f32=0.5, f64=1.5, flag=True, color=mod.Color.green,
+                       data='abc', p=None, items=None, names=None)
+        assert hash(foo3) == hash((0.5, 1.5, True, 1, 'abc', None, None, None))
+
+    def test_key_defaults(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        enum Color {
+            red @0;
+            green @1;
+            blue @2;
+        }
+        struct Foo $Py.key("*") {
+            x @0 :Int32 = 42;
+            flag @1 :Bool = true;
+            other @2 :Bool;
+            color @3 :Color = green;
+            y @4 :UInt8;
+        }
+        """
+        mod = self.compile(schema)
+        for x, flag, other, color, y in [(42, True, False, 1, 0),
+                                         (1, False, True, 2, 255),
+                                         (-3, True, True, 0, 7)]:
+            foo = mod.Foo(x=x, flag=flag, other=other, color=color, y=y)
+            assert hash(foo) == hash((x, flag, other, color, y))
+            foo2 = mod.Foo.loads(foo.dumps())
+            assert hash(foo2) == hash(foo)
+
+    def test_key_list_of_structs(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo $Py.key("*") {
+            points @0 :List(Point);
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo([mod.Point(1, 2)])
+        py.test.raises(TypeError, "hash(foo)")
+
 
 class TestFashHash(CompilerTest):
 
@@ -139,3 +217,33 @@ class TestFashHash(CompilerTest):
         self.only_fasthash(mod.Person)
         p = mod.Person("mickey", "mouse")
         assert hash(p) == hash(("mickey", "mouse"))
+
+    def test_fasthash_all_types(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Point $Py.key("*") {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo $Py.key("*") {
+            f32 @0 :Float32;
+            f64 @1 :Float64;
+            flag @2 :Bool;
+            color @3 :Color;
+            data @4 :Data;
+            p @5 :Point;
+            items @6 :List(Float64);
+        }
+        """
+        mod = self.compile(schema)
+        self.only_fasthash(mod.Point)
+        self.only_fasthash(mod.Foo)
+        foo = mod.Foo(f32=0.5, f64=1.5, flag=True, color=mod.Color.green,
+                      data='abc', p=mod.Point(1, 2), items=[1.5, 2.5])
+        assert hash(foo) == hash((0.5, 1.5, True, 1, 'abc', (1, 2),
+                                  (1.5, 2.5)))
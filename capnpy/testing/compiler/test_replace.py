@@ -0,0 +1,233 @@
+import py
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestReplace(CompilerTest):
+
+    def test_primitive(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Foo {
+            x @0 :Int64;
+            y @1 :Float64;
+            flag @2 :Bool;
+            other @3 :Bool;
+            color @4 :Color;
+            name @5 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(x=1, y=2.5, flag=True, other=True, color=mod.Color.red,
+                      name='foo')
+        foo2 = foo.replace(x=42, flag=False, color=mod.Color.green)
+        assert foo2.to_tuple() == (42, 2.5, False, True, mod.Color.green, 'foo')
+        assert type(foo2) is mod.Foo
+        # the original object is untouched
+        assert foo.to_tuple() == (1, 2.5, True, True, mod.Color.red, 'foo')
+        # the text is not reallocated: the buffer is a patched copy of the
+        # compact one
+        assert len(foo2._buf.s) == len(foo.compact()._buf.s)
+        foo3 = mod.Foo(x=42, y=2.5, flag=False, other=True,
+                       color=mod.Color.green, name='foo')
+        assert foo2.dumps() == foo3.dumps()
+
+    def test_no_changes(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Int64;
+            name @1 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(x=1, name='foo')
+        foo2 = foo.replace()
+        assert foo2 is not foo
+        assert foo2.to_tuple() == (1, 'foo')
+
+    def test_default(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Int64 = 42;
+            flag @1 :Bool = true;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo()
+        foo2 = foo.replace(x=1, flag=False)
+        assert foo2.to_tuple() == (1, False)
+        assert foo2.replace(flag=True).to_tuple() == (1, True)
+
+    def test_pointers(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            p @0 :Point;
+            items @1 :List(Int64);
+            name @2 :Text;
+            data @3 :Data;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(p=mod.Point(1, 2), items=[1, 2, 3], name='foo',
+                      data='bar')
+        foo2 = foo.replace(name='hello world', p=mod.Point(3, 4))
+        assert foo2.name == 'hello world'
+        assert foo2.p.to_tuple() == (3, 4)
+        assert list(foo2.items) == [1, 2, 3]
+        assert foo2.data == 'bar'
+        # the objects are still laid out in pre-order, without garbage
+        assert foo2._is_compact()
+        #
+        foo3 = foo2.replace(items=None, data=None)
+        assert foo3.items is None
+        assert foo3.data is None
+        assert foo3.name == 'hello world'
+        # the result can be dumped and loaded again
+        foo4 = mod.Foo.loads(foo3.dumps())
+        assert foo4.p.to_tuple() == (3, 4)
+        assert foo4.name == 'hello world'
+        assert foo4.items is None
+
+    def test_nested_pointers(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Person {
+            name @0 :Text;
+            age @1 :Int64;
+        }
+        struct Foo {
+            people @0 :List(Person);
+            name @1 :Text;
+            friends @2 :List(Person);
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(people=[mod.Person('a', 1), mod.Person('b', 2)],
+                      name='foo',
+                      friends=[mod.Person('c', 3)])
+        foo2 = foo.replace(name='a much longer name')
+        assert foo2._is_compact()
+        assert [p.name for p in foo2.people] == ['a', 'b']
+        assert foo2.name == 'a much longer name'
+        assert [(p.name, p.age) for p in foo2.friends] == [('c', 3)]
+        assert foo2.dumps() == mod.Foo(people=[mod.Person('a', 1),
+                                               mod.Person('b', 2)],
+                                       name='a much longer name',
+                                       friends=[mod.Person('c', 3)]).dumps()
+        foo3 = foo2.replace(people=None)
+        assert foo3._is_compact()
+        assert foo3.people is None
+        assert [p.name for p in foo3.friends] == ['c']
+
+    def test_union(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Shape {
+          area @0 :Int64;
+          union {
+            circle @1 :Int64;
+            square @2 :Int64;
+            empty @3 :Void;
+          }
+        }
+        """
+        mod = self.compile(schema)
+        shape = mod.Shape.new_circle(area=1, circle=2)
+        shape2 = shape.replace(area=4)
+        assert shape2.is_circle()
+        assert shape2.circle == 2
+        shape3 = shape.replace(square=3)
+        assert shape3.is_square()
+        assert shape3.square == 3
+        assert shape3.area == 1
+        shape4 = shape.replace(empty=None)
+        assert shape4.is_empty()
+        einfo = py.test.raises(TypeError, "shape.replace(circle=1, square=2)")
+        assert str(einfo.value) == ('got multiple values for the union tag: '
+                                    'circle, square')
+
+    def test_union_pointers(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+          x @0 :Int64;
+          union {
+            name @1 :Text;
+            items @2 :List(Int64);
+          }
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo.new_name(x=1, name='foo')
+        foo2 = foo.replace(items=[1, 2, 3])
+        assert foo2.is_items()
+        assert list(foo2.items) == [1, 2, 3]
+        assert foo2.x == 1
+        assert foo2._is_compact()
+
+    def test_group(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Rectangle {
+            color @0 :Int64;
+            a :group {
+                x @1 :Int64;
+                y @2 :Int64;
+            }
+            b :group {
+                x @3 :Int64;
+                y @4 :Int64;
+            }
+        }
+        """
+        mod = self.compile(schema)
+        r = mod.Rectangle(color=1, a=(2, 3), b=(4, 5))
+        r2 = r.replace(b=(6, 7))
+        assert r2.color == 1
+        assert r2.a.x == 2
+        assert r2.a.y == 3
+        assert r2.b.x == 6
+        assert r2.b.y == 7
+
+    def test_different_layout(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Old {
+            x @0 :Int64;
+            name @1 :Text;
+        }
+        struct New {
+            x @0 :Int64;
+            name @1 :Text;
+            y @2 :Int64;
+            surname @3 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        # an old message read with the new schema: the new fields are added
+        old = mod.Old(x=1, name='foo')
+        new = mod.New.loads(old.dumps())
+        new2 = new.replace(y=2)
+        assert new2._data_size == 2
+        assert new2._ptrs_size == 2
+        assert new2.to_tuple() == (1, 'foo', 2, None)
+        new3 = new.replace(surname='bar')
+        assert new3.to_tuple() == (1, 'foo', 0, 'bar')
+        #
+        # a new message read with the old schema: the unknown fields are
+        # dropped, like the ctor would do
+        new = mod.New(x=1, name='foo', y=2, surname='bar')
+        old = mod.Old.loads(new.dumps())
+        old2 = old.replace(x=3)
+        assert old2._data_size == 1
+        assert old2._ptrs_size == 1
+        assert old2.to_tuple() == (3, 'foo')
@@ -0,0 +1,222 @@
+import py
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestSetters(CompilerTest):
+
+    def writable(self, obj):
+        # return a copy of obj, backed by a bytearray
+        return obj.__class__.loads(bytearray(obj.dumps()))
+
+    def test_primitive(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Foo {
+            a @0 :Int8;
+            b @1 :UInt16;
+            c @2 :Int32;
+            d @3 :UInt64;
+            x @4 :Float32;
+            y @5 :Float64;
+            flag1 @6 :Bool;
+            flag2 @7 :Bool;
+            color @8 :Color;
+            name @9 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        foo = self.writable(mod.Foo(a=1, b=2, c=3, d=4, x=5.5, y=6.5,
+                                    flag1=False, flag2=True,
+                                    color=mod.Color.red, name='foo'))
+        foo.a = -10
+        foo.b = 65535
+        foo.c = 1 << 30
+        foo.d = (1 << 64) - 1
+        foo.x = 0.25
+        foo.y = 1.5
+        foo.flag1 = True
+        foo.flag2 = False
+        foo.color = mod.Color.green
+        assert foo.a == -10
+        assert foo.b == 65535
+        assert foo.c == 1 << 30
+        assert foo.d == (1 << 64) - 1
+        assert foo.x == 0.25
+        assert foo.y == 1.5
+        assert foo.flag1 is True
+        assert foo.flag2 is False
+        assert foo.color == mod.Color.green
+        assert foo.name == 'foo'
+        #
+        # the changes are in the buffer
+        foo2 = mod.Foo.loads(foo.dumps())
+        assert foo2.a == -10
+        assert foo2.flag1 is True
+        assert foo2.color == mod.Color.green
+
+    def test_read_only(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(x=1)
+        py.test.raises(TypeError, "foo.x = 2")
+        assert foo.x == 1
+
+    def test_mmap(self, tmpdir):
+        from capnpy.message import load_mmap
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        fname = tmpdir.join('foo.bin')
+        fname.write(mod.Foo(x=1).dumps(), 'wb')
+        foo = load_mmap(str(fname), mod.Foo, writable=True)
+        foo.x = 42
+        foo._buf.s.flush()
+        assert mod.Foo.loads(fname.read('rb')).x == 42
+        #
+        foo = load_mmap(str(fname), mod.Foo)
+        py.test.raises(TypeError, "foo.x = 43")
+
+    def test_default(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Int64 = 42;
+            flag @1 :Bool = true;
+        }
+        """
+        mod = self.compile(schema)
+        foo = self.writable(mod.Foo())
+        foo.x = 1
+        foo.flag = False
+        assert foo.x == 1
+        assert foo.flag is False
+        foo.x = 42
+        assert foo.x == 42
+        start = foo._data_offset
+        assert foo._buf.s[start:start+8] == '\x00' * 8
+
+    def test_union(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Shape {
+          area @0 :Int64;
+          union {
+            circle @1 :Int64;
+            square @2 :Int64;
+          }
+        }
+        """
+        mod = self.compile(schema)
+        shape = self.writable(mod.Shape.new_square(area=4, square=2))
+        shape.square = 3
+        assert shape.is_square()
+        assert shape.square == 3
+        shape.circle = 5
+        assert shape.is_circle()
+        assert shape.circle == 5
+
+    def test_union_cached(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        using Py = import "/capnpy/annotate.capnp";
+        struct Outer {
+          union {
+            n @0 :Int64;
+            t @1 :Text $Py.cached;
+          }
+        }
+        """
+        mod = self.compile(schema)
+        o = self.writable(mod.Outer.new_t(t='hello'))
+        assert o.t == 'hello'
+        o.n = 5
+        assert o.is_n()
+        # the cached value must not be returned once t is no longer the
+        # active member
+        py.test.raises(ValueError, "o.t")
+
+    def test_group(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Rectangle {
+            a :group {
+                x @0 :Int64;
+                y @1 :Int64;
+            }
+        }
+        """
+        mod = self.compile(schema)
+        rect = self.writable(mod.Rectangle(a=(1, 2)))
+        rect.a.y = 3
+        assert rect.a.y == 3
+        assert rect.a.x == 1
+
+    def test_older_schema(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Old {
+            x @0 :Int64;
+        }
+        struct New {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        old = self.writable(mod.Old(x=1))
+        new = mod.New.loads(old.dumps())
+        new = new.__class__.from_buffer(old._buf.s, old._data_offset, 1, 0)
+        new.x = 2
+        assert new.x == 2
+        py.test.raises(IndexError, "new.y = 3")
+
+    def test_list(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            ints @0 :List(Int16);
+            floats @1 :List(Float64);
+            colors @2 :List(Color);
+            points @3 :List(Point);
+            names @4 :List(Text);
+        }
+        """
+        mod = self.compile(schema)
+        foo = self.writable(mod.Foo(ints=[1, 2, 3], floats=[1.5],
+                                    colors=[mod.Color.red],
+                                    points=[mod.Point(1, 2)],
+                                    names=['a']))
+        foo.ints[0] = 10
+        foo.ints[-1] = 30
+        foo.floats[0] = 2.5
+        foo.colors[0] = mod.Color.green
+        assert list(foo.ints) == [10, 2, 30]
+        assert list(foo.floats) == [2.5]
+        assert list(foo.colors) == [mod.Color.green]
+        py.test.raises(IndexError, "foo.ints[3] = 0")
+        py.test.raises(TypeError, "foo.points[0] = mod.Point(3, 4)")
+        py.test.raises(TypeError, "foo.names[0] = 'b'")
+        #
+        foo = mod.Foo(ints=[1, 2, 3], floats=None, colors=None,
+                      points=None, names=None)
+        py.test.raises(TypeError, "foo.ints[0] = 10")
@@ -0,0 +1,118 @@
+import py
+from capnpy.testing.compiler.support import CompilerTest
+
+class TestToTuple(CompilerTest):
+
+    def test_primitive(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        enum Color {
+            red @0;
+            green @1;
+        }
+        struct Foo {
+            x @0 :Int64;
+            y @1 :Float32;
+            flag @2 :Bool;
+            color @3 :Color;
+            nothing @4 :Void;
+            name @5 :Text;
+            data @6 :Data;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(x=1, y=2.5, flag=True, color=mod.Color.green,
+                      name='foo', data='bar')
+        t = foo.to_tuple()
+        assert t == (1, 2.5, True, mod.Color.green, None, 'foo', 'bar')
+        assert type(t[3]) is mod.Color
+        assert foo.to_dict() == {'x': 1, 'y': 2.5, 'flag': True,
+                                 'color': mod.Color.green, 'nothing': None,
+                                 'name': 'foo', 'data': 'bar'}
+        nt = foo.as_namedtuple()
+        assert nt == t
+        assert nt.x == 1
+        assert nt.name == 'foo'
+        assert type(nt).__name__ == 'Foo'
+
+    def test_default(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            x @0 :Int64 = 42;
+            flag @1 :Bool = true;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo()
+        assert foo.to_tuple() == (42, True)
+        foo = mod.Foo(x=1, flag=False)
+        assert foo.to_tuple() == (1, False)
+
+    def test_pointers(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Point {
+            x @0 :Int64;
+            y @1 :Int64;
+        }
+        struct Foo {
+            p @0 :Point;
+            items @1 :List(Int64);
+            name @2 :Text;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(p=mod.Point(1, 2), items=[1, 2, 3], name=None)
+        p, items, name = foo.to_tuple()
+        assert p.to_tuple() == (1, 2)
+        assert list(items) == [1, 2, 3]
+        assert name is None
+
+    def test_union_and_group(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Shape {
+          area @0 :Int64;
+          union {
+            circle @1 :Int64;
+            square @2 :Int64;
+          }
+          position :group {
+            x @3 :Int64;
+            y @4 :Int64;
+          }
+        }
+        """
+        mod = self.compile(schema)
+        shape = mod.Shape.new_square(area=4, square=2, position=(5, 6))
+        area, circle, square, position = shape.to_tuple()
+        assert (area, circle, square) == (4, None, 2)
+        assert position.to_tuple() == (5, 6)
+        assert shape.to_dict()['square'] == 2
+        assert shape.position.as_namedtuple().y == 6
+
+    def test_empty(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Empty {
+        }
+        """
+        mod = self.compile(schema)
+        e = mod.Empty.from_buffer('', 0, 0, 0)
+        assert e.to_tuple() == ()
+        assert e.to_dict() == {}
+        assert e.as_namedtuple() == ()
+
+    def test_convert_case(self):
+        schema = """
+        @0xbf5147cbbecf40c1;
+        struct Foo {
+            fieldOne @0 :Int64;
+            from @1 :Int64;
+        }
+        """
+        mod = self.compile(schema)
+        foo = mod.Foo(1, 2)
+        assert foo.to_dict() == {'field_one': 1, 'from_': 2}
+        assert foo.as_namedtuple().field_one == 1
@@ -1,5 +1,6 @@
 import py
 import sys
+import struct
 from pypytools import IS_PYPY
 from capnpy import _hash
 
@@ -22,6 +23,12 @@ def test_longhash():
     maxulong = sys.maxint*2 + 1
     assert h(maxulong) == hash(maxulong) == hash(-1)
 
+def test_floathash():
+    h = _hash.floathash
+    for x in (0.0, -0.0, 1.0, -1.0, 0.5, 1e100, -1e-100, 2.0**62,
+              2.0**70, float('inf'), float('-inf'), float('nan')):
+        assert h(x) == hash(x)
+
 def test_strhash():
     expected_hash_empty_string = 0
     if IS_PYPY:
@@ -41,3 +48,21 @@ def test_tuplehash():
     assert h((42,)) == hash((42,))
     assert h((42, 43)) == hash((42, 43))
     assert h((42, 43, 44)) == hash((42, 43, 44))
+
+def test_primitivelisthash():
+    h = _hash.primitivelisthash
+    buf = 'garbage0' + struct.pack('<qqq', 1, -1, 2**62)
+    assert h(buf, 8, 3, ord('q')) == hash((1, -1, 2**62))
+    assert h(buf, 8, 0, ord('q')) == hash(())
+    assert h(buf, 16, 8, ord('B')) == hash((255,)*8)
+    assert h(buf, 16, 8, ord('b')) == hash((-1,)*8)
+    assert h(buf, 16, 4, ord('H')) == hash((65535,)*4)
+    assert h(buf, 16, 2, ord('i')) == hash((-1, -1))
+    assert h(buf, 16, 1, ord('Q')) == hash((2**64-1,))
+    #
+    buf = struct.pack('<ddf', 1.5, 2.0, 0.25)
+    assert h(buf, 0, 2, ord('d')) == hash((1.5, 2.0))
+    assert h(buf, 16, 1, ord('f')) == hash((0.25,))
+    #
+    py.test.raises(IndexError, "h(buf, 0, 3, ord('d'))")
+    py.test.raises(IndexError, "h(buf, -1, 1, ord('d'))")
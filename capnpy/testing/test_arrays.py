@@ -0,0 +1,84 @@
+import py
+import array
+from capnpy import arrays
+
+@py.test.fixture(params=['numpy', 'array'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        py.test.importorskip('numpy')
+    else:
+        monkeypatch.setattr(arrays, 'get_numpy', lambda: None)
+    return request.param
+
+def test_primitive_array(backend):
+    buf = ('garbage!'
+           '\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
+           '\xfe\xff\xff\xff\xff\xff\xff\xff'   # -2
+           '\x03\x00\x00\x00\x00\x00\x00\x00')  # 3
+    a = arrays.primitive_array(buf, 8, 3, 'q')
+    assert list(a) == [1, -2, 3]
+    if backend == 'numpy':
+        assert a.dtype.name == 'int64'
+    else:
+        assert isinstance(a, array.array)
+    #
+    a = arrays.primitive_array(buf, 8, 2, 'h')
+    assert list(a) == [1, 0]
+    a = arrays.primitive_array(buf, 16, 2, 'd')
+    assert a[0] != a[0] # NaN
+    assert list(arrays.primitive_array(buf, 8, 0, 'q')) == []
+
+def test_primitive_array_numpy_view():
+    py.test.importorskip('numpy')
+    buf = bytearray('\x01\x00\x00\x00'
+                    '\x02\x00\x00\x00')
+    a = arrays.primitive_array(buf, 0, 2, 'i')
+    a[1] = 42
+    assert buf[4] == 42
+    #
+    a = arrays.primitive_array(str(buf), 0, 2, 'i')
+    assert not a.flags.writeable
+
+def test_bool_array(backend):
+    buf = ('\x05\x81')
+    a = arrays.bool_array(buf, 0, 10)
+    assert list(a) == [1, 0, 1, 0, 0, 0, 0, 0, 1, 0]
+    if backend == 'numpy':
+        assert a.dtype.name == 'bool'
+    a = arrays.bool_array(buf, 1, 1)
+    assert list(a) == [1]
+    assert list(arrays.bool_array(buf, 0, 0)) == []
+
+def test_strided_array(backend):
+    buf = ('\x01\x00\x00\x00'    # 1
+           '\xff\xff\xff\xff'    # garbage
+           '\x02\x00\x00\x00'    # 2
+           '\xff\xff\xff\xff'    # garbage
+           '\x03\x00\x00\x00')   # 3
+    a = arrays.strided_array(buf, 0, 3, 8, 'i')
+    assert list(a) == [1, 2, 3]
+    a = arrays.strided_array(buf, 0, 3, 8, 'i', default=3)
+    assert list(a) == [2, 1, 0]
+    assert list(arrays.strided_array(buf, 0, 0, 8, 'i')) == []
+
+def test_strided_array_float_default(backend):
+    import struct
+    def bits(x):
+        return struct.unpack('<Q', struct.pack('<d', x))[0]
+    # the values are stored XORed with the default
+    buf = struct.pack('<QQ', 0, bits(2.0) ^ bits(1.5))
+    a = arrays.strided_array(buf, 0, 2, 8, 'd', default=1.5)
+    assert list(a) == [1.5, 2.0]
+
+def test_strided_bool_array(backend):
+    buf = ('\x04\x00'
+           '\x00\x00'
+           '\x04\x00')
+    a = arrays.strided_bool_array(buf, 0, 3, 2, 2)
+    assert list(a) == [1, 0, 1]
+    a = arrays.strided_bool_array(buf, 0, 3, 2, 2, default=True)
+    assert list(a) == [0, 1, 0]
+
+def test_filled_array(backend):
+    assert list(arrays.filled_array(3, 'q', 42)) == [42, 42, 42]
+    assert list(arrays.filled_array(2, '?', True)) == [1, 1]
@@ -74,6 +74,52 @@ def test_CapnpBufferWithSegments_pickle():
     assert buf2.s == 'hello'
     assert buf2.segment_offsets == (1, 2, 3)
 
+def test_CapnpBuffer_memoryview():
+    buf = ('garbage0'
+           'hello capnproto\0') # string
+    p = ptr.new_list(0, ptr.LIST_SIZE_8, 16)
+    b = CapnpBuffer(memoryview(buf))
+    assert b.read_primitive(0, Types.int64.ifmt) == struct.unpack('q', 'garbage0')[0]
+    s = b.read_str(p, 0, "", additional_size=-1)
+    assert s == "hello capnproto"
+    assert type(s) is str
+    assert b.read_slice(0, 8) == 'garbage0'
+    h = b.hash_str(p, 0, 0, additional_size=-1)
+    assert h == hash("hello capnproto")
+
+def test_CapnpBuffer_mmap(tmpdir):
+    import mmap
+    buf = ('\x01\x00\x00\x00\x00\x00\x00\x00'  # 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00') # 2
+    myfile = tmpdir.join('myfile')
+    myfile.write(buf)
+    with myfile.open('rb') as f:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    b = CapnpBuffer(m)
+    assert b.read_primitive(0, Types.int64.ifmt) == 1
+    assert b.read_primitive(8, Types.int64.ifmt) == 2
+    assert b.read_slice(8, 16) == buf[8:]
+    py.test.raises(IndexError, "b.read_primitive(16, Types.int64.ifmt)")
+
+def test_read_view(tmpdir):
+    import mmap
+    buf = 'garbage0' 'hello capnproto\0'
+    myfile = tmpdir.join('myfile')
+    myfile.write(buf)
+    with myfile.open('rb') as f:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    for s in (buf, bytearray(buf), memoryview(buf), m):
+        b = CapnpBuffer(s)
+        view = b.read_view(8, 13)
+        assert str(view) == 'hello' or view.tobytes() == 'hello'
+        assert bytearray(view) == 'hello'
+
+def test_CapnpBuffer_pickle_memoryview():
+    import cPickle as pickle
+    buf = CapnpBuffer(memoryview('hello'))
+    buf2 = pickle.loads(pickle.dumps(buf))
+    assert buf2.s == 'hello'
+
 def test_float64():
     buf = '\x58\x39\xb4\xc8\x76\xbe\xf3\x3f'   # 1.234
     b = CapnpBuffer(buf)
@@ -1,5 +1,5 @@
 import py
-from capnpy.builder import Builder
+from capnpy.builder import Builder, ReplaceBuilder
 from capnpy.blob import Types
 from capnpy.list import List, StructItemType, PrimitiveItemType, TextItemType
 from capnpy.struct_ import Struct
@@ -195,3 +195,40 @@ def test_alloc_list_of_structs_with_pointers():
                     'J' 'o' 'h' 'n' '\x00\x00\x00\x00'    # John
                     'E' 'm' 'i' 'l' 'y' '\x00\x00\x00')   # Emily
     assert buf == expected_buf
+
+
+def test_setbool_clears_the_bit():
+    builder = Builder(1, 0)
+    builder.setbool(0, 3, True)
+    builder.setbool(0, 4, True)
+    builder.setbool(0, 3, False)
+    buf = builder.build()
+    assert buf == '\x10\x00\x00\x00\x00\x00\x00\x00'
+
+
+def test_replace_builder():
+    builder = Builder(1, 3)
+    builder.set(Types.int64.ifmt, 0, 42)
+    builder.alloc_text(8, 'foo')
+    builder.alloc_text(16, 'bar')
+    builder.alloc_text(24, 'baz')
+    orig = builder.build()
+    #
+    # only the data section changes: the buffer is just copied
+    builder = ReplaceBuilder(orig, 1, 3)
+    builder.set(Types.int64.ifmt, 0, 43)
+    assert builder.build() == '\x2b' + orig[1:]
+    #
+    # the new text is put between the old ones, and the null pointer does
+    # not leave any garbage behind
+    builder = ReplaceBuilder(orig, 1, 3)
+    builder.alloc_text(16, 'hello world')
+    builder.alloc_text(24, None)
+    buf = builder.build()
+    assert buf == ('\x2a\x00\x00\x00\x00\x00\x00\x00'    # 42
+                   '\x09\x00\x00\x00\x22\x00\x00\x00'    # ptr to 'foo'
+                   '\x09\x00\x00\x00\x62\x00\x00\x00'    # ptr to 'hello world'
+                   '\x00\x00\x00\x00\x00\x00\x00\x00'    # NULL
+                   'foo\x00\x00\x00\x00\x00'
+                   'hello wo'
+                   'rld\x00\x00\x00\x00\x00')
@@ -0,0 +1,68 @@
+import py
+import zlib
+import bz2
+from cStringIO import StringIO
+from capnpy.compression import (DecompressedStream, new_compressor,
+                                new_decompressor, lzma)
+
+DATA = ''.join(['hello %d ' % i for i in range(10000)])
+
+def compress(data, compression):
+    c = new_compressor(compression)
+    return c.compress(data) + c.flush()
+
+@py.test.fixture(params=['zlib', 'bz2', 'lzma'])
+def compression(request):
+    if request.param == 'lzma' and lzma is None:
+        py.test.skip('lzma not available')
+    return request.param
+
+
+def test_compress(compression):
+    data = compress(DATA, compression)
+    assert len(data) < len(DATA) / 4
+    if compression == 'zlib':
+        assert zlib.decompress(data) == DATA
+    elif compression == 'bz2':
+        assert bz2.decompress(data) == DATA
+
+def test_unknown_compression():
+    py.test.raises(ValueError, "new_compressor('foo')")
+    py.test.raises(ValueError, "new_decompressor('foo')")
+
+def test_read(compression):
+    raw = compress(DATA, compression)
+    for chunk_size in (7, 1000, 64*1024):
+        f = DecompressedStream(StringIO(raw), compression, chunk_size)
+        parts = []
+        while True:
+            data = f.read(100)
+            if not data:
+                break
+            assert len(data) == 100 or len(''.join(parts)) + len(data) == len(DATA)
+            parts.append(data)
+        assert ''.join(parts) == DATA
+
+def test_read_all(compression):
+    raw = compress(DATA, compression)
+    f = DecompressedStream(StringIO(raw), compression)
+    assert f.read(5) == 'hello'
+    assert f.read() == DATA[5:]
+    assert f.read(5) == ''
+
+def test_concatenated_streams(compression):
+    raw = compress('hello ', compression) + compress('world', compression)
+    for chunk_size in range(1, len(raw)+1):
+        f = DecompressedStream(StringIO(raw), compression, chunk_size)
+        assert f.read() == 'hello world'
+
+def test_read_does_not_copy_the_remainder(compression):
+    raw = compress(DATA, compression)
+    f = DecompressedStream(StringIO(raw), compression)
+    assert f.read(5) == 'hello'
+    buf = f.buf
+    assert len(buf) > 1000
+    # the following reads are slices of the same decompressed chunk
+    assert f.read(3) == ' 0 '
+    assert f.read(5) == 'hello'
+    assert f.buf is buf
@@ -0,0 +1,82 @@
+import py
+import struct
+from capnpy.blob import Types
+from capnpy.struct_ import Struct
+from capnpy.message import loads
+from capnpy.incremental import MessageDecoder, MessageEncoder
+
+def make_message(x, y):
+    return ('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
+            '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+            + struct.pack('<qq', x, y))
+
+def get_xy(p):
+    return p._read_data(0, Types.int64.ifmt), p._read_data(8, Types.int64.ifmt)
+
+
+class TestMessageDecoder(object):
+
+    def test_whole_messages(self):
+        dec = MessageDecoder(Struct)
+        res = dec.feed(make_message(1, 2) + make_message(3, 4))
+        assert map(get_xy, res) == [(1, 2), (3, 4)]
+        # the messages share the same buffer
+        assert res[0]._buf is res[1]._buf
+        assert dec.pending() == 0
+        assert dec.feed('') == []
+        dec.close()
+
+    def test_pieces(self):
+        buf = ''.join([make_message(i, i*2) for i in range(5)])
+        for size in (1, 3, 7, 8, 20, 33):
+            dec = MessageDecoder(Struct)
+            res = []
+            for i in range(0, len(buf), size):
+                res += dec.feed(buf[i:i+size])
+            assert map(get_xy, res) == [(i, i*2) for i in range(5)]
+            assert dec.pending() == 0
+            dec.close()
+
+    def test_multiple_segments(self):
+        buf = ('\x01\x00\x00\x00'                     # 2 segments
+               '\x01\x00\x00\x00'                     # size 1 word
+               '\x02\x00\x00\x00'                     # size 2 words
+               '\x00\x00\x00\x00'                     # padding
+               '\x02\x00\x00\x00\x01\x00\x00\x00'     # far ptr to segment 1
+               '\x00\x00\x00\x00\x01\x00\x00\x00'     # landing pad: ptr to payload
+               '\x03\x00\x00\x00\x00\x00\x00\x00')    # x == 3
+        dec = MessageDecoder(Struct)
+        assert dec.feed(buf[:10]) == []
+        assert dec.feed(buf[10:30]) == []
+        [p] = dec.feed(buf[30:])
+        assert p._read_data(0, Types.int64.ifmt) == 3
+
+    def test_incomplete(self):
+        dec = MessageDecoder(Struct)
+        buf = make_message(1, 2)
+        assert dec.feed(buf[:10]) == []
+        assert dec.pending() == 10
+        py.test.raises(ValueError, "dec.close()")
+
+
+class TestMessageEncoder(object):
+
+    def test_write_flush(self):
+        dec = MessageDecoder(Struct)
+        p1, p2 = dec.feed(make_message(1, 2) + make_message(3, 4))
+        enc = MessageEncoder()
+        assert not enc.write(p1)
+        assert not enc.write(p2)
+        assert enc.pending() == 64
+        data = enc.flush()
+        assert data == make_message(1, 2) + make_message(3, 4)
+        assert enc.pending() == 0
+        assert enc.flush() == ''
+
+    def test_high_water(self):
+        p = loads(make_message(1, 2), Struct)
+        enc = MessageEncoder(high_water=64)
+        assert not enc.write(p)
+        assert enc.write(p)
+        enc.flush()
+        assert not enc.write(p)
@@ -0,0 +1,171 @@
+import py
+import os
+from capnpy import index as index_mod
+from capnpy.index import (MessageIndex, build_index, get_index, load_nth,
+                          sidecar_path, IndexedStream)
+from capnpy.message import dumps
+from capnpy.__main__ import main
+from capnpy.testing.compiler.support import CompilerTest
+
+
+class TestIndex(CompilerTest):
+
+    schema = """
+    @0xbf5147cbbecf40c1;
+    using Py = import "/capnpy/annotate.capnp";
+    struct Point $Py.key("x, y") {
+        x @0 :Int64;
+        y @1 :Int64;
+        name @2 :Text;
+    }
+    """
+
+    def write_points(self, points):
+        myfile = self.tmpdir.join('points.bin')
+        myfile.write(''.join([dumps(p) for p in points]), 'wb')
+        return str(myfile)
+
+    def get_points(self, n=10):
+        mod = self.compile(self.schema)
+        # the name makes the messages of different lengths
+        points = [mod.Point(x=i, y=i*2, name='p' * i) for i in range(n)]
+        return mod, points
+
+    def test_build_index(self):
+        mod, points = self.get_points()
+        path = self.write_points(points)
+        index = build_index(path)
+        assert len(index) == 10
+        offset = 0
+        for i, p in enumerate(points):
+            length = len(dumps(p))
+            assert index.get_range(i) == (offset, offset+length)
+            offset += length
+        assert index.get_range(-1) == index.get_range(9)
+        py.test.raises(IndexError, "index.get_range(10)")
+
+    def test_build_index_empty(self):
+        path = self.write_points([])
+        index = build_index(path)
+        assert len(index) == 0
+        assert list(index.offsets) == [0]
+
+    def test_build_index_incomplete_message(self):
+        mod, points = self.get_points(3)
+        myfile = py.path.local(self.write_points(points))
+        complete = myfile.size()
+        myfile.write(dumps(points[0])[:20], 'ab')
+        index = build_index(str(myfile))
+        assert len(index) == 3
+        assert index.offsets[-1] == complete
+
+    def test_write_read(self):
+        mod, points = self.get_points()
+        path = self.write_points(points)
+        index = build_index(path)
+        index.write(sidecar_path(path))
+        index2 = MessageIndex.read(sidecar_path(path))
+        assert index2.offsets == index.offsets
+        #
+        self.tmpdir.join('garbage.idx').write('hello world')
+        py.test.raises(ValueError,
+                       "MessageIndex.read(str(self.tmpdir.join('garbage.idx')))")
+
+    def test_get_index(self):
+        mod, points = self.get_points()
+        path = self.write_points(points[:5])
+        # no sidecar
+        assert len(get_index(path)) == 5
+        #
+        # sidecar, up-to-date
+        build_index(path).write(sidecar_path(path))
+        assert len(get_index(path)) == 5
+        #
+        # the stream grows
+        with open(path, 'ab') as f:
+            for p in points[5:]:
+                f.write(dumps(p))
+        assert get_index(path).offsets == build_index(path).offsets
+        #
+        # the stream is rewritten and it is now smaller than the index
+        self.write_points(points[:2])
+        assert len(get_index(path)) == 2
+        #
+        # the stream is rewritten with the same size, after the sidecar
+        self.write_points(points[5:])
+        old_index = build_index(path)
+        old_index.write(sidecar_path(path))
+        os.utime(sidecar_path(path), (0, 0))
+        self.write_points(points[5:][::-1])
+        index = get_index(path)
+        assert index.offsets != old_index.offsets
+        assert index.offsets == build_index(path).offsets
+
+    def test_mmaps_are_closed(self, monkeypatch):
+        mmaps = []
+        def _mmap_file(path):
+            buf = mmap_file(path)
+            mmaps.append(buf)
+            return buf
+        mmap_file = index_mod._mmap_file
+        monkeypatch.setattr(index_mod, '_mmap_file', _mmap_file)
+        mod, points = self.get_points()
+        path = self.write_points(points[:5])
+        build_index(path).write(sidecar_path(path))
+        with open(path, 'ab') as f:
+            f.write(dumps(points[5]))
+        assert len(get_index(path)) == 6
+        assert len(mmaps) == 2
+        for buf in mmaps:
+            py.test.raises(ValueError, "buf[0]")
+
+    def test_load_nth(self):
+        mod, points = self.get_points()
+        path = self.write_points(points)
+        with open(path, 'rb') as f:
+            p = load_nth(f, 7, mod.Point)
+            assert p == points[7]
+            assert p.name == 'p' * 7
+            p = load_nth(f, 0, mod.Point, index=build_index(path))
+            assert p == points[0]
+
+    def test_IndexedStream(self):
+        mod, points = self.get_points()
+        path = self.write_points(points)
+        with open(path, 'rb') as f:
+            stream = IndexedStream(f, mod.Point)
+            assert len(stream) == 10
+            assert stream[3] == points[3]
+            assert stream[-1] == points[9]
+            assert stream[2:5] == points[2:5]
+            assert stream[8:] == points[8:]
+            assert stream[5:2] == []
+            # all the items of a slice share the same buffer
+            a, b = stream[2:4]
+            assert a._buf is b._buf
+            py.test.raises(ValueError, "stream[::2]")
+
+    def test_bisect(self):
+        mod, points = self.get_points()
+        # keys: (0, 0), (1, 2), (2, 4), ...
+        path = self.write_points(points)
+        with open(path, 'rb') as f:
+            stream = IndexedStream(f, mod.Point)
+            assert stream.bisect_left((3, 6)) == 3
+            assert stream.bisect_right((3, 6)) == 4
+            assert stream.bisect_left((3, 7)) == 4
+            assert stream.bisect_left((-1, 0)) == 0
+            assert stream.bisect_left((100, 0)) == 10
+            assert stream.bisect_left((3, 6), lo=5) == 5
+
+
+def test_main_index(tmpdir):
+    buf = ('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
+           '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+           '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
+    myfile = tmpdir.join('myfile.bin')
+    myfile.write(buf*3, 'wb')
+    main(['index', str(myfile)])
+    index = MessageIndex.read(str(tmpdir.join('myfile.bin.idx')))
+    assert list(index.offsets) == [0, 32, 64, 96]
@@ -1,7 +1,8 @@
 import py
 from capnpy.blob import CapnpBufferWithSegments, Blob, Types
 from capnpy import ptr
-from capnpy.list import List, StructItemType, PrimitiveItemType, TextItemType
+from capnpy.list import (List, StructItemType, PrimitiveItemType, TextItemType,
+                         BoolItemType, VoidItemType)
 from capnpy.struct_ import Struct
 
 def test_read_list():
@@ -75,6 +76,54 @@ def test_list_of_structs():
     #
     py.test.raises(TypeError, "lst == lst")
 
+def test_cursor():
+    # list of Point {x: Int64, y: Int64}
+    buf = ('\x01\x00\x00\x00\x37\x00\x00\x00'    # ptrlist
+           '\x0c\x00\x00\x00\x02\x00\x00\x00'    # list tag
+           '\x0a\x00\x00\x00\x00\x00\x00\x00'    # 10
+           '\x64\x00\x00\x00\x00\x00\x00\x00'    # 100
+           '\x14\x00\x00\x00\x00\x00\x00\x00'    # 20
+           '\xc8\x00\x00\x00\x00\x00\x00\x00'    # 200
+           '\x1e\x00\x00\x00\x00\x00\x00\x00'    # 30
+           '\x2c\x01\x00\x00\x00\x00\x00\x00')   # 300
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    lst = blob._read_list(0, StructItemType(Struct))
+    points = []
+    objs = set()
+    for p in lst.cursor():
+        assert p._data_size == 2
+        assert p._ptrs_size == 0
+        points.append((p._read_data(0, Types.int64.ifmt),
+                       p._read_data(8, Types.int64.ifmt)))
+        objs.add(id(p))
+    assert points == [(10, 100), (20, 200), (30, 300)]
+    # the very same object is re-pointed to each item
+    assert len(objs) == 1
+    #
+    it = lst.cursor()
+    assert iter(it) is it
+    assert next(it)._data_offset == 16
+    assert next(it)._data_offset == 32
+    assert next(it)._data_offset == 48
+    py.test.raises(StopIteration, "next(it)")
+
+def test_cursor_empty():
+    buf = ('\x01\x00\x00\x00\x07\x00\x00\x00'    # ptrlist
+           '\x00\x00\x00\x00\x02\x00\x00\x00')   # list tag
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    lst = blob._read_list(0, StructItemType(Struct))
+    assert list(lst.cursor()) == []
+
+def test_cursor_primitive():
+    buf = ('\x01\x00\x00\x00\x25\x00\x00\x00'   # ptrlist
+           '\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00'   # 2
+           '\x03\x00\x00\x00\x00\x00\x00\x00'   # 3
+           '\x04\x00\x00\x00\x00\x00\x00\x00')  # 4
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    lst = blob._read_list(0, PrimitiveItemType(Types.int64))
+    assert list(lst.cursor()) == [1, 2, 3, 4]
+
 
 def test_string():
     buf = ('\x01\x00\x00\x00\x82\x00\x00\x00'   # ptrlist
@@ -155,6 +204,154 @@ def test_list_comparisons():
     py.test.raises(TypeError, "lst1 >  lst2")
     py.test.raises(TypeError, "lst1 >= lst2")
 
+def test_list_hash():
+    buf1 = ('\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
+            '\x02\x00\x00\x00\x00\x00\x00\x00'   # 2
+            '\x03\x00\x00\x00\x00\x00\x00\x00'   # 3
+            '\x04\x00\x00\x00\x00\x00\x00\x00')  # 4
+    buf2 = 'garbage0' + buf1
+    lst1 = List.from_buffer(buf1, 0, ptr.LIST_SIZE_64, 4, PrimitiveItemType(Types.int64))
+    lst2 = List.from_buffer(buf2, 8, ptr.LIST_SIZE_64, 4, PrimitiveItemType(Types.int64))
+    assert hash(lst1) == hash(lst2) == hash((1, 2, 3, 4))
+    lst3 = List.from_buffer(buf1, 0, ptr.LIST_SIZE_16, 3, PrimitiveItemType(Types.int16))
+    assert hash(lst3) == hash((1, 0, 0))
+    lst4 = List.from_buffer(buf1, 0, ptr.LIST_SIZE_64, 2, PrimitiveItemType(Types.float64))
+    assert hash(lst4) == hash(tuple(lst4))
+    #
+    buf = ('\x01\x00\x00\x00\x16\x00\x00\x00'   # ptrlist
+           '\x05\x00\x00\x00\x12\x00\x00\x00'   # ptr item 1
+           '\x05\x00\x00\x00\x1a\x00\x00\x00'   # ptr item 2
+           'A' '\x00\x00\x00\x00\x00\x00\x00'   # A
+           'B' 'C' '\x00\x00\x00\x00\x00\x00')   # BC
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    lst = blob._read_list(0, TextItemType(Types.text))
+    assert hash(lst) == hash(('A', 'BC'))
+    #
+    lst = List.from_buffer(buf1, 0, ptr.LIST_SIZE_COMPOSITE, 0, StructItemType(Struct))
+    py.test.raises(TypeError, "hash(lst)")
+
+def test_setitem():
+    buf = bytearray('\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
+                    '\x02\x00\x00\x00\x00\x00\x00\x00')  # 2
+    lst = List.from_buffer(buf, 0, ptr.LIST_SIZE_64, 2, PrimitiveItemType(Types.int64))
+    lst[0] = 10
+    lst[-1] = 20
+    assert list(lst) == [10, 20]
+    assert buf[0] == 10
+    py.test.raises(IndexError, "lst[2] = 0")
+    py.test.raises(TypeError, "lst[0:1] = [0]")
+    #
+    bits = List.from_buffer(bytearray('\x05'), 0, ptr.LIST_SIZE_BIT, 3, BoolItemType())
+    assert list(bits) == [True, False, True]
+    bits[0] = False
+    bits[1] = True
+    assert list(bits) == [False, True, True]
+    #
+    lst = List.from_buffer(str(buf), 0, ptr.LIST_SIZE_64, 2, PrimitiveItemType(Types.int64))
+    py.test.raises(TypeError, "lst[0] = 1")
+
+def test_as_array():
+    numpy = py.test.importorskip('numpy')
+    buf = ('\x01\x00\x00\x00\x25\x00\x00\x00'   # ptrlist
+           '\x58\x39\xb4\xc8\x76\xbe\xf3\x3f'   # 1.234
+           '\xc3\xf5\x28\x5c\x8f\xc2\x02\x40'   # 2.345
+           '\xd9\xce\xf7\x53\xe3\xa5\x0b\x40'   # 3.456
+           '\xf8\x53\xe3\xa5\x9b\x44\x12\x40')  # 4.567
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    lst = blob._read_list(0, PrimitiveItemType(Types.float64))
+    a = lst.as_array()
+    assert a.dtype == numpy.dtype('<f8')
+    assert list(a) == [1.234, 2.345, 3.456, 4.567]
+    assert a.sum() == sum(lst)
+    #
+    bits = List.from_buffer('\x05', 0, ptr.LIST_SIZE_BIT, 3, BoolItemType())
+    assert list(bits.as_array()) == [True, False, True]
+    #
+    lst = List.from_buffer(buf, 0, ptr.LIST_SIZE_PTR, 1, TextItemType(Types.text))
+    py.test.raises(TypeError, "lst.as_array()")
+
+def test_as_array_writable():
+    py.test.importorskip('numpy')
+    buf = bytearray('\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
+                    '\x02\x00\x00\x00\x00\x00\x00\x00')  # 2
+    lst = List.from_buffer(buf, 0, ptr.LIST_SIZE_64, 2, PrimitiveItemType(Types.int64))
+    a = lst.as_array()
+    a *= 10
+    assert list(lst) == [10, 20]
+
+def test_as_array_without_numpy(monkeypatch):
+    from capnpy import arrays
+    monkeypatch.setattr(arrays, 'get_numpy', lambda: None)
+    buf = ('\x01\x00\x00\x00'
+           '\x02\x00\x00\x00')
+    lst = List.from_buffer(buf, 0, ptr.LIST_SIZE_32, 2, PrimitiveItemType(Types.int32))
+    a = lst.as_array()
+    assert a.typecode == 'i'
+    assert list(a) == [1, 2]
+
+def test_iter():
+    buf = ('\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00')  # 2
+    lst = List.from_buffer(buf, 0, ptr.LIST_SIZE_64, 2, PrimitiveItemType(Types.int64))
+    it = iter(lst)
+    assert iter(it) is it
+    assert it.__length_hint__() == 2
+    assert next(it) == 1
+    assert next(it) == 2
+    py.test.raises(StopIteration, "next(it)")
+    assert list(lst) == [1, 2]
+
+def test_to_pylist():
+    buf = ('\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00'   # 2
+           '\x03\x00\x00\x00\x00\x00\x00\x00')  # 3
+    lst = List.from_buffer(buf, 0, ptr.LIST_SIZE_64, 3, PrimitiveItemType(Types.int64))
+    assert lst.to_pylist() == [1, 2, 3]
+    lst = List.from_buffer(buf, 0, ptr.LIST_SIZE_32, 4, PrimitiveItemType(Types.int32))
+    assert lst.to_pylist() == [1, 0, 2, 0]
+    lst = List.from_buffer(buf, 0, ptr.LIST_SIZE_64, 0, PrimitiveItemType(Types.int64))
+    assert lst.to_pylist() == []
+    # the items are out of the buffer
+    lst = List.from_buffer(buf, 8, ptr.LIST_SIZE_64, 3, PrimitiveItemType(Types.int64))
+    py.test.raises(IndexError, "lst.to_pylist()")
+    #
+    bits = List.from_buffer('\x05\x01', 0, ptr.LIST_SIZE_BIT, 9, BoolItemType())
+    assert bits.to_pylist() == [True, False, True, False, False,
+                                False, False, False, True]
+    bits = List.from_buffer('\x05', 0, ptr.LIST_SIZE_BIT, 9, BoolItemType())
+    py.test.raises(IndexError, "bits.to_pylist()")
+    #
+    voids = List.from_buffer('', 0, ptr.LIST_SIZE_VOID, 3, VoidItemType())
+    assert voids.to_pylist() == [None, None, None]
+
+def test_to_pylist_strings():
+    buf = ('\x01\x00\x00\x00\x1e\x00\x00\x00'   # ptrlist
+           '\x09\x00\x00\x00\x12\x00\x00\x00'   # ptr item 1
+           '\x00\x00\x00\x00\x00\x00\x00\x00'   # null ptr item 2
+           '\x05\x00\x00\x00\x1a\x00\x00\x00'   # ptr item 3
+           'A' '\x00\x00\x00\x00\x00\x00\x00'   # A
+           'B' 'C' '\x00\x00\x00\x00\x00\x00')   # BC
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    lst = blob._read_list(0, TextItemType(Types.text))
+    assert lst.to_pylist() == ['A', None, 'BC']
+    assert lst.to_pylist() == list(lst)
+
+def test_to_pylist_structs():
+    # list of Point {x: Int64, y: Int64}
+    buf = ('\x01\x00\x00\x00\x27\x00\x00\x00'    # ptrlist
+           '\x08\x00\x00\x00\x02\x00\x00\x00'    # list tag
+           '\x0a\x00\x00\x00\x00\x00\x00\x00'    # 10
+           '\x64\x00\x00\x00\x00\x00\x00\x00'    # 100
+           '\x14\x00\x00\x00\x00\x00\x00\x00'    # 20
+           '\xc8\x00\x00\x00\x00\x00\x00\x00')   # 200
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    lst = blob._read_list(0, StructItemType(Struct))
+    points = lst.to_pylist()
+    assert len(points) == 2
+    assert [p._data_offset for p in points] == [16, 32]
+    assert [(p._data_size, p._ptrs_size) for p in points] == [(2, 0), (2, 0)]
+    assert [p._read_data(8, Types.int64.ifmt) for p in points] == [100, 200]
+
 def test_compare_with_py_list():
     buf = ('\x01\x00\x00\x00\x25\x00\x00\x00'   # ptrlist
            '\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
@@ -211,3 +408,112 @@ class TestPythonicInterface(object):
         assert mylist[3:] == [3, 4]
         assert mylist[:] == [0, 1, 2, 3, 4]
 
+    def test_slice_is_a_view(self, mylist):
+        view = mylist[1:4]
+        assert isinstance(view, List)
+        assert view._buf is mylist._buf
+        assert len(view) == 3
+        assert view[0] == 1
+        assert view[-1] == 3
+        py.test.raises(IndexError, "view[3]")
+        assert list(view) == [1, 2, 3]
+        assert view.to_pylist() == [1, 2, 3]
+        assert hash(view) == hash((1, 2, 3))
+        assert view == mylist[1:4]
+        assert view != mylist[0:3]
+
+    def test_slice_step(self, mylist):
+        assert mylist[::2] == [0, 2, 4]
+        assert mylist[1::2] == [1, 3]
+        assert mylist[::-1] == [4, 3, 2, 1, 0]
+        assert mylist[3:0:-2] == [3, 1]
+        assert mylist[4:0:10] == []
+        assert len(mylist[5:]) == 0
+        assert mylist[::-2].to_pylist() == [4, 2, 0]
+        assert hash(mylist[::2]) == hash((0, 2, 4))
+
+    def test_slice_of_slice(self, mylist):
+        view = mylist[1:][::2]
+        assert view == [1, 3]
+        assert view._start == 1
+        assert view._step == 2
+        assert mylist[::-1][1:3] == [3, 2]
+        assert mylist[::2][::-1] == [4, 2, 0]
+        assert mylist[::-1][::-2][1:] == [2, 4]
+
+    def test_slice_as_array(self, mylist):
+        py.test.importorskip('numpy')
+        assert list(mylist[1:4].as_array()) == [1, 2, 3]
+        a = mylist[::-2].as_array()
+        assert list(a) == [4, 2, 0]
+        assert a.strides == (-16,)
+
+    def test_slice_as_array_without_numpy(self, mylist, monkeypatch):
+        from capnpy import arrays
+        monkeypatch.setattr(arrays, 'get_numpy', lambda: None)
+        assert list(mylist[1:4].as_array()) == [1, 2, 3]
+        assert list(mylist[::-2].as_array()) == [4, 2, 0]
+
+    def test_slice_setitem(self):
+        buf = bytearray('\x01\x00\x00\x00\x00\x00\x00\x00'   # 1
+                        '\x02\x00\x00\x00\x00\x00\x00\x00'   # 2
+                        '\x03\x00\x00\x00\x00\x00\x00\x00')  # 3
+        lst = List.from_buffer(buf, 0, ptr.LIST_SIZE_64, 3, PrimitiveItemType(Types.int64))
+        view = lst[::-2]
+        view[0] = 30
+        view[1] = 10
+        assert list(lst) == [10, 2, 30]
+
+
+def test_slice_bools():
+    bits = List.from_buffer('\x05\x01', 0, ptr.LIST_SIZE_BIT, 9, BoolItemType())
+    items = [True, False, True, False, False, False, False, False, True]
+    for s in (slice(1, None), slice(None, None, 3), slice(None, None, -1),
+              slice(8, 1, -3), slice(5, 5)):
+        view = bits[s]
+        assert list(view) == items[s]
+        assert view.to_pylist() == items[s]
+        assert list(view.as_array()) == items[s]
+    assert bits[1:][::2][::-1] == items[1:][::2][::-1]
+
+def test_slice_strings():
+    buf = ('\x01\x00\x00\x00\x26\x00\x00\x00'   # ptrlist
+           '\x0d\x00\x00\x00\x12\x00\x00\x00'   # ptr item 1
+           '\x0d\x00\x00\x00\x1a\x00\x00\x00'   # ptr item 2
+           '\x0d\x00\x00\x00\x22\x00\x00\x00'   # ptr item 3
+           '\x0d\x00\x00\x00\x2a\x00\x00\x00'   # ptr item 4
+           'A' '\x00\x00\x00\x00\x00\x00\x00'   # A
+           'B' 'C' '\x00\x00\x00\x00\x00\x00'   # BC
+           'D' 'E' 'F' '\x00\x00\x00\x00\x00'   # DEF
+           'G' 'H' 'I' 'J' '\x00\x00\x00\x00')  # GHIJ
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    lst = blob._read_list(0, TextItemType(Types.text))
+    view = lst[1:3]
+    assert list(view) == ['BC', 'DEF']
+    assert view.to_pylist() == ['BC', 'DEF']
+    assert view == ['BC', 'DEF']
+    assert view != lst
+    assert lst[::-2].to_pylist() == ['GHIJ', 'BC']
+    assert hash(view) == hash(('BC', 'DEF'))
+
+def test_slice_structs():
+    # list of Point {x: Int64, y: Int64}
+    buf = ('\x01\x00\x00\x00\x37\x00\x00\x00'    # ptrlist
+           '\x0c\x00\x00\x00\x02\x00\x00\x00'    # list tag
+           '\x0a\x00\x00\x00\x00\x00\x00\x00'    # 10
+           '\x64\x00\x00\x00\x00\x00\x00\x00'    # 100
+           '\x14\x00\x00\x00\x00\x00\x00\x00'    # 20
+           '\xc8\x00\x00\x00\x00\x00\x00\x00'    # 200
+           '\x1e\x00\x00\x00\x00\x00\x00\x00'    # 30
+           '\x2c\x01\x00\x00\x00\x00\x00\x00')   # 300
+    blob = Struct.from_buffer(buf, 0, data_size=0, ptrs_size=1)
+    lst = blob._read_list(0, StructItemType(Struct))
+    def read_x(items):
+        return [p._read_data(0, Types.int64.ifmt) for p in items]
+    assert read_x(lst[1:]) == [20, 30]
+    assert read_x(lst[::-1]) == [30, 20, 10]
+    assert read_x(lst[::-2].to_pylist()) == [30, 10]
+    assert read_x(lst[::-1].cursor()) == [30, 20, 10]
+    assert read_x(lst[:0].cursor()) == []
+    assert lst[2:][0]._data_offset == 48
+
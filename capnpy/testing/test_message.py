@@ -1,6 +1,11 @@
 import py
+import os
 from cStringIO import StringIO
 from capnpy.message import load, loads, load_all, _load_message, dumps
+from capnpy.message import dumps_into, dump_all, MessageWriter
+from capnpy.message import load_mmap, iter_mmap, validate
+from capnpy.message import (load_packed, loads_packed, load_all_packed,
+                            dumps_packed, dump_packed)
 from capnpy.filelike import as_filelike
 from capnpy.blob import Types
 from capnpy.struct_ import Struct
@@ -48,6 +53,118 @@ def test_load_all():
     assert p2._read_data(0, Types.int64.ifmt) == 3
     assert p2._read_data(8, Types.int64.ifmt) == 4
 
+def test_load_all_shared_chunk():
+    f = _get_many_messages()
+    p1, p2 = load_all(f, Struct)
+    # both messages are in the same chunk, so they share the buffer
+    assert p1._buf is p2._buf
+    assert p1._data_offset == 16
+    assert p2._data_offset == 48
+
+def test_load_all_chunk_boundaries():
+    one_segment = ('\x00\x00\x00\x00\x03\x00\x00\x00'   # 1 segment, size 3 words
+                   '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+                   '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+                   '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
+    two_segments = ('\x01\x00\x00\x00'                     # 2 segments
+                    '\x01\x00\x00\x00'                     # size 1 word
+                    '\x02\x00\x00\x00'                     # size 2 words
+                    '\x00\x00\x00\x00'                     # padding
+                    '\x02\x00\x00\x00\x01\x00\x00\x00'   # far ptr to segment 1
+                    '\x00\x00\x00\x00\x01\x00\x00\x00'   # landing pad: ptr to payload
+                    '\x03\x00\x00\x00\x00\x00\x00\x00')  # x == 3
+    buf = one_segment + two_segments + one_segment
+    # try all the possible chunk sizes, so that the chunk boundaries fall
+    # both inside the headers and inside the bodies
+    for chunk_size in range(1, len(buf)+1):
+        messages = list(load_all(StringIO(buf), Struct, chunk_size=chunk_size))
+        assert len(messages) == 3
+        p1, p2, p3 = messages
+        assert p1._read_data(0, Types.int64.ifmt) == 1
+        assert p1._read_data(8, Types.int64.ifmt) == 2
+        assert p2._read_data(0, Types.int64.ifmt) == 3
+        assert p3._read_data(0, Types.int64.ifmt) == 1
+        assert p3._read_data(8, Types.int64.ifmt) == 2
+
+def test_load_all_truncated():
+    buf = ('\x00\x00\x00\x00\x03\x00\x00\x00'   # 1 segment, size 3 words
+           '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+           '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
+    for chunk_size in (4, 16, 1024):
+        # truncated body
+        f = StringIO(buf + buf[:20])
+        py.test.raises(ValueError, "list(load_all(f, Struct, chunk_size))")
+        # truncated header
+        f = StringIO(buf + '\x01\x00\x00\x00\x01\x00')
+        py.test.raises(ValueError, "list(load_all(f, Struct, chunk_size))")
+        # less than 4 bytes of garbage at the end are ignored, like load()
+        # does
+        f = StringIO(buf + '\x01\x00')
+        assert len(list(load_all(f, Struct, chunk_size))) == 1
+
+
+class FakePipe(object):
+    """
+    A non-seekable stream which fails if we try to read more than the
+    available data, which would block in case of real pipes. Reading at EOF
+    returns ''
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def read(self, size=-1):
+        remaining = len(self.buf) - self.pos
+        assert remaining == 0 or 0 <= size <= remaining
+        data = self.buf[self.pos:self.pos+size]
+        self.pos += size
+        return data
+
+    def readline(self):
+        raise NotImplementedError
+
+def test_load_all_pipe():
+    buf = ('\x00\x00\x00\x00\x03\x00\x00\x00'   # 1 segment, size 3 words
+           '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+           '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
+    f = FakePipe(buf*2)
+    messages = load_all(f, Struct)
+    p1 = next(messages)
+    assert p1._read_data(0, Types.int64.ifmt) == 1
+    # we did not read past the first message
+    assert f.pos == len(buf)
+    p2 = next(messages)
+    assert p2._read_data(8, Types.int64.ifmt) == 2
+    assert f.pos == len(buf)*2
+    # with an explicit chunk_size we read in chunks anyway
+    f = FakePipe(buf*2)
+    p1, p2 = load_all(f, Struct, chunk_size=len(buf)*2)
+    assert p1._buf is p2._buf
+    class Point(Struct):
+        pass
+    f = FakePipe(buf*2)
+    p1, p2 = Point.load_all(f, chunk_size=len(buf)*2)
+    assert isinstance(p1, Point)
+    assert p1._buf is p2._buf
+
+def test_can_read_ahead(tmpdir):
+    from capnpy.message import _can_read_ahead
+    assert _can_read_ahead(StringIO('foo'))
+    assert not _can_read_ahead(FakePipe('foo'))
+    myfile = tmpdir.join('myfile')
+    myfile.write('foo')
+    with myfile.open('rb') as f:
+        assert _can_read_ahead(f)
+    r, w = os.pipe()
+    try:
+        with os.fdopen(r, 'rb') as f:
+            assert not _can_read_ahead(f)
+    finally:
+        os.close(w)
+
 
 def test_loads():
     buf = ('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
@@ -69,6 +186,20 @@ def test_loads_not_whole_string():
     exc = py.test.raises(ValueError, "p = loads(buf, Struct)")
     assert exc.value.message == 'Not all bytes were consumed: 8 bytes left'
 
+def test_loads_bytearray():
+    buf = bytearray('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
+                    '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+                    '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+                    '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
+    p = loads(buf, Struct)
+    assert p._buf.s is buf
+    assert p._read_data(0, Types.int64.ifmt) == 1
+    p._write_data(8, Types.int64.ifmt, 42)
+    assert buf[24] == 42
+    #
+    exc = py.test.raises(ValueError, "loads(buf + bytearray(8), Struct)")
+    assert exc.value.message == 'Not all bytes were consumed: 8 bytes left'
+
 def test_truncated_header():
     buf = ('\x03\x00\x00\x00'  # 3+1 segments, but only two are specified
            '\x10\x00\x00\x00'  # size0: 16
@@ -115,6 +246,19 @@ def test_segments():
     assert msg._buf.segment_offsets == (0, 16*8, (16+32)*8, (16+32+64)*8)
     assert msg._buf.s == payload
 
+def test_segments_no_padding():
+    header = ('\x02\x00\x00\x00'  # 2+1 segments
+              '\x01\x00\x00\x00'  # size0: 1
+              '\x02\x00\x00\x00'  # size1: 2
+              '\x01\x00\x00\x00') # size2: 1
+    payload = '\x00'*8 + '\x01'*16 + '\x02'*8
+    buf = header + payload
+    f = StringIO(buf)
+    msg = _load_message(as_filelike(f))
+    assert f.tell() == len(buf)
+    assert msg._buf.segment_offsets == (0, 8, 24)
+    assert msg._buf.s == payload
+
 def test_dumps():
     class Point(Struct):
         pass
@@ -146,6 +290,109 @@ def test_dumps_alignment():
            'J' 'o' 'h' 'n' '\x00\x00\x00\x00')  # John
     assert msg == exp
 
+def _get_persons():
+    buf = ('\x20\x00\x00\x00\x00\x00\x00\x00'   # age=32
+           '\x01\x00\x00\x00\x2a\x00\x00\x00'   # name=ptr
+           'J' 'o' 'h' 'n' '\x00\x00\x00\x00'    # John
+           '\x21\x00\x00\x00\x00\x00\x00\x00'   # age=33
+           '\x01\x00\x00\x00\x3a\x00\x00\x00'   # name=ptr
+           'M' 'a' 'r' 'y' 'A' 'n' 'n' '\x00')    # MaryAnn
+    p1 = Struct.from_buffer(buf, 0, data_size=1, ptrs_size=1)
+    p2 = Struct.from_buffer(buf, 24, data_size=1, ptrs_size=1)
+    return p1, p2
+
+def test_dumps_into():
+    p1, p2 = _get_persons()
+    buf = bytearray('garbage')
+    n = dumps_into(p1, buf)
+    assert n == len(dumps(p1)) == 40
+    n = dumps_into(p2, buf)
+    assert buf == 'garbage' + dumps(p1) + dumps(p2)
+
+def test_dumps_mmap(tmpdir):
+    p1, p2 = _get_persons()
+    myfile = tmpdir.join('myfile.bin')
+    myfile.write(dumps(p1) + dumps(p2), 'wb')
+    q1, q2 = iter_mmap(str(myfile), Struct)
+    assert dumps(q2) == dumps(p2)
+    buf = bytearray()
+    dumps_into(q1, buf)
+    assert buf == dumps(p1)
+
+def test_dump_all():
+    p1, p2 = _get_persons()
+    f = StringIO()
+    dump_all([p1, p2, p1], f)
+    assert f.getvalue() == dumps(p1) + dumps(p2) + dumps(p1)
+    f.seek(0)
+    q1, q2, q3 = load_all(f, Struct)
+    assert q1._read_data(0, Types.int64.ifmt) == 32
+    assert q2._read_data(0, Types.int64.ifmt) == 33
+    assert q3._read_data(0, Types.int64.ifmt) == 32
+
+def test_dump_all_load_all_compression():
+    p1, p2 = _get_persons()
+    for compression in ('zlib', 'bz2'):
+        f = StringIO()
+        dump_all([p1, p2] * 500, f, flush_size=1000, compression=compression)
+        raw = dumps(p1) + dumps(p2)
+        assert len(f.getvalue()) < len(raw) * 500 / 10
+        for chunk_size in (100, 64*1024):
+            f.seek(0)
+            messages = list(load_all(f, Struct, chunk_size=chunk_size,
+                                     compression=compression))
+            assert len(messages) == 1000
+            assert [dumps(p) for p in messages[:2]] == [dumps(p1), dumps(p2)]
+            assert dumps(messages[-1]) == dumps(p2)
+
+def test_MessageWriter():
+    class MyFile(object):
+        def __init__(self):
+            self.batches = []
+            self.parts = []
+
+        def writelines(self, parts):
+            self.batches.append(''.join(map(str, parts)))
+            self.parts.append(parts)
+
+    p1, p2 = _get_persons()
+    msg1 = dumps(p1)
+    msg2 = dumps(p2)
+    assert len(msg1) == len(msg2) == 40
+    #
+    f = MyFile()
+    writer = MessageWriter(f, flush_size=100)
+    writer.write(p1)
+    writer.write(p2)
+    assert f.batches == []
+    writer.write(p1)
+    assert f.batches == [msg1+msg2+msg1]
+    writer.write(p2)
+    writer.close()
+    assert f.batches == [msg1+msg2+msg1, msg2]
+    #
+    f = MyFile()
+    with MessageWriter(f, flush_count=2) as writer:
+        for p in (p1, p2, p1):
+            writer.write(p)
+        assert f.batches == [msg1+msg2]
+    assert f.batches == [msg1+msg2, msg1]
+    # the bodies are not copied, and the headers are in a reused bytearray
+    header1, body1, padding1, header2, body2, padding2 = f.parts[0]
+    assert type(body1) is buffer
+    assert str(body1) + padding1 == msg1[16:]
+    assert type(header1) is buffer
+    header3, body3, padding3 = f.parts[1]
+    assert str(header3) == msg1[:16]
+
+def test_MessageWriter_many_messages():
+    p1, p2 = _get_persons()
+    f = StringIO()
+    # a single batch of 1000 messages, so that the bytearray of the headers
+    # is resized
+    dump_all([p1, p2] * 500, f)
+    assert f.getvalue() == (dumps(p1) + dumps(p2)) * 500
+
 def test_dumps_compact():
     class Person(Struct):
         pass
@@ -192,6 +439,70 @@ def test_Struct_dumps():
            '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
            '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
     assert msg == exp
+def test_validate():
+    class Person(Struct):
+        pass
+
+    buf = ('\x00\x00\x00\x00\x04\x00\x00\x00'   # message header: 1 segment, size 4 words
+           '\x00\x00\x00\x00\x01\x00\x01\x00'   # ptr to payload
+           '\x20\x00\x00\x00\x00\x00\x00\x00'   # age=32
+           '\x01\x00\x00\x00\x2a\x00\x00\x00'   # name=ptr
+           'J' 'o' 'h' 'n' '\x00\x00\x00\x00')  # John
+    p = loads(buf, Person)
+    assert not p._buf.trusted
+    p2 = validate(p)
+    assert isinstance(p2, Person)
+    assert p2._buf.trusted
+    assert p2._buf.s is p._buf.s
+    assert p2._read_data(0, Types.int64.ifmt) == 32
+    assert p2._read_str_text(0) == 'John'
+    assert validate(p2) is p2
+    # the original object is not affected
+    assert not p._buf.trusted
+    #
+    # name points outside the message
+    bad = buf[:24] + '\x05' + buf[25:]
+    p = loads(bad, Person)
+    exc = py.test.raises(ValueError, "validate(p)")
+    assert str(exc.value) == 'Invalid message: object out of bounds at offset 32'
+
+def test_validate_shared_buffer():
+    buf = ('\x00\x00\x00\x00\x02\x00\x00\x00'   # message header: 1 segment, size 2 words
+           '\x00\x00\x00\x00\x01\x00\x00\x00'   # ptr to payload
+           '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+           '\x00\x00\x00\x00\x02\x00\x00\x00'   # message header: 1 segment, size 2 words
+           '\x00\x00\x00\x00\x01\x00\x00\x00'   # ptr to payload
+           '\x02\x00\x00\x00\x00\x00\x00\x00')  # x == 2
+    p1, p2 = load_all(StringIO(buf), Struct)
+    assert p1._buf is p2._buf
+    p1 = validate(p1)
+    assert p1._buf.trusted
+    assert not p2._buf.trusted
+
+def test_validate_segments():
+    buf = ('\x01\x00\x00\x00'                     # 2 segments
+           '\x01\x00\x00\x00'                     # size 1 word
+           '\x02\x00\x00\x00'                     # size 2 words
+           '\x00\x00\x00\x00'                     # padding
+           '\x02\x00\x00\x00\x01\x00\x00\x00'     # far ptr to segment 1
+           '\x00\x00\x00\x00\x01\x00\x00\x00'     # landing pad: ptr to payload
+           '\x03\x00\x00\x00\x00\x00\x00\x00')    # x == 3
+    p = validate(loads(buf, Struct))
+    assert p._buf.trusted
+    assert p._buf.segment_offsets == (0, 8)
+    assert p._read_data(0, Types.int64.ifmt) == 3
+    #
+    buf = ('\x01\x00\x00\x00'                     # 2 segments
+           '\x01\x00\x00\x00'                     # size 1 word
+           '\x02\x00\x00\x00'                     # size 2 words
+           '\x00\x00\x00\x00'                     # padding
+           '\x02\x00\x00\x00\x01\x00\x00\x00'     # far ptr to segment 1
+           '\x00\x00\x00\x00\x00\x00\x01\x00'     # landing pad: ptr to payload
+           '\x02\x00\x00\x00\x02\x00\x00\x00')    # far ptr to segment 2
+    p = loads(buf, Struct)
+    exc = py.test.raises(ValueError, "validate(p)")
+    assert str(exc.value) == 'Invalid message: pointer out of bounds'
+
 
 class TestFileLike(object):
     """
@@ -240,3 +551,158 @@ class TestFileLike(object):
         sock = FakeSocket(self.buf)
         buffered_sock = BufferedSocket(sock)
         self.check(buffered_sock)
+
+    def test_socket_load_all(self):
+        from capnpy.buffered import BufferedSocket
+        class FakeSocket(object):
+            def __init__(self, packets):
+                self.packets = packets
+
+            def recv(self, size):
+                # the test fails if we try to read more than the available
+                # packets, which would block in case of real sockets
+                return self.packets.pop(0)
+
+        sock = FakeSocket([self.buf, self.buf])
+        messages = load_all(BufferedSocket(sock), Struct)
+        p1 = next(messages)
+        assert p1._read_data(0, Types.int64.ifmt) == 1
+        p2 = next(messages)
+        assert p2._read_data(0, Types.int64.ifmt) == 1
+
+
+class TestPacked(object):
+
+    unpacked = ('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
+                '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+                '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+                '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
+
+    packed = ('\x10\x03'                             # message header
+              '\x10\x02'                             # ptr to payload
+              '\x01\x01'                             # x == 1
+              '\x01\x02')                            # y == 2
+
+    def check(self, p, x=1, y=2):
+        assert isinstance(p, Struct)
+        assert p._read_data(0, Types.int64.ifmt) == x
+        assert p._read_data(8, Types.int64.ifmt) == y
+
+    def test_loads_packed(self):
+        p = loads_packed(self.packed, Struct)
+        self.check(p)
+
+    def test_load_packed(self):
+        f = StringIO(self.packed + self.packed)
+        self.check(load_packed(f, Struct))
+        self.check(load_packed(f, Struct))
+        py.test.raises(EOFError, "load_packed(f, Struct)")
+
+    def test_load_all_packed(self):
+        f = StringIO(self.packed * 3)
+        messages = list(load_all_packed(f, Struct))
+        assert len(messages) == 3
+        for p in messages:
+            self.check(p)
+
+    def test_dumps_packed(self):
+        p = loads(self.unpacked, Struct)
+        assert dumps_packed(p) == self.packed
+
+    def test_dump_packed(self):
+        p = loads(self.unpacked, Struct)
+        f = StringIO()
+        dump_packed(p, f)
+        dump_packed(p, f)
+        assert f.getvalue() == self.packed * 2
+
+    def test_Struct_packed(self):
+        class Point(Struct):
+            pass
+        p = Point.loads_packed(self.packed)
+        assert isinstance(p, Point)
+        self.check(p)
+        assert p.dumps_packed() == self.packed
+        p = Point.load_packed(StringIO(self.packed))
+        self.check(p)
+        messages = list(Point.load_all_packed(StringIO(self.packed * 2)))
+        assert len(messages) == 2
+
+
+class TestMmap(object):
+
+    one = ('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
+           '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+           '\x01\x00\x00\x00\x00\x00\x00\x00'   # x == 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00')  # y == 2
+
+    two = ('\x01\x00\x00\x00\x01\x00\x00\x00'   # message header: 2 segments: (1, 3)
+           '\x03\x00\x00\x00\x00\x00\x00\x00'   # size1 + padding
+           '\x02\x00\x00\x00\x01\x00\x00\x00'   # far pointer: segment=1, offset=0
+           '\x00\x00\x00\x00\x02\x00\x00\x00'   # landing pad: ptr to Point {x, y}
+           '\x03\x00\x00\x00\x00\x00\x00\x00'   # x == 3
+           '\x04\x00\x00\x00\x00\x00\x00\x00')  # y == 4
+
+    def write(self, tmpdir, buf):
+        myfile = tmpdir.join('myfile')
+        myfile.write(buf, 'wb')
+        return str(myfile)
+
+    def read_point(self, p):
+        return (p._read_data(0, Types.int64.ifmt),
+                p._read_data(8, Types.int64.ifmt))
+
+    def test_load_mmap(self, tmpdir):
+        import mmap
+        path = self.write(tmpdir, self.one)
+        p = load_mmap(path, Struct)
+        assert isinstance(p._buf.s, mmap.mmap)
+        assert self.read_point(p) == (1, 2)
+
+    def test_load_mmap_writable(self, tmpdir):
+        path = self.write(tmpdir, self.one)
+        p = load_mmap(path, Struct, writable=True)
+        p._write_data(0, Types.int64.ifmt, 42)
+        p._buf.s.flush()
+        p = load_mmap(path, Struct)
+        assert self.read_point(p) == (42, 2)
+        py.test.raises(TypeError, "p._write_data(0, Types.int64.ifmt, 43)")
+
+    def test_iter_mmap(self, tmpdir):
+        path = self.write(tmpdir, self.one + self.two + self.one)
+        messages = list(iter_mmap(path, Struct))
+        assert len(messages) == 3
+        p1, p2, p3 = messages
+        assert self.read_point(p1) == (1, 2)
+        assert self.read_point(p2) == (3, 4)
+        assert self.read_point(p3) == (1, 2)
+        assert p1._buf.s is p2._buf.s is p3._buf.s
+        assert p2._buf.segment_offsets == (48, 56)
+        assert p3._data_offset == 96
+
+    def test_offset(self, tmpdir):
+        path = self.write(tmpdir, self.one + self.two + self.one)
+        p2 = load_mmap(path, Struct, offset=32)
+        assert self.read_point(p2) == (3, 4)
+        assert p2._buf.segment_offsets == (48, 56)
+        messages = list(iter_mmap(path, Struct, offset=32))
+        assert map(self.read_point, messages) == [(3, 4), (1, 2)]
+        py.test.raises(EOFError, "load_mmap(path, Struct, offset=128)")
+
+    def test_dumps(self, tmpdir):
+        path = self.write(tmpdir, self.one)
+        p = load_mmap(path, Struct)
+        assert dumps(p) == self.one
+
+    def test_empty_file(self, tmpdir):
+        path = self.write(tmpdir, '')
+        assert list(iter_mmap(path, Struct)) == []
+        py.test.raises(EOFError, "load_mmap(path, Struct)")
+
+    def test_truncated(self, tmpdir):
+        path = self.write(tmpdir, self.one + self.one[:-8])
+        gen = iter_mmap(path, Struct)
+        next(gen)
+        exc = py.test.raises(ValueError, "next(gen)")
+        assert exc.value.message == ("Unexpected EOF: expected 24 bytes, got only 16. "
+                                     "Segments size: 3")
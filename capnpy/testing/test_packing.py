@@ -0,0 +1,108 @@
+import py
+from cStringIO import StringIO
+from capnpy.packing import pack, unpack, PackedStream
+
+# the examples are taken from https://capnproto.org/encoding.html#packing
+EXAMPLES = [
+    ('\x08\x00\x00\x00\x03\x00\x02\x00'
+     '\x19\x00\x00\x00\xaa\x01\x00\x00',
+     '\x51\x08\x03\x02'
+     '\x31\x19\xaa\x01'),
+    #
+    ('\x00' * 8*4,
+     '\x00\x03'),
+    #
+    ('\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08',
+     '\xff\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x03'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'),
+    #
+    ('\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x00\x02\x03\x04\x05\x06\x07\x08'   # one zero byte: still copied
+     '\x00\x02\x03\x00\x05\x06\x07\x08'   # two zero bytes: packed
+     '\x00\x00\x00\x00\x00\x00\x00\x00',
+     '\xff\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x06'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x01\x02\x03\x04\x05\x06\x07\x08'
+     '\x00\x02\x03\x04\x05\x06\x07\x08'
+     '\xf6\x02\x03\x05\x06\x07\x08'
+     '\x00\x00'),
+]
+
+def test_pack():
+    for unpacked, packed in EXAMPLES:
+        assert pack(unpacked) == packed
+
+def test_unpack():
+    for unpacked, packed in EXAMPLES:
+        assert unpack(packed) == unpacked
+
+def test_pack_long_runs():
+    buf = '\x00' * 8*300
+    assert pack(buf) == '\x00\xff' '\x00\x2b'
+    assert unpack(pack(buf)) == buf
+    buf = '\x01' * 8*300
+    packed = pack(buf)
+    assert len(packed) == (1 + 8 + 1 + 255*8) + (1 + 8 + 1 + 43*8)
+    assert unpack(packed) == buf
+
+def test_pack_wrong_length():
+    py.test.raises(ValueError, pack, '\x00' * 7)
+
+def test_unpack_truncated():
+    py.test.raises(ValueError, unpack, '\x00')
+    py.test.raises(ValueError, unpack, '\x51\x08\x03')
+    py.test.raises(ValueError, unpack, '\xff\x01\x02\x03\x04\x05\x06\x07\x08')
+    py.test.raises(ValueError, unpack, '\xff\x01\x02\x03\x04\x05\x06\x07\x08\x01')
+
+
+class TestPackedStream(object):
+
+    def test_read(self):
+        for unpacked, packed in EXAMPLES:
+            f = PackedStream(StringIO(packed))
+            assert f.read(len(unpacked)) == unpacked
+            assert f.read(8) == ''
+
+    def test_read_partial_words(self):
+        unpacked, packed = EXAMPLES[3]
+        f = PackedStream(StringIO(packed))
+        parts = []
+        while True:
+            data = f.read(3)
+            if not data:
+                break
+            parts.append(data)
+        assert ''.join(parts) == unpacked
+
+    def test_read_all(self):
+        unpacked, packed = EXAMPLES[3]
+        f = PackedStream(StringIO(packed))
+        assert f.read(4) == unpacked[:4]
+        assert f.read() == unpacked[4:]
+
+    def test_read_exactly(self):
+        unpacked, packed = EXAMPLES[2]
+        f = StringIO(packed + 'garbage')
+        f2 = PackedStream(f)
+        assert f2.read(len(unpacked)) == unpacked
+        assert f.read() == 'garbage'
+
+    def test_truncated(self):
+        unpacked, packed = EXAMPLES[3]
+        f = PackedStream(StringIO(packed[:20]))
+        py.test.raises(ValueError, "f.read(len(unpacked))")
@@ -0,0 +1,50 @@
+import struct
+from capnpy.blob import Types
+from capnpy.struct_ import Struct
+from capnpy.index import build_index
+from capnpy.parallel import pmap, split_ranges
+
+def make_message(x, y):
+    return ('\x00\x00\x00\x00\x03\x00\x00\x00'   # message header: 1 segment, size 3 words
+            '\x00\x00\x00\x00\x02\x00\x00\x00'   # ptr to payload (Point {x, y})
+            + struct.pack('<qq', x, y))
+
+def get_xy(p):
+    # this must be at module level, to be sent to the workers
+    return p._read_data(0, Types.int64.ifmt), p._read_data(8, Types.int64.ifmt)
+
+def write_messages(tmpdir, n):
+    myfile = tmpdir.join('myfile.bin')
+    myfile.write(''.join([make_message(i, i*2) for i in range(n)]), 'wb')
+    return str(myfile)
+
+
+def test_split_ranges():
+    offsets = [0, 32, 64, 96, 128]
+    assert split_ranges(offsets, 1) == [(0, 128)]
+    assert split_ranges(offsets, 2) == [(0, 64), (64, 128)]
+    assert split_ranges(offsets, 3) == [(0, 64), (64, 96), (96, 128)]
+    assert split_ranges(offsets, 10) == [(0, 32), (32, 64), (64, 96), (96, 128)]
+    assert split_ranges([0], 4) == []
+    # a single big message
+    assert split_ranges([0, 10, 1000], 4) == [(0, 1000)]
+
+def test_pmap_one_worker(tmpdir):
+    path = write_messages(tmpdir, 100)
+    res = pmap(get_xy, path, Struct, workers=1)
+    assert res == [(i, i*2) for i in range(100)]
+
+def test_pmap(tmpdir):
+    path = write_messages(tmpdir, 1000)
+    res = pmap(get_xy, path, Struct, workers=3)
+    assert res == [(i, i*2) for i in range(1000)]
+
+def test_pmap_index(tmpdir):
+    path = write_messages(tmpdir, 10)
+    index = build_index(path)
+    res = pmap(get_xy, path, Struct, workers=2, index=index)
+    assert res == [(i, i*2) for i in range(10)]
+
+def test_pmap_empty(tmpdir):
+    path = write_messages(tmpdir, 0)
+    assert pmap(get_xy, path, Struct, workers=2) == []
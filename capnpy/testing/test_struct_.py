@@ -1,6 +1,10 @@
 import py
+import struct
+from capnpy import ptr
 from capnpy.blob import Types, CapnpBufferWithSegments
 from capnpy.struct_ import Struct, undefined
+from capnpy.list import TextItemType
+from capnpy.message import dumps, loads
 from capnpy.enum import enum
 from capnpy.printer import print_buffer
 
@@ -120,6 +124,63 @@ def test_far_pointer():
     assert p._read_data(0, Types.int64.ifmt) == 1
     assert p._read_data(8, Types.int64.ifmt) == 2
 
+def make_far_message():
+    ## struct Person {
+    ##   age @0 :Int64;
+    ##   name @1 :Text;
+    ##   tags @2 :List(Text);
+    ## }
+    ##
+    ## Person(age=32, name='John', tags=['ab', 'cd']), spread over three
+    ## segments and using both far and double-far pointers
+    def word(p):
+        return struct.pack('<q', p)
+    seg0 = ('\x20\x00\x00\x00\x00\x00\x00\x00'  # age == 32
+            + word(ptr.new_far(0, 0, 1))            # name: far ptr to seg1[0]
+            + word(ptr.new_far(1, 0, 2)))           # tags: double-far to seg2[0]
+    seg1 = (word(ptr.new_list(0, ptr.LIST_SIZE_8, 5)) # landing pad for name
+            + 'John\x00\x00\x00\x00'
+            + word(ptr.new_list(1, ptr.LIST_SIZE_8, 3)) # tags[0]
+            + word(ptr.new_far(0, 2, 2))            # tags[1]: far ptr to seg2[2]
+            + 'ab\x00\x00\x00\x00\x00\x00')
+    seg2 = (word(ptr.new_far(0, 2, 1))              # double-far landing pad:
+            + word(ptr.new_list(0, ptr.LIST_SIZE_PTR, 2)) # (far ptr, tag)
+            + word(ptr.new_list(0, ptr.LIST_SIZE_8, 3)) # landing pad for tags[1]
+            + 'cd\x00\x00\x00\x00\x00\x00')
+    buf = CapnpBufferWithSegments(seg0+seg1+seg2, segment_offsets=(0, 24, 64))
+    return Struct.from_buffer(buf, 0, data_size=1, ptrs_size=2)
+
+def check_far_person(p):
+    assert p._read_data(0, Types.int64.ifmt) == 32
+    assert p._read_str_text(0) == 'John'
+    tags = p._read_list(8, TextItemType(Types.text))
+    assert list(tags) == ['ab', 'cd']
+
+def test_far_and_double_far_pointers():
+    p = make_far_message()
+    check_far_person(p)
+
+def test_compact_far_pointers():
+    p = make_far_message()
+    assert not p._is_compact()
+    p2 = p.compact()
+    assert not isinstance(p2._buf, CapnpBufferWithSegments)
+    assert p2._is_compact()
+    check_far_person(p2)
+    assert p2._buf.s == (
+        '\x20\x00\x00\x00\x00\x00\x00\x00'    # age == 32
+        '\x05\x00\x00\x00\x2a\x00\x00\x00'    # name
+        '\x05\x00\x00\x00\x16\x00\x00\x00'    # tags
+        'John\x00\x00\x00\x00'
+        '\x05\x00\x00\x00\x1a\x00\x00\x00'    # tags[0]
+        '\x05\x00\x00\x00\x1a\x00\x00\x00'    # tags[1]
+        'ab\x00\x00\x00\x00\x00\x00'
+        'cd\x00\x00\x00\x00\x00\x00')
+    #
+    msg = dumps(p)
+    assert msg == dumps(p2)
+    check_far_person(loads(msg, Struct))
+
 def test_union():
     ## struct Shape {
     ##   area @0 :Int64;
@@ -194,6 +255,10 @@ def test_compact():
                             '\x00\x00\x00\x00\x00\x00\x00\x00'    # ptr to b, NULL
                             '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
                             '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
+    #
+    # compacting an object which is already compact does not copy the buffer
+    rect3 = rect2.compact()
+    assert rect3._buf.s is rect2._buf.s
 
 def test_comparisons_fail():
     s = Struct.from_buffer('', 0, data_size=0, ptrs_size=0)
@@ -4,7 +4,10 @@ import sys
 import struct
 import math
 from pypytools import IS_PYPY
-from capnpy.unpack import unpack_primitive, pack_message_header
+from capnpy.unpack import (unpack_primitive, unpack_bytes, pack_message_header,
+                           pack_message, pack_struct, pack_primitive,
+                           unpack_primitive_unchecked,
+                           unpack_int64_unchecked, unpack_int16_unchecked)
 
 def test_unpack_primitive_ints():
     buf = '\xff' * 8
@@ -45,14 +48,128 @@ def test_bytearray():
     buf = bytearray(struct.pack('q', 42))
     assert unpack_primitive(ord('q'), buf, 0) == 42
 
+def test_memoryview():
+    buf = memoryview(struct.pack('qq', 42, 43))
+    assert unpack_primitive(ord('q'), buf, 0) == 42
+    assert unpack_primitive(ord('q'), buf[8:], 0) == 43
+    pytest.raises(IndexError, "unpack_primitive(ord('q'), buf, 16)")
+
+def test_unpack_bytes():
+    buf = 'hello world'
+    for b in (buf, bytearray(buf), memoryview(buf)):
+        s = unpack_bytes(b, 6, 11)
+        assert s == 'world'
+        assert type(s) is str
+        assert unpack_bytes(b, 6, 100) == 'world'
+        assert unpack_bytes(b, 100, 200) == ''
+        # negative indices are handled as by slicing
+        assert unpack_bytes(b, -5, 11) == 'world'
+        assert unpack_bytes(b, -100, 5) == 'hello'
+        assert unpack_bytes(b, 0, -6) == 'hello'
+        assert unpack_bytes(b, -5, -1) == 'worl'
+        assert unpack_bytes(b, 0, -100) == ''
+    assert unpack_bytes(buf, 0, len(buf)) is buf
+
 def test_errors():
     buf = '\xff' * 8
     pytest.raises(IndexError, "unpack_primitive(ord('q'), buf, -1)")
     pytest.raises(IndexError, "unpack_primitive(ord('q'), buf, 8)")
     pytest.raises(TypeError, "unpack_primitive(ord('q'), 42, 0)")
 
+def test_unchecked():
+    buf = struct.pack('<qhd', -1, 42, math.pi)
+    assert unpack_int64_unchecked(buf, 0) == -1
+    assert unpack_int16_unchecked(buf, 8) == 42
+    assert unpack_primitive_unchecked(ord('h'), buf, 8) == 42
+    assert unpack_primitive_unchecked(ord('d'), buf, 10) == math.pi
+
 def test_pack_message_header():
     header = pack_message_header(1, 0xAA, 0xBBCCDD)
     assert header == ('\x00\x00\x00\x00'
                       '\xaa\x00\x00\x00'
                       '\xdd\xcc\xbb\x00\x00\x00\x00\x00')
+
+def test_pack_message():
+    buf = 'garbage0' 'hello world'
+    for b in (buf, bytearray(buf), memoryview(buf)):
+        msg = pack_message(0xBBCCDD, b, 8, 19)
+        assert msg == ('\x00\x00\x00\x00'
+                       '\x03\x00\x00\x00'       # 2 words + the ptr
+                       '\xdd\xcc\xbb\x00\x00\x00\x00\x00'
+                       'hello world\x00\x00\x00\x00\x00')
+        assert pack_message(0xBBCCDD, b, 0, 8) == (
+            pack_message_header(1, 2, 0xBBCCDD) + 'garbage0')
+    pytest.raises(IndexError, "pack_message(0, buf, 8, 20)")
+    pytest.raises(IndexError, "pack_message(0, buf, -1, 8)")
+
+def test_pack_struct():
+    buf = ('garbage0'
+           '\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+           '\x0c\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+           '\x00\x00\x00\x00\x00\x00\x00\x00'    # ptr to b, NULL
+           'garbage1'
+           'garbage2'
+           '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
+    for b in (buf, bytearray(buf), memoryview(buf)):
+        s = pack_struct(b, 8, 1, 2, -2, 48, 64)
+        assert s == ('\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+                     '\x04\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+                     '\x00\x00\x00\x00\x00\x00\x00\x00'    # ptr to b, NULL
+                     '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+                     '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
+        # body only
+        s = pack_struct(b, 8, 1, 2, 1, 0, 0)
+        assert s == ('\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+                     '\x10\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+                     '\x00\x00\x00\x00\x00\x00\x00\x00')   # ptr to b, NULL
+    pytest.raises(IndexError, "pack_struct(buf, 48, 1, 2, 0, 0, 0)")
+    pytest.raises(IndexError, "pack_struct(buf, 8, 1, 2, 0, 48, 72)")
+    #
+    far = ('\x02\x00\x00\x00\x01\x00\x00\x00')   # far ptr
+    pytest.raises(ValueError, "pack_struct(far, 0, 0, 1, 0, 0, 0)")
+
+def test_pack_struct_already_compact():
+    buf = ('\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+           '\x04\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+           '\x00\x00\x00\x00\x00\x00\x00\x00'    # ptr to b, NULL
+           '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+           '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
+    assert pack_struct(buf, 0, 1, 2, 0, 24, 40) is buf
+    s = pack_struct(bytearray(buf), 0, 1, 2, 0, 24, 40)
+    assert type(s) is str
+    assert s == buf
+
+def test_pack_primitive():
+    buf = bytearray(16)
+    pack_primitive(ord('q'), buf, 0, -1)
+    pack_primitive(ord('H'), buf, 8, 0xBBCC)
+    pack_primitive(ord('d'), buf, 8, math.pi)
+    assert buf[:8] == '\xff' * 8
+    assert unpack_primitive(ord('d'), buf, 8) == math.pi
+    pack_primitive(ord('b'), buf, 15, 42)
+    assert buf[15] == 42
+    pytest.raises(IndexError, "pack_primitive(ord('q'), buf, 9, 0)")
+    pytest.raises(IndexError, "pack_primitive(ord('b'), buf, -1, 0)")
+    #
+    view = memoryview(buf)
+    pack_primitive(ord('i'), view, 4, 0x01020304)
+    assert buf[4:8] == '\x04\x03\x02\x01'
+
+def test_pack_primitive_overflow():
+    buf = bytearray(8)
+    for fmt, value in [('b', 128), ('B', -1), ('h', 1 << 15), ('H', 1 << 16),
+                       ('i', 1 << 31), ('I', -1), ('q', 1 << 63),
+                       ('Q', 1 << 64), ('Q', -1), ('f', 1e300)]:
+        pytest.raises(OverflowError, "pack_primitive(ord(fmt), buf, 0, value)")
+    assert buf == '\x00' * 8
+    # inf and nan fit into a float32
+    pack_primitive(ord('f'), buf, 0, float('inf'))
+    assert unpack_primitive(ord('f'), buf, 0) == float('inf')
+    pytest.raises(TypeError, "pack_primitive(ord('q'), buf, 0, 'hello')")
+
+def test_pack_primitive_read_only():
+    buf = '\x00' * 8
+    for b in (buf, memoryview(buf)):
+        pytest.raises(TypeError, "pack_primitive(ord('q'), b, 0, 1)")
+    assert buf == '\x00' * 8
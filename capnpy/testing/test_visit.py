@@ -1,7 +1,8 @@
 from capnpy import ptr
 from capnpy.printer import print_buffer
-from capnpy.visit import end_of, is_compact
-from capnpy.blob import CapnpBuffer
+import py
+from capnpy.visit import end_of, is_compact, copy_pointer, validate
+from capnpy.blob import CapnpBuffer, CapnpBufferWithSegments
 
 class TestEndOf(object):
 
@@ -415,3 +416,141 @@ class TestIsCompact(object):
                                      size_tag=ptr.LIST_SIZE_PTR,
                                      item_count=3)
         assert is_compact
+
+
+class TestCopyPointer(object):
+
+    def copy(self, buf, offset, data_size, ptrs_size):
+        p = ptr.new_struct(0, data_size, ptrs_size)
+        out = bytearray()
+        copy_pointer(buf, p, offset-8, out, -8)
+        return str(out)
+
+    def test_compact(self):
+        buf = ('garbage0'
+               '\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+               '\x0c\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+               '\x11\x00\x00\x00\x32\x00\x00\x00'    # ptr to name
+               'garbage1'
+               'garbage2'
+               '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+               '\x02\x00\x00\x00\x00\x00\x00\x00'    # a.y == 2
+               'abcde\x00\x00\x00')
+        res = self.copy(CapnpBuffer(buf), 8, data_size=1, ptrs_size=2)
+        assert res == ('\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+                       '\x04\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+                       '\x09\x00\x00\x00\x32\x00\x00\x00'    # ptr to name
+                       '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+                       '\x02\x00\x00\x00\x00\x00\x00\x00'    # a.y == 2
+                       'abcde\x00\x00\x00')
+
+    def test_far_pointers(self):
+        seg0 = ('\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+                '\x02\x00\x00\x00\x01\x00\x00\x00'    # far ptr to a
+                '\x1e\x00\x00\x00\x01\x00\x00\x00')   # double-far ptr to name
+        seg1 = ('\x00\x00\x00\x00\x02\x00\x00\x00'    # landing pad for a
+                '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+                '\x02\x00\x00\x00\x00\x00\x00\x00'    # a.y == 2
+                '\x02\x00\x00\x00\x02\x00\x00\x00'    # landing pad: far ptr
+                '\x01\x00\x00\x00\x32\x00\x00\x00')   # landing pad: tag
+        seg2 = 'abcde\x00\x00\x00'
+        buf = CapnpBufferWithSegments(seg0+seg1+seg2,
+                                      segment_offsets=(0, 24, 64))
+        res = self.copy(buf, 0, data_size=1, ptrs_size=2)
+        assert res == ('\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+                       '\x04\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+                       '\x09\x00\x00\x00\x32\x00\x00\x00'    # ptr to name
+                       '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+                       '\x02\x00\x00\x00\x00\x00\x00\x00'    # a.y == 2
+                       'abcde\x00\x00\x00')
+        #
+        p = ptr.new_struct(0, 1, 2)
+        assert is_compact(CapnpBuffer(res), p, -8)
+
+    def test_list_void(self):
+        buf = ('\x01\x00\x00\x00\x20\x03\x00\x00')   # List(Void), 100 items
+        res = self.copy(CapnpBuffer(buf), 0, data_size=0, ptrs_size=1)
+        assert res == buf
+
+
+class TestValidate(object):
+
+    def validate(self, buf, offset, data_size, ptrs_size,
+                 traversal_limit=1000, nesting_limit=64):
+        if not isinstance(buf, CapnpBuffer):
+            buf = CapnpBuffer(buf)
+        p = ptr.new_struct(0, data_size, ptrs_size)
+        return validate(buf, p, offset-8, traversal_limit, nesting_limit)
+
+    def test_struct(self):
+        buf = ('\x01\x00\x00\x00\x00\x00\x00\x00'    # color == 1
+               '\x08\x00\x00\x00\x02\x00\x00\x00'    # ptr to a
+               '\x00\x00\x00\x00\x00\x00\x00\x00'    # null ptr
+               'garbage1'
+               '\x01\x00\x00\x00\x00\x00\x00\x00'    # a.x == 1
+               '\x02\x00\x00\x00\x00\x00\x00\x00')   # a.y == 2
+        assert self.validate(buf, 0, data_size=1, ptrs_size=2) == 0
+        # the root struct is out of bounds
+        py.test.raises(ValueError, "self.validate(buf, 0, 1, 6)")
+        # a is out of bounds
+        py.test.raises(ValueError, "self.validate(buf[:-8], 0, 1, 2)")
+        # the pointer itself is out of bounds
+        py.test.raises(ValueError, "self.validate(buf[:16], 8, 0, 2)")
+
+    def test_negative_offset(self):
+        buf = ('\xf8\xff\xff\xff\x01\x00\x00\x00')   # ptr to offset -1
+        py.test.raises(ValueError, "self.validate(buf, 0, 0, 1)")
+
+    def test_lists(self):
+        buf = ('\x05\x00\x00\x00\x1a\x00\x00\x00'    # ptr to [1, 2, 3]
+               '\x05\x00\x00\x00\x09\x00\x00\x00'    # ptr to [True]
+               '\x01\x02\x03\x00\x00\x00\x00\x00'    # [1, 2, 3]
+               '\x01\x00\x00\x00\x00\x00\x00\x00')   # [True]
+        assert self.validate(buf, 0, data_size=0, ptrs_size=2) == 0
+        # [1, 2, 3] as a List(Int64) is out of bounds
+        bad = buf[:4] + '\x1d' + buf[5:]
+        py.test.raises(ValueError, "self.validate(bad, 0, 0, 2)")
+
+    def test_list_composite(self):
+        buf = ('\x01\x00\x00\x00\x17\x00\x00\x00'    # ptr to list, 2 words
+               '\x08\x00\x00\x00\x01\x00\x00\x00'    # tag: 2 items
+               '\x01\x00\x00\x00\x00\x00\x00\x00'    # 1
+               '\x02\x00\x00\x00\x00\x00\x00\x00')   # 2
+        assert self.validate(buf, 0, data_size=0, ptrs_size=1) == 0
+        # the tag says 3 items, but the list is only 2 words
+        bad = buf[:8] + '\x0c' + buf[9:]
+        exc = py.test.raises(ValueError, "self.validate(bad, 0, 0, 1)")
+        assert 'wrong tag' in str(exc.value)
+
+    def test_far_pointer(self):
+        s = '\x02\x00\x00\x00\x00\x00\x00\x00'    # far ptr to itself
+        py.test.raises(ValueError, "self.validate(s, 0, 0, 1)")
+        buf = CapnpBufferWithSegments(s, segment_offsets=(0,))
+        py.test.raises(ValueError, "self.validate(buf, 0, 0, 1)")
+        #
+        s = '\x02\x00\x00\x00\x05\x00\x00\x00'    # far ptr to seg5
+        buf = CapnpBufferWithSegments(s, segment_offsets=(0,))
+        py.test.raises(ValueError, "self.validate(buf, 0, 0, 1)")
+
+    def test_traversal_limit(self):
+        # List(Void) with 100 items
+        buf = '\x01\x00\x00\x00\x20\x03\x00\x00'
+        assert self.validate(buf, 0, 0, 1, traversal_limit=101) == 0
+        exc = py.test.raises(ValueError, "self.validate(buf, 0, 0, 1, traversal_limit=100)")
+        assert 'traversal limit' in str(exc.value)
+        #
+        # two pointers to the same struct
+        buf = ('\x04\x00\x00\x00\x01\x00\x00\x00'
+               '\x00\x00\x00\x00\x01\x00\x00\x00'
+               '\x01\x00\x00\x00\x00\x00\x00\x00')
+        assert self.validate(buf, 0, 0, 2, traversal_limit=4) == 0
+        py.test.raises(ValueError, "self.validate(buf, 0, 0, 2, traversal_limit=3)")
+
+    def test_nesting_limit(self):
+        # a linked list of 3 nodes
+        buf = ('\x00\x00\x00\x00\x00\x00\x01\x00'
+               '\x00\x00\x00\x00\x00\x00\x01\x00'
+               '\x00\x00\x00\x00\x00\x00\x00\x00')
+        assert self.validate(buf, 0, 0, 1, nesting_limit=3) == 0
+        exc = py.test.raises(ValueError, "self.validate(buf, 0, 0, 1, nesting_limit=2)")
+        assert 'nesting limit' in str(exc.value)
@@ -1,5 +1,14 @@
-cpdef unpack_primitive(char ifmt, object buf, int offset)
-cpdef long unpack_int64(object buf, int offset)
-cpdef long unpack_int16(object buf, int offset)
-cpdef long unpack_uint32(object buf, int offset)
+cdef char* as_cbuf(object buf, Py_ssize_t* length) except NULL
+cpdef unpack_primitive(char ifmt, object buf, long offset)
+cpdef long unpack_int64(object buf, long offset)
+cpdef long unpack_int16(object buf, long offset)
+cpdef long unpack_uint32(object buf, long offset)
+cpdef pack_primitive(char ifmt, object buf, long offset, object value)
+cpdef unpack_primitive_unchecked(char ifmt, object buf, long offset)
+cpdef long unpack_int64_unchecked(object buf, long offset)
+cpdef long unpack_int16_unchecked(object buf, long offset)
 cpdef bytes pack_message_header(int segment_count, int segment_size, long p)
+cpdef bytes pack_message(long p, object buf, long start, long end)
+cpdef bytes pack_struct(object buf, long start, long data_size, long ptrs_size,
+                        long ptrs_delta, long extra_start, long extra_end)
+cpdef bytes unpack_bytes(object buf, long start, long end)
@@ -1,5 +1,6 @@
 import struct
 from pypytools import IS_PYPY
+from capnpy import ptr
 
 if IS_PYPY:
     # workaround for a limitation of the PyPy JIT: struct.unpack is optimized
@@ -26,6 +27,32 @@ def unpack_primitive(ifmt, buf, offset):
         raise IndexError('Offset out of bounds: %d' % offset)
     return struct.unpack_from(fmt, buf, offset)[0]
 
+def pack_primitive(ifmt, buf, offset, value):
+    """
+    Write value at buf[offset:]. Raise TypeError if buf is read-only, and
+    OverflowError if value does not fit the format
+    """
+    fmt = '<' + mychr(ifmt)
+    if offset < 0 or offset + struct.calcsize(fmt) > len(buf):
+        raise IndexError('Offset out of bounds: %d' % offset)
+    try:
+        if isinstance(buf, memoryview):
+            # on CPython 2, pack_into does not support memoryviews
+            if buf.readonly:
+                raise TypeError
+            buf[offset:offset+struct.calcsize(fmt)] = struct.pack(fmt, value)
+        else:
+            struct.pack_into(fmt, buf, offset, value)
+    except TypeError:
+        raise TypeError('Cannot modify a read-only buffer of type %s'
+                        % type(buf).__name__)
+    except struct.error as e:
+        # be consistent with unpack.pyx, which raises the same exceptions
+        # as Cython's conversions to C types
+        if isinstance(value, (int, long, float)):
+            raise OverflowError(str(e))
+        raise TypeError(str(e))
+
 def unpack_int64(buf, offset):
     return unpack_primitive(ord('q'), buf, offset)
 
@@ -35,9 +62,71 @@ def unpack_int16(buf, offset):
 def unpack_uint32(buf, offset):
     return unpack_primitive(ord('I'), buf, offset)
 
+# in pure Python mode the unchecked variants are the same as the normal ones:
+# struct.unpack_from does its own bound checking anyway
+unpack_primitive_unchecked = unpack_primitive
+unpack_int64_unchecked = unpack_int64
+unpack_int16_unchecked = unpack_int16
+
+def unpack_bytes(buf, start, end):
+    """
+    Return buf[start:end] as a string, whatever is the type of buf (str,
+    bytearray, mmap, memoryview, etc.)
+    """
+    s = buf[start:end]
+    if isinstance(s, memoryview):
+        return s.tobytes()
+    return str(s)
+
 def pack_message_header(segment_count, segment_size, p):
     """
     This assumes that segment_count == 1
     """
     assert segment_count == 1
     return struct.pack('iiQ', segment_count-1, segment_size, p)
+
+def pack_message(p, buf, start, end):
+    """
+    Return a single-segment message whose root pointer is p and whose content
+    is buf[start:end], padded to a multiple of 8 bytes
+    """
+    if start < 0 or end > len(buf) or start > end:
+        raise IndexError('Range out of bounds: %d-%d' % (start, end))
+    body = unpack_bytes(buf, start, end)
+    padding = (8 - len(body) % 8) % 8
+    segment_size = (len(body) + padding) / 8 + 1 # +1 is for the ptr
+    return pack_message_header(1, segment_size, p) + body + '\x00' * padding
+
+def pack_struct(buf, start, data_size, ptrs_size, ptrs_delta,
+                extra_start, extra_end):
+    """
+    Return a string containing the body of the struct which is at
+    buf[start:], followed by buf[extra_start:extra_end]. The offset of each
+    non-null pointer of the body is incremented by ptrs_delta words.
+
+    If the struct is already compact, buf is returned without copying it.
+    """
+    body_length = (data_size + ptrs_size) * 8
+    if start < 0 or start + body_length > len(buf):
+        raise IndexError('Range out of bounds: %d-%d' % (start, start+body_length))
+    if extra_start < 0 or extra_end > len(buf) or extra_start > extra_end:
+        raise IndexError('Range out of bounds: %d-%d' % (extra_start, extra_end))
+    extra_length = extra_end - extra_start
+    if (start == 0 and ptrs_delta == 0 and
+        extra_start == body_length and extra_end == len(buf) and
+        type(buf) is str):
+        # already compact, nothing to do
+        return buf
+    out = bytearray(body_length + extra_length)
+    out[:body_length] = buf[start:start+body_length]
+    for i in range(ptrs_size):
+        offset = data_size*8 + i*8
+        p = struct.unpack_from('<q', out, offset)[0]
+        if p != 0:
+            if ptr.kind(p) == ptr.FAR:
+                raise ValueError('Unexpected far pointer')
+            p = ptr.new_generic(ptr.kind(p), ptr.offset(p)+ptrs_delta,
+                                ptr.extra(p))
+            struct.pack_into('<q', out, offset, p)
+    out[body_length:] = buf[extra_start:extra_end]
+    return str(out)
@@ -1,7 +1,13 @@
+from libc.string cimport memcpy, memset
+from libc.float cimport FLT_MAX
+from libc.math cimport isfinite
 from libc.stdint cimport (int8_t, uint8_t, int16_t, uint16_t,
                           uint32_t, int32_t, int64_t, uint64_t, INT64_MAX)
 from cpython.string cimport (PyString_GET_SIZE, PyString_AS_STRING,
                              PyString_CheckExact, PyString_FromStringAndSize)
+from capnpy cimport ptr
+from cpython.buffer cimport (PyObject_CheckBuffer, PyObject_GetBuffer,
+                             PyBuffer_Release, PyBUF_SIMPLE, PyBUF_WRITABLE)
 
 mychr = chr
 
@@ -9,6 +15,10 @@ cdef extern from "Python.h":
     int PyByteArray_CheckExact(object o)
     char* PyByteArray_AS_STRING(object o)
     Py_ssize_t PyByteArray_GET_SIZE(object o)
+    int PyObject_AsReadBuffer(object o, const void** buf,
+                              Py_ssize_t* length) except -1
+    int PyObject_AsWriteBuffer(object o, void** buf,
+                               Py_ssize_t* length) except -1
 
 cdef char* as_cbuf(object buf, Py_ssize_t* length) except NULL:
     # PyString_AS_STRING seems to be faster than relying of cython's own logic
@@ -24,13 +34,58 @@ cdef char* as_cbuf(object buf, Py_ssize_t* length) except NULL:
         length[0] = PyByteArray_GET_SIZE(ba_buf)
         return PyByteArray_AS_STRING(ba_buf)
     else:
-        raise TypeError("Expected str or bytearray")
+        return as_cbuf_generic(buf, length)
 
-cdef checkbound(int size, Py_ssize_t length, int offset):
+cdef char* as_cbuf_generic(object buf, Py_ssize_t* length) except NULL:
+    # slow path for any other object which supports the buffer protocol, such
+    # as mmap or memoryview. We can release the Py_buffer immediately: the
+    # memory stays valid as long as the caller keeps a reference to buf
+    cdef Py_buffer view
+    cdef const void* cbuf
+    if PyObject_CheckBuffer(buf):
+        PyObject_GetBuffer(buf, &view, PyBUF_SIMPLE)
+        cbuf = view.buf
+        length[0] = view.len
+        PyBuffer_Release(&view)
+    else:
+        # e.g. mmap, which supports only the old-style buffer protocol
+        PyObject_AsReadBuffer(buf, &cbuf, length)
+    if cbuf == NULL:
+        # this happens e.g. for empty buffers; we must return non-NULL, else
+        # cython thinks that there was an exception
+        cbuf = b''
+    return <char*>cbuf
+
+cdef char* as_writable_cbuf(object buf, Py_ssize_t* length) except NULL:
+    # like as_cbuf, but raise TypeError if buf is read-only
+    cdef Py_buffer view
+    cdef void* cbuf = NULL
+    if PyByteArray_CheckExact(buf):
+        length[0] = PyByteArray_GET_SIZE(buf)
+        return PyByteArray_AS_STRING(buf)
+    try:
+        if PyObject_CheckBuffer(buf):
+            PyObject_GetBuffer(buf, &view, PyBUF_WRITABLE)
+            cbuf = view.buf
+            length[0] = view.len
+            PyBuffer_Release(&view)
+        else:
+            PyObject_AsWriteBuffer(buf, &cbuf, length)
+    except (TypeError, BufferError):
+        raise TypeError('Cannot modify a read-only buffer of type %s'
+                        % type(buf).__name__)
+    if cbuf == NULL:
+        # empty buffer, see as_cbuf_generic. Nothing can be written there
+        # anyway, because of the bound checks
+        return <char*>b''
+    return <char*>cbuf
+
+cdef checkbound(int size, Py_ssize_t length, long offset):
     if offset < 0 or offset + size > length:
         raise IndexError('Offset out of bounds: %d' % offset)
 
-cpdef unpack_primitive(char ifmt, object buf, int offset):
+cdef inline object _unpack_primitive(char ifmt, object buf, long offset,
+                                     bint check):
     cdef char* cbuf
     cdef void* valueaddr
     cdef uint64_t uint64_value
@@ -38,46 +93,100 @@ cpdef unpack_primitive(char ifmt, object buf, int offset):
     cbuf = as_cbuf(buf, &length)
     valueaddr = cbuf + offset
     if ifmt == 'q':
-        checkbound(8, length, offset)
+        if check: checkbound(8, length, offset)
         return (<int64_t*>valueaddr)[0]
     elif ifmt == 'Q':
         # if the value is small enough, it returns a python int. Else, a
         # python long
-        checkbound(8, length, offset)
+        if check: checkbound(8, length, offset)
         uint64_value = (<uint64_t*>valueaddr)[0]
         if uint64_value <= INT64_MAX:
             return <int64_t>uint64_value
         else:
             return uint64_value
     elif ifmt == 'd':
-        checkbound(8, length, offset)
+        if check: checkbound(8, length, offset)
         return (<double*>valueaddr)[0]
     elif ifmt == 'f':
-        checkbound(4, length, offset)
+        if check: checkbound(4, length, offset)
         return (<float*>valueaddr)[0]
     elif ifmt == 'i':
-        checkbound(4, length, offset)
+        if check: checkbound(4, length, offset)
         return (<int32_t*>valueaddr)[0]
     elif ifmt == 'I':
-        checkbound(4, length, offset)
+        if check: checkbound(4, length, offset)
         return (<uint32_t*>valueaddr)[0]
     elif ifmt == 'h':
-        checkbound(2, length, offset)
+        if check: checkbound(2, length, offset)
         return (<int16_t*>valueaddr)[0]
     elif ifmt == 'H':
-        checkbound(2, length, offset)
+        if check: checkbound(2, length, offset)
         return (<uint16_t*>valueaddr)[0]
     elif ifmt == 'b':
-        checkbound(1, length, offset)
+        if check: checkbound(1, length, offset)
         return (<int8_t*>valueaddr)[0]
     elif ifmt == 'B':
-        checkbound(1, length, offset)
+        if check: checkbound(1, length, offset)
         return (<uint8_t*>valueaddr)[0]
     #
     raise ValueError('unknown fmt %s' % chr(ifmt))
 
+cpdef unpack_primitive(char ifmt, object buf, long offset):
+    return _unpack_primitive(ifmt, buf, offset, True)
+
+cpdef unpack_primitive_unchecked(char ifmt, object buf, long offset):
+    # the caller MUST guarantee that the value is inside the buffer, e.g.
+    # because the message has been validated
+    return _unpack_primitive(ifmt, buf, offset, False)
+
 
-cpdef long unpack_int64(object buf, int offset):
+cpdef pack_primitive(char ifmt, object buf, long offset, object value):
+    cdef char* cbuf
+    cdef void* valueaddr
+    cdef double double_value
+    cdef Py_ssize_t length = 0
+    cbuf = as_writable_cbuf(buf, &length)
+    valueaddr = cbuf + offset
+    if ifmt == 'q':
+        checkbound(8, length, offset)
+        (<int64_t*>valueaddr)[0] = value
+    elif ifmt == 'Q':
+        checkbound(8, length, offset)
+        (<uint64_t*>valueaddr)[0] = value
+    elif ifmt == 'd':
+        checkbound(8, length, offset)
+        (<double*>valueaddr)[0] = value
+    elif ifmt == 'f':
+        checkbound(4, length, offset)
+        double_value = value
+        if (isfinite(double_value) and
+            not -FLT_MAX <= double_value <= FLT_MAX):
+            # a C cast would silently store inf: raise like struct.pack
+            raise OverflowError('float too large to pack with f format')
+        (<float*>valueaddr)[0] = double_value
+    elif ifmt == 'i':
+        checkbound(4, length, offset)
+        (<int32_t*>valueaddr)[0] = value
+    elif ifmt == 'I':
+        checkbound(4, length, offset)
+        (<uint32_t*>valueaddr)[0] = value
+    elif ifmt == 'h':
+        checkbound(2, length, offset)
+        (<int16_t*>valueaddr)[0] = value
+    elif ifmt == 'H':
+        checkbound(2, length, offset)
+        (<uint16_t*>valueaddr)[0] = value
+    elif ifmt == 'b':
+        checkbound(1, length, offset)
+        (<int8_t*>valueaddr)[0] = value
+    elif ifmt == 'B':
+        checkbound(1, length, offset)
+        (<uint8_t*>valueaddr)[0] = value
+    else:
+        raise ValueError('unknown fmt %s' % chr(ifmt))
+
+
+cpdef long unpack_int64(object buf, long offset):
     cdef char* cbuf
     cdef void* valueaddr
     cdef Py_ssize_t length = 0
@@ -86,7 +195,7 @@ cpdef long unpack_int64(object buf, int offset):
     checkbound(8, length, offset)
     return (<int64_t*>valueaddr)[0]
 
-cpdef long unpack_int16(object buf, int offset):
+cpdef long unpack_int16(object buf, long offset):
     cdef char* cbuf
     cdef void* valueaddr
     cdef Py_ssize_t length = 0
@@ -95,7 +204,19 @@ cpdef long unpack_int16(object buf, int offset):
     checkbound(2, length, offset)
     return (<int16_t*>valueaddr)[0]
 
-cpdef long unpack_uint32(object buf, int offset):
+cpdef long unpack_int64_unchecked(object buf, long offset):
+    cdef char* cbuf
+    cdef Py_ssize_t length = 0
+    cbuf = as_cbuf(buf, &length)
+    return (<int64_t*>(cbuf+offset))[0]
+
+cpdef long unpack_int16_unchecked(object buf, long offset):
+    cdef char* cbuf
+    cdef Py_ssize_t length = 0
+    cbuf = as_cbuf(buf, &length)
+    return (<int16_t*>(cbuf+offset))[0]
+
+cpdef long unpack_uint32(object buf, long offset):
     cdef char* cbuf
     cdef void* valueaddr
     cdef Py_ssize_t length = 0
@@ -114,3 +235,80 @@ cpdef bytes pack_message_header(int segment_count, int segment_size, long p):
     (<int32_t*>(cbuf+4))[0] = segment_size
     (<int64_t*>(cbuf+8))[0] = p
     return buf
+
+cpdef bytes pack_message(long p, object buf, long start, long end):
+    # header, body and padding are written directly into the final string,
+    # so that the body is copied only once
+    cdef bytes msg
+    cdef char* cmsg
+    cdef char* cbuf
+    cdef Py_ssize_t length = 0
+    cdef long size, padding
+    cbuf = as_cbuf(buf, &length)
+    if start < 0 or end > length or start > end:
+        raise IndexError('Range out of bounds: %d-%d' % (start, end))
+    size = end - start
+    padding = (8 - size % 8) % 8
+    msg = PyString_FromStringAndSize(NULL, 16 + size + padding)
+    cmsg = PyString_AS_STRING(msg)
+    (<int32_t*>(cmsg+0))[0] = 0
+    (<int32_t*>(cmsg+4))[0] = (size + padding) / 8 + 1 # +1 is for the ptr
+    (<int64_t*>(cmsg+8))[0] = p
+    memcpy(cmsg+16, cbuf+start, size)
+    memset(cmsg+16+size, 0, padding)
+    return msg
+
+cpdef bytes pack_struct(object buf, long start, long data_size, long ptrs_size,
+                        long ptrs_delta, long extra_start, long extra_end):
+    # the final size is known in advance: body and extra are copied directly
+    # into the result, and the pointers are patched in place
+    cdef bytes out
+    cdef char* cout
+    cdef char* cbuf
+    cdef Py_ssize_t length = 0
+    cdef long body_length, extra_length, i, p
+    cdef int64_t* ptrs
+    cbuf = as_cbuf(buf, &length)
+    body_length = (data_size + ptrs_size) * 8
+    if start < 0 or start + body_length > length:
+        raise IndexError('Range out of bounds: %d-%d' % (start, start+body_length))
+    if extra_start < 0 or extra_end > length or extra_start > extra_end:
+        raise IndexError('Range out of bounds: %d-%d' % (extra_start, extra_end))
+    extra_length = extra_end - extra_start
+    if (start == 0 and ptrs_delta == 0 and
+        extra_start == body_length and extra_end == length and
+        PyString_CheckExact(buf)):
+        # already compact, nothing to do
+        return buf
+    out = PyString_FromStringAndSize(NULL, body_length + extra_length)
+    cout = PyString_AS_STRING(out)
+    memcpy(cout, cbuf+start, body_length)
+    ptrs = <int64_t*>(cout + data_size*8)
+    for i in range(ptrs_size):
+        p = ptrs[i]
+        if p != 0:
+            if ptr.kind(p) == ptr.FAR:
+                raise ValueError('Unexpected far pointer')
+            ptrs[i] = ptr.new_generic(ptr.kind(p), ptr.offset(p)+ptrs_delta,
+                                      ptr.extra(p))
+    memcpy(cout+body_length, cbuf+extra_start, extra_length)
+    return out
+
+cpdef bytes unpack_bytes(object buf, long start, long end):
+    cdef char* cbuf
+    cdef Py_ssize_t length = 0
+    cbuf = as_cbuf(buf, &length)
+    # same semantics as slicing, including negative indices
+    if start < 0:
+        start += length
+        if start < 0:
+            start = 0
+    if end < 0:
+        end += length
+    if end > length:
+        end = length
+    if start >= end:
+        return b''
+    if start == 0 and end == length and PyString_CheckExact(buf):
+        return buf
+    return PyString_FromStringAndSize(cbuf+start, end-start)
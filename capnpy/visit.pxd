@@ -5,6 +5,10 @@ from capnpy.blob cimport CapnpBuffer
 cpdef long end_of(CapnpBuffer buf, long p, long offset) except -2
 cpdef long is_compact(CapnpBuffer buf, long p, long offset) except -2
 
+@cython.locals(validator=Validator)
+cpdef long validate(CapnpBuffer buf, long p, long offset,
+                    long traversal_limit, long nesting_limit) except -2
+
 cdef class Visitor(object):
 
     cdef long visit(self, CapnpBuffer buf, long p, long offset) except -2
@@ -57,6 +61,37 @@ cdef class IsCompact(Visitor):
 
 
 
+cdef class Validator(Visitor):
+    cdef long words_left
+    cdef long depth_left
+
+    @cython.locals(kind=long)
+    cdef long visit(self, CapnpBuffer buf, long p, long offset) except -2
+
+    cdef long check_range(self, CapnpBuffer buf, long start, long length,
+                          long words) except -2
+
+    @cython.locals(i=long, p2_offset=long, p2=long)
+    cdef long visit_ptrs(self, CapnpBuffer buf, long offset, long ptrs_size) except -2
+
+    @cython.locals(words=long)
+    cdef long visit_struct(self, CapnpBuffer buf, long p, long offset,
+                           long data_size, long ptrs_size) except -2
+
+    @cython.locals(tag=long, item_size=long, item_offset=long, i=long)
+    cdef long visit_list_composite(self, CapnpBuffer buf, long p, long offset,
+                                   long count, long data_size, long ptrs_size) except -2
+
+    cdef long visit_list_ptr(self, CapnpBuffer buf, long p, long offset,
+                             long count) except -2
+
+    @cython.locals(length=long)
+    cdef long visit_list_primitive(self, CapnpBuffer buf, long p, long offset,
+                                   long item_size, long count) except -2
+
+    cdef long visit_list_bit(self, CapnpBuffer buf, long p, long offset,
+                             long count) except -2
+
 
 cpdef EndOf _end_of
 cpdef IsCompact _is_compact
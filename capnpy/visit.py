@@ -1,3 +1,4 @@
+import struct
 from capnpy import ptr
 
 class Visitor(object):
@@ -7,6 +8,9 @@ class Visitor(object):
 
     def visit(self, buf, p, offset):
         kind = ptr.kind(p)
+        if kind == ptr.FAR:
+            offset, p = buf.read_far_ptr(offset)
+            kind = ptr.kind(p)
         offset = ptr.deref(p, offset)
         if kind == ptr.STRUCT:
             data_size = ptr.struct_data_size(p)
@@ -28,8 +32,6 @@ class Visitor(object):
                 return self.visit_list_bit(buf, p, offset, count)
             else:
                 return self.visit_list_primitive(buf, p, offset, item_size, count)
-        elif kind == ptr.FAR:
-            raise NotImplementedError('Far pointer not supported')
         else:
             assert False, 'unknown ptr kind'
 
@@ -167,11 +169,193 @@ class IsCompact(Visitor):
         return start_of_children == -1 or start_of_children == end_of_items
 
 
+class Validator(Visitor):
+    """
+    Check that the object pointed by p and all its children are entirely
+    contained in the buffer, raising ValueError otherwise. Contrarily to the
+    other visitors, this does NOT assume that the buffer is in pre-order.
+
+    Like the C++ implementation, we also enforce a limit on the total number
+    of words traversed and on the nesting depth, to protect against
+    malicious messages which point many times to the same data or which are
+    deeply recursive.
+    """
+
+    def __init__(self, traversal_limit, nesting_limit):
+        self.words_left = traversal_limit
+        self.depth_left = nesting_limit
+
+    def visit(self, buf, p, offset):
+        kind = ptr.kind(p)
+        if kind == ptr.FAR:
+            offset, p = buf.read_far_ptr(offset)
+            kind = ptr.kind(p)
+            if kind == ptr.FAR:
+                raise ValueError('Invalid message: unexpected far pointer in '
+                                 'the landing pad at offset %d' % offset)
+        if kind != ptr.STRUCT and kind != ptr.LIST:
+            # capabilities and other pointers do not point to anything
+            # inside the message
+            return 0
+        if self.depth_left <= 0:
+            raise ValueError('Invalid message: exceeded the nesting limit')
+        self.depth_left -= 1
+        Visitor.visit(self, buf, p, offset)
+        self.depth_left += 1
+        return 0
+
+    def check_range(self, buf, start, length, words):
+        """
+        Check that buf[start:start+length] is inside the buffer, and charge
+        ``words`` against the traversal limit
+        """
+        if start < 0 or start + length > len(buf.s):
+            raise ValueError('Invalid message: object out of bounds at '
+                             'offset %d' % start)
+        self.words_left -= words
+        if self.words_left < 0:
+            raise ValueError('Invalid message: exceeded the traversal limit')
+        return 0
+
+    def visit_ptrs(self, buf, offset, ptrs_size):
+        i = 0
+        while i < ptrs_size:
+            p2_offset = offset + i*8
+            p2 = buf.read_raw_ptr(p2_offset)
+            if p2:
+                self.visit(buf, p2, p2_offset)
+            i += 1
+        return 0
+
+    def visit_struct(self, buf, p, offset, data_size, ptrs_size):
+        words = data_size + ptrs_size
+        self.check_range(buf, offset, words*8, words)
+        return self.visit_ptrs(buf, offset + data_size*8, ptrs_size)
+
+    def visit_list_composite(self, buf, p, offset, count, data_size, ptrs_size):
+        # the tag has already been read by visit(), so it is in bounds
+        tag = buf.read_raw_ptr(offset)
+        item_size = data_size + ptrs_size
+        if (ptr.kind(tag) != ptr.STRUCT or count < 0 or
+            count * item_size > ptr.list_item_count(p)):
+            raise ValueError('Invalid message: wrong tag for the composite '
+                             'list at offset %d' % offset)
+        # lists of empty structs are charged one word per item, as they
+        # could be used to amplify the traversal time
+        self.check_range(buf, offset, (count * item_size + 1) * 8,
+                         max(count * item_size, count) + 1)
+        if ptrs_size:
+            offset += 8
+            i = 0
+            while i < count:
+                item_offset = offset + item_size*8*i + data_size*8
+                self.visit_ptrs(buf, item_offset, ptrs_size)
+                i += 1
+        return 0
+
+    def visit_list_ptr(self, buf, p, offset, count):
+        self.check_range(buf, offset, count*8, count)
+        return self.visit_ptrs(buf, offset, count)
+
+    def visit_list_primitive(self, buf, p, offset, item_size, count):
+        if item_size == ptr.LIST_SIZE_VOID:
+            # charge one word per item, like empty structs
+            return self.check_range(buf, offset, 0, count)
+        length = ptr.LIST_SIZE_LENGTH[item_size] * count
+        return self.check_range(buf, offset, length, (length + 7) / 8)
+
+    def visit_list_bit(self, buf, p, offset, count):
+        length = (count + 7) / 8
+        return self.check_range(buf, offset, length, (length + 7) / 8)
+
+
+def copy_pointer(buf, p, offset, out, out_offset):
+    """
+    Copy the object pointed by p, which is at the given offset in buf, and
+    all its children, appending them to the bytearray ``out`` in pre-order.
+    Return the new pointer to the copy, assuming that it will be stored at
+    ``out_offset``.
+
+    Far pointers are followed, so that the copy never contains any: this is
+    how we compact multi-segment messages.
+    """
+    if p == 0:
+        return 0
+    kind = ptr.kind(p)
+    if kind == ptr.FAR:
+        offset, p = buf.read_far_ptr(offset)
+        kind = ptr.kind(p)
+    start = ptr.deref(p, offset)
+    new_start = len(out)
+    new_offset = (new_start - out_offset - 8) / 8 # in words
+    if kind == ptr.STRUCT:
+        data_size = ptr.struct_data_size(p)
+        ptrs_size = ptr.struct_ptrs_size(p)
+        out += buf.read_view(start, start + (data_size+ptrs_size)*8)
+        _copy_ptrs(buf, start + data_size*8, ptrs_size,
+                   out, new_start + data_size*8)
+        return ptr.new_struct(new_offset, data_size, ptrs_size)
+    elif kind == ptr.LIST:
+        size_tag = ptr.list_size_tag(p)
+        count = ptr.list_item_count(p)
+        if size_tag == ptr.LIST_SIZE_COMPOSITE:
+            tag = buf.read_raw_ptr(start)
+            data_size = ptr.struct_data_size(tag)
+            ptrs_size = ptr.struct_ptrs_size(tag)
+            item_length = (data_size+ptrs_size)*8
+            n = ptr.offset(tag)
+            out += buf.read_view(start, start + 8 + item_length*n)
+            if ptrs_size:
+                for i in range(n):
+                    item_ptrs = 8 + item_length*i + data_size*8
+                    _copy_ptrs(buf, start + item_ptrs, ptrs_size,
+                               out, new_start + item_ptrs)
+        elif size_tag == ptr.LIST_SIZE_PTR:
+            out += buf.read_view(start, start + count*8)
+            _copy_ptrs(buf, start, count, out, new_start)
+        else:
+            if size_tag == ptr.LIST_SIZE_VOID:
+                length = 0
+            elif size_tag == ptr.LIST_SIZE_BIT:
+                length = (count + 7) / 8
+            else:
+                length = ptr.LIST_SIZE_LENGTH[size_tag] * count
+            out += buf.read_view(start, start + length)
+            padding = (8 - length % 8) % 8
+            out += b'\x00' * padding
+        return ptr.new_list(new_offset, size_tag, count)
+    else:
+        # capabilities: nothing to copy
+        return p
+
+def _copy_ptrs(buf, offset, ptrs_size, out, out_offset):
+    # copy the children of the ptrs_size pointers at offset, and overwrite
+    # the corresponding pointers in out
+    for i in range(ptrs_size):
+        p = buf.read_raw_ptr(offset + i*8)
+        p = copy_pointer(buf, p, offset + i*8, out, out_offset + i*8)
+        struct.pack_into('<q', out, out_offset + i*8, p)
+
+
 def end_of(buf, p, offset):
     return _end_of.visit(buf, p, offset)
 
 def is_compact(buf, p, offset):
     return _is_compact.visit(buf, p, offset)
 
+def validate(buf, p, offset, traversal_limit, nesting_limit):
+    """
+    Check that the object pointed by p is well formed: see Validator. The
+    limits are expressed in words and levels, respectively.
+    """
+    validator = Validator(traversal_limit, nesting_limit)
+    try:
+        validator.visit(buf, p, offset)
+    except IndexError:
+        # e.g. a far pointer to a non-existent segment, or a list tag which
+        # is out of bounds
+        raise ValueError('Invalid message: pointer out of bounds')
+    return 0
+
 _end_of = EndOf()
 _is_compact = IsCompact()
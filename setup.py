@@ -31,8 +31,10 @@ def get_cython_extensions():
              "capnpy/message.py",
              "capnpy/buffered.py",
              "capnpy/filelike.py",
+             "capnpy/columnar.py",
              "capnpy/ptr.pyx",
              "capnpy/unpack.pyx",
+             "capnpy/packing.pyx",
              "capnpy/_hash.pyx",
              "capnpy/_util.pyx",
     ]